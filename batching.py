@@ -0,0 +1,92 @@
+import time
+import asyncio
+from collections import deque
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests for one blocking batch function `fn(items) -> results`
+    and runs them as a single call. A batch is closed after `window_ms` from its first
+    request or once it holds `max_batch` items, whichever comes first. A request may
+    carry several items (e.g. all (query, chunk) pairs of one turn); it gets back
+    exactly its own slice of the results. Up to `concurrency` batches run at once.
+    """
+    def __init__(self, fn, max_batch=64, window_ms=5.0, executor=None, concurrency=1, name="batch"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.executor = executor
+        self.name = name
+        self.pending = deque()  # (items, future, enqueued_at)
+        self.pending_items = 0
+        self.slots = asyncio.Semaphore(concurrency)
+        self.wakeup = asyncio.Event()
+        self._collector = None
+        self.counters = {"requests": 0, "items": 0, "batches": 0, "errors": 0, "wait_ms": 0.0, "run_ms": 0.0}
+        self.sizes = {}  # batch size -> count
+
+    async def submit(self, items):
+        items = list(items)
+        if not items: return []
+        fut = asyncio.get_running_loop().create_future()
+        self.pending.append((items, fut, time.perf_counter()))
+        self.pending_items += len(items)
+        self.counters["requests"] += 1
+        self.wakeup.set()
+        if self._collector is None or self._collector.done():
+            self._collector = asyncio.create_task(self._collect())
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            await self.slots.acquire()
+            deadline = loop.time() + self.window
+            while self.pending_items < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0: break
+                self.wakeup.clear()
+                try: await asyncio.wait_for(self.wakeup.wait(), remaining)
+                except asyncio.TimeoutError: break
+
+            # Whole requests only; a single oversized request still goes out on its own
+            batch, size = [], 0
+            while self.pending and (not batch or size + len(self.pending[0][0]) <= self.max_batch):
+                request = self.pending.popleft()
+                batch.append(request)
+                size += len(request[0])
+            self.pending_items -= size
+            asyncio.create_task(self._run(batch))
+
+    async def _run(self, batch):
+        try:
+            items = [item for request_items, _, _ in batch for item in request_items]
+            start = time.perf_counter()
+            self.counters["wait_ms"] += sum((start - t) * 1000 for _, _, t in batch)
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(self.executor, self.fn, items)
+            except Exception as e:
+                self.counters["errors"] += 1
+                for _, fut, _ in batch:
+                    if not fut.done(): fut.set_exception(e)
+                return
+            self.counters["run_ms"] += (time.perf_counter() - start) * 1000
+            self.counters["batches"] += 1
+            self.counters["items"] += len(items)
+            self.sizes[len(items)] = self.sizes.get(len(items), 0) + 1
+            offset = 0
+            for request_items, fut, _ in batch:
+                if not fut.done(): fut.set_result(list(results[offset:offset + len(request_items)]))
+                offset += len(request_items)
+        finally:
+            self.slots.release()
+
+    def stats(self):
+        c = self.counters
+        return {
+            "name": self.name, "max_batch": self.max_batch, "window_ms": self.window * 1000,
+            "requests": c["requests"], "items": c["items"], "batches": c["batches"], "errors": c["errors"],
+            "mean_batch": round(c["items"] / c["batches"], 2) if c["batches"] else 0.0,
+            "mean_wait_ms": round(c["wait_ms"] / c["requests"], 2) if c["requests"] else 0.0,
+            "mean_run_ms": round(c["run_ms"] / c["batches"], 2) if c["batches"] else 0.0,
+            "queued": self.pending_items, "batch_sizes": dict(sorted(self.sizes.items())),
+        }
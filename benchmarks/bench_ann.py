@@ -0,0 +1,90 @@
+"""
+ANN vs exact scan on video_embeddings-shaped data.
+
+For each corpus size the script fills a scratch table (ann_bench) with random
+384-d vectors spread over many "videos", builds the index configured through the
+same env vars as database.py (ANN_INDEX, HNSW_*, IVFFLAT_*), then runs per-video
+top-10 queries with the index and with index scans disabled (exact), reporting
+recall@10 and p50/p95 latency.
+
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_ann.py --sizes 100000 1000000 3000000
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+import database
+from database import engine, ann_index_ddl
+
+def pct(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+def vec_literal(vec):
+    return "[" + ",".join(f"{x:.5f}" for x in vec) + "]"
+
+async def fill(conn, size, videos):
+    await conn.execute(text("DROP TABLE IF EXISTS ann_bench"))
+    await conn.execute(text("CREATE TABLE ann_bench (id bigserial PRIMARY KEY, video_id text, embedding vector(384))"))
+    await conn.execute(text(f"""
+        INSERT INTO ann_bench (video_id, embedding)
+        SELECT 'v' || (i % {videos}), (SELECT array_agg(random() - 0.5) FROM generate_series(1, 384) WHERE i > 0)::vector
+        FROM generate_series(1, {size}) AS i
+    """))
+    await conn.execute(text("CREATE INDEX ON ann_bench (video_id)"))
+    name, ddl = ann_index_ddl()
+    if ddl:
+        start = time.perf_counter()
+        await conn.execute(text(f"CREATE INDEX IF NOT EXISTS bench_{name} {ddl.replace('video_embeddings', 'ann_bench')}"))
+        print(f"  index build: {time.perf_counter() - start:.1f}s")
+    await conn.execute(text("ANALYZE ann_bench"))
+
+async def top10(conn, video_id, vec, exact):
+    await conn.execute(text("SET LOCAL enable_indexscan = " + ("off" if exact else "on")))
+    if database.ANN_INDEX == "hnsw":
+        await conn.execute(text(f"SET LOCAL hnsw.ef_search = {database.HNSW_EF_SEARCH}"))
+        if database.ANN_ITERATIVE_SCAN != "off" and database.PGVECTOR_VERSION >= (0, 8, 0):
+            await conn.execute(text(f"SET LOCAL hnsw.iterative_scan = {database.ANN_ITERATIVE_SCAN}"))
+            await conn.execute(text(f"SET LOCAL hnsw.max_scan_tuples = {database.HNSW_MAX_SCAN_TUPLES}"))
+    elif database.ANN_INDEX == "ivfflat":
+        await conn.execute(text(f"SET LOCAL ivfflat.probes = {database.IVFFLAT_PROBES}"))
+    start = time.perf_counter()
+    rows = (await conn.execute(text(
+        "SELECT id FROM ann_bench WHERE video_id = :v ORDER BY embedding <=> CAST(:q AS vector) LIMIT 10"
+    ), {"v": video_id, "q": vec})).scalars().all()
+    return set(rows), time.perf_counter() - start
+
+async def run(sizes, videos, queries):
+    rng = random.Random(0)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await database.load_pgvector_version(conn)
+    print(f"ANN_INDEX={database.ANN_INDEX}  pgvector={'.'.join(map(str, database.PGVECTOR_VERSION))}")
+    print("      size | recall@10 | ann p50 | ann p95 | exact p50 | exact p95")
+    for size in sizes:
+        async with engine.begin() as conn: await fill(conn, size, videos)
+        recalls, ann_lat, exact_lat = [], [], []
+        for _ in range(queries):
+            video_id = f"v{rng.randrange(videos)}"
+            vec = vec_literal([rng.random() - 0.5 for _ in range(384)])
+            async with engine.begin() as conn: truth, t_exact = await top10(conn, video_id, vec, exact=True)
+            async with engine.begin() as conn: found, t_ann = await top10(conn, video_id, vec, exact=False)
+            recalls.append(len(truth & found) / max(1, len(truth)))
+            ann_lat.append(t_ann * 1000); exact_lat.append(t_exact * 1000)
+        print(f"{size:>10} | {sum(recalls) / len(recalls):9.3f} | {pct(ann_lat, 50):5.1f}ms | {pct(ann_lat, 95):5.1f}ms | "
+              f"{pct(exact_lat, 50):7.1f}ms | {pct(exact_lat, 95):7.1f}ms")
+    async with engine.begin() as conn: await conn.execute(text("DROP TABLE IF EXISTS ann_bench"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--videos", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.videos, args.queries))
@@ -0,0 +1,61 @@
+"""
+Throughput of the inference engines (torch vs ONNX Runtime vs int8 ONNX) on the two
+hot paths: chunk embedding during ingestion and query-time reranking.
+
+    python benchmarks/bench_backends.py [--engines torch onnx onnx-int8] [--chunks 512] [--queries 50]
+
+Thread count follows the container CPU quota unless INFERENCE_THREADS is set.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import LocalModels, make_batches, cpu_quota, rss_mb, EMBED_BATCH_SIZE
+
+VOCAB = ("the function returns a value when we call it with the list of arguments and "
+         "then the loop iterates over every element so the gradient descent step updates "
+         "weights using the learning rate while the model keeps training on the batch").split()
+
+def text(rng, words):
+    return " ".join(rng.choice(VOCAB) for _ in range(words))
+
+def bench(engine, chunks, queries, candidates):
+    models = LocalModels(engine=engine)
+    models.load()
+    models.embed_documents(chunks[:8])  # warm-up
+    models.predict([[queries[0], chunks[0]]])
+
+    start = time.perf_counter()
+    for batch in make_batches(chunks, EMBED_BATCH_SIZE): models.embed_documents(batch)
+    embed_s = time.perf_counter() - start
+
+    rng = random.Random(3)
+    start = time.perf_counter()
+    for q in queries: models.predict([[q, c] for c in rng.sample(chunks, candidates)])
+    rerank_s = time.perf_counter() - start
+    return len(chunks) / embed_s, len(queries) / rerank_s, sum(models.load_ms.values()), models.threads
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--candidates", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    chunks = [text(rng, 170) for _ in range(args.chunks)]   # ~1000 characters, like CHUNK_SIZE
+    queries = [text(rng, 8) for _ in range(args.queries)]
+
+    print(f"CPU quota: {cpu_quota():g}")
+    baseline = None
+    for engine in args.engines:
+        chunks_s, rerank_s, load_ms, threads = bench(engine, chunks, queries, args.candidates)
+        baseline = baseline or (chunks_s, rerank_s)
+        print(f"{engine:<10} threads {threads:<3} load {load_ms / 1000:5.1f}s  embed {chunks_s:8.1f} chunks/s "
+              f"({chunks_s / baseline[0]:.2f}x)  rerank {rerank_s:7.1f} queries/s ({rerank_s / baseline[1]:.2f}x)  "
+              f"RSS {rss_mb():.0f} MB")
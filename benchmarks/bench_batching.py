@@ -0,0 +1,91 @@
+"""
+Throughput vs latency of query-time inference with and without micro-batching.
+
+Each simulated turn does what a /ws/chat turn does on the model side: one
+embed_query and one rerank of --pairs (query, chunk) pairs. Texts are unique per
+turn so the memo never short-circuits the models. For every concurrency level the
+script runs closed-loop clients for --seconds and prints turns/sec and p50/p95/p99.
+
+    python benchmarks/bench_batching.py [--concurrency 1 2 4 8 16 32 64] [--seconds 10]
+        [--window-ms 1 3 5] [--csv curves.csv]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inference
+from batching import MicroBatcher
+from inference import embed_query, rerank, warm_up
+
+WORDS = ("gradient descent learning rate loss function neural network layer activation "
+         "python decorator closure generator iterator recursion stack queue graph").split()
+
+def sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))]
+
+async def turn(rng, ids, pairs):
+    query = f"{sentence(rng, 8)} {next(ids)}"
+    await embed_query(query)
+    await rerank(query, [(next(ids), sentence(rng, 150)) for _ in range(pairs)])
+
+async def run_level(concurrency, seconds, pairs):
+    rng, ids = random.Random(concurrency), itertools.count()
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await turn(rng, ids, pairs)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)
+
+def configure(window_ms):
+    """window_ms=None disables batching (one forward pass per call, the old path)."""
+    inference.INFERENCE_BATCHING = window_ms is not None
+    if window_ms is None: return
+    inference.embed_batcher = MicroBatcher(inference.models.embed_documents, inference.EMBED_MAX_BATCH, window_ms,
+                                           executor=inference.inference_pool, concurrency=inference.INFERENCE_CONCURRENCY, name="embed")
+    inference.rerank_batcher = MicroBatcher(inference.models.predict, inference.RERANK_MAX_BATCH, window_ms,
+                                            executor=inference.inference_pool, concurrency=inference.INFERENCE_CONCURRENCY, name="rerank")
+
+async def main(args):
+    await warm_up()
+    rows = []
+    for window_ms in [None] + args.window_ms:
+        label = "off" if window_ms is None else f"{window_ms:g}ms"
+        for c in args.concurrency:
+            configure(window_ms)  # fresh batchers so the batch-size stats are per level
+            tput, p50, p95, p99 = await run_level(c, args.seconds, args.pairs)
+            rows.append((label, c, tput, p50, p95, p99))
+            mean_batch = inference.rerank_batcher.stats()["mean_batch"] if window_ms is not None else 1
+            print(f"batching={label:<6} clients={c:<4} {tput:8.1f} turns/s  p50 {p50:7.1f}ms  p95 {p95:7.1f}ms  "
+                  f"p99 {p99:7.1f}ms  rerank batch {mean_batch}")
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write("batching,concurrency,turns_per_sec,p50_ms,p95_ms,p99_ms\n")
+            for row in rows: f.write(",".join(str(round(v, 2)) if isinstance(v, float) else str(v) for v in row) + "\n")
+        print(f"curves written to {args.csv}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--pairs", type=int, default=10)  # RETRIEVAL_CANDIDATES
+    parser.add_argument("--window-ms", type=float, nargs="+", default=[inference.BATCH_WINDOW_MS])
+    parser.add_argument("--csv")
+    asyncio.run(main(parser.parse_args()))
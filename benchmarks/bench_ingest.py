@@ -0,0 +1,64 @@
+"""
+Ingestion benchmark: per-chunk embed_query loop vs batched embed_documents.
+
+Builds a synthetic ~3 hour lecture transcript as caption segments (150 words/min,
+a few seconds each), chunks it with ingestion.chunk_segments like /api/process
+does and reports chunks/sec for both paths.
+
+    python benchmarks/bench_ingest.py [--hours 3] [--batch-size 64]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import models, embed_in_batches
+from ingestion import chunk_segments
+
+VOCAB = ("the function returns a value when we call it with the list of arguments and "
+         "then the loop iterates over every element so the gradient descent step updates "
+         "weights using the learning rate while the model keeps training on the batch").split()
+
+def synthetic_segments(hours, wpm=150, seed=7):
+    """Caption segments shaped like youtube-transcript-api output: 6-14 words each."""
+    rng = random.Random(seed)
+    segments, start, words = [], 0.0, int(hours * 60 * wpm)
+    while words > 0:
+        n = min(words, rng.randint(6, 14))
+        duration = n * 60 / wpm
+        segments.append({"text": " ".join(rng.choice(VOCAB) for _ in range(n)), "start": round(start, 2), "duration": round(duration, 2)})
+        start, words = start + duration, words - n
+    return segments
+
+def run_sequential(embedder, chunks):
+    start = time.perf_counter()
+    for chunk in chunks: embedder.embed_query(chunk)
+    return time.perf_counter() - start
+
+def run_batched(embedder, chunks, batch_size):
+    start = time.perf_counter()
+    asyncio.run(embed_in_batches(embedder, chunks, batch_size))
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=3.0)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    segments = synthetic_segments(args.hours)
+    chunks = [chunk["content"] for chunk in chunk_segments(segments)]
+    embedder = models
+    embedder.embed_query("warm up")
+
+    words = sum(len(seg["text"].split()) for seg in segments)
+    print(f"Transcript: {words} words in {len(segments)} segments -> {len(chunks)} chunks")
+    before = run_sequential(embedder, chunks)
+    print(f"before (embed_query loop):     {len(chunks) / before:8.1f} chunks/sec  ({before:.2f}s)")
+    after = run_batched(embedder, chunks, args.batch_size)
+    print(f"after  (batched, size={args.batch_size:<4}):  {len(chunks) / after:8.1f} chunks/sec  ({after:.2f}s)")
+    print(f"speedup: {before / after:.2f}x")
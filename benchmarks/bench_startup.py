@@ -0,0 +1,75 @@
+"""
+Cold-start benchmark: N worker processes each import the inference layer and warm
+up, once with in-process models (MODEL_BACKEND=local) and once against a shared
+model server (MODEL_BACKEND=remote). Reports time-to-ready and RSS per worker.
+
+    python benchmarks/bench_startup.py [--workers 4] [--port 8100]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = """
+import time, json, asyncio
+start = time.perf_counter()
+import inference
+asyncio.run(inference.warm_up())
+stats = inference.runtime_stats()
+stats["cold_start_s"] = round(time.perf_counter() - start, 2)
+print(json.dumps(stats))
+"""
+
+def run_workers(n, env):
+    procs = [subprocess.Popen([sys.executable, "-c", WORKER], cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+             for _ in range(n)]
+    results = []
+    for p in procs:
+        out, _ = p.communicate()
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+def wait_ready(url, timeout=300):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            with urllib.request.urlopen(f"{url}/ready") as r:
+                if r.status == 200: return time.time() - start
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("model server never became ready")
+
+def report(label, results, extra_rss=0.0):
+    cold = [r["cold_start_s"] for r in results]
+    rss = [r["rss_mb"] for r in results]
+    print(f"{label:<8} cold start p50 {statistics.median(cold):6.2f}s  max {max(cold):6.2f}s  "
+          f"RSS/worker {statistics.mean(rss):7.1f} MB  total {sum(rss) + extra_rss:8.1f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    local = run_workers(args.workers, {**os.environ, "MODEL_BACKEND": "local"})
+    report("local", local)
+
+    url = f"http://localhost:{args.port}"
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "model_server:app", "--port", str(args.port)],
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        server_ready = wait_ready(url)
+        remote = run_workers(args.workers, {**os.environ, "MODEL_BACKEND": "remote", "MODEL_SERVER_URL": url})
+        with urllib.request.urlopen(f"{url}/stats") as r: server_stats = json.load(r)
+        print(f"server   ready after {server_ready:6.2f}s  RSS {server_stats['rss_mb']:7.1f} MB")
+        report("remote", remote, extra_rss=server_stats["rss_mb"])
+    finally:
+        server.terminate()
+        server.wait()
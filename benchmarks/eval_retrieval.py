@@ -0,0 +1,91 @@
+"""
+Offline retrieval evaluation: vector vs lexical vs hybrid (RRF) candidates, then rerank.
+
+For every labeled question the script fetches candidates in each mode from the
+ingested video_embeddings rows, reranks them as /ws/chat does, and reports
+candidate recall@k, final recall@RETRIEVAL_TOP_N, MRR and p50/p95 latency per mode.
+
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/eval_retrieval.py --questions questions.jsonl
+
+questions.jsonl, one per line:
+    {"video_id": "dQw4w9WgXcQ", "question": "what does lru_cache do?", "timestamp": 312}
+    {"video_id": "dQw4w9WgXcQ", "question": "which flag enables JIT", "contains": "--jit"}
+A chunk is relevant if its [start_time, end_time] covers `timestamp` (seconds)
+or its text contains `contains` (case-insensitive); either label is enough.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import AsyncSessionLocal
+from inference import embed_query, rerank, warm_up
+from retrieval import postgres_candidates, lexical_candidates, hybrid_candidates, RETRIEVAL_CANDIDATES, RETRIEVAL_TOP_N
+
+MODES = ["vector", "lexical", "hybrid"]
+
+def pct(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+def is_relevant(doc, label):
+    if "contains" in label and label["contains"].lower() in (doc.content or "").lower(): return True
+    if "timestamp" in label:
+        end = doc.end_time if doc.end_time is not None else doc.start_time
+        return doc.start_time <= label["timestamp"] <= end
+    return False
+
+def first_hit(docs, label):
+    return next((rank for rank, doc in enumerate(docs, start=1) if is_relevant(doc, label)), None)
+
+async def candidates_for(db, mode, label, query_vec):
+    question, video_id = label["question"], label["video_id"]
+    if mode == "vector": return await postgres_candidates(db, query_vec, video_id)
+    if mode == "lexical": return await lexical_candidates(db, question, video_id, k=RETRIEVAL_CANDIDATES)
+    docs, _ = await hybrid_candidates(db, question, video_id, lambda: postgres_candidates(db, query_vec, video_id))
+    return docs
+
+async def evaluate(labels):
+    results = {m: {"cand_hits": 0, "final_hits": 0, "rr": 0.0, "retrieve_ms": [], "total_ms": []} for m in MODES}
+    for label in labels:
+        query_vec = await embed_query(label["question"])
+        for mode in MODES:
+            async with AsyncSessionLocal() as db:
+                start = time.perf_counter()
+                docs = await candidates_for(db, mode, label, query_vec)
+                retrieved = time.perf_counter()
+                scores = await rerank(label["question"], [(d.id, d.content) for d in docs]) if docs else []
+                done = time.perf_counter()
+            ranked = [d for d, _ in sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)]
+            r = results[mode]
+            r["cand_hits"] += first_hit(docs, label) is not None
+            hit = first_hit(ranked, label)
+            r["final_hits"] += hit is not None and hit <= RETRIEVAL_TOP_N
+            r["rr"] += 1 / hit if hit else 0.0
+            r["retrieve_ms"].append((retrieved - start) * 1000)
+            r["total_ms"].append((done - start) * 1000)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", required=True)
+    args = parser.parse_args()
+
+    with open(args.questions) as f:
+        labels = [json.loads(line) for line in f if line.strip()]
+
+    async def main():
+        await warm_up()
+        return await evaluate(labels)
+
+    results = asyncio.run(main())
+    n = len(labels)
+    print(f"{n} questions, {RETRIEVAL_CANDIDATES} candidates, top {RETRIEVAL_TOP_N} after rerank")
+    for mode, r in results.items():
+        print(f"{mode:<8} recall@{RETRIEVAL_CANDIDATES} {r['cand_hits'] / n:6.3f}  recall@{RETRIEVAL_TOP_N} (reranked) "
+              f"{r['final_hits'] / n:6.3f}  MRR {r['rr'] / n:6.3f}  retrieve p50 {pct(r['retrieve_ms'], 50):6.1f}ms "
+              f"p95 {pct(r['retrieve_ms'], 95):6.1f}ms  +rerank p50 {pct(r['total_ms'], 50):6.1f}ms p95 {pct(r['total_ms'], 95):6.1f}ms")
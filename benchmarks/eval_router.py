@@ -0,0 +1,70 @@
+"""
+Offline evaluation of the local intent router against the LLM router.
+
+Each query is routed by both; the script reports agreement (overall and on the
+turns the local router would answer alone), the escalation rate at the configured
+threshold, per-router latency, and the LLM latency saved per turn.
+
+    python benchmarks/eval_router.py [--queries queries.jsonl] [--threshold 0.08]
+
+queries.jsonl: one {"query": "...", "label": "RAG|SEARCH|CHAT"} per line; label is optional.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import local_route, ROUTER_CONFIDENCE_THRESHOLD
+from graph_brain import llm_route
+
+SAMPLE_QUERIES = [
+    "summarize this video for me", "what does the instructor say about closures?", "hello!",
+    "what's new in the rust 2024 edition", "explain the second example again", "thanks a lot",
+    "can you find articles about this topic too", "who won the champions league final",
+    "what are the prerequisites mentioned in the lecture", "how's it going", "latest ai news today",
+    "give me the key takeaways with timestamps",
+]
+
+def load_queries(path):
+    if not path: return [{"query": q} for q in SAMPLE_QUERIES]
+    with open(path) as f: return [json.loads(line) for line in f if line.strip()]
+
+async def main(args):
+    rows = []
+    for item in load_queries(args.queries):
+        local = await local_route(item["query"])
+        start = time.perf_counter()
+        llm_label, _ = await llm_route(item["query"])
+        rows.append({**item, "local": local, "llm": llm_label, "llm_ms": (time.perf_counter() - start) * 1000})
+
+    n = len(rows)
+    confident = [r for r in rows if r["local"]["confidence"] >= args.threshold]
+    agree = sum(r["local"]["label"] == r["llm"] for r in rows)
+    agree_conf = sum(r["local"]["label"] == r["llm"] for r in confident)
+    local_ms = sum(r["local"]["ms"] for r in rows) / n
+    llm_ms = sum(r["llm_ms"] for r in rows) / n
+    saved = (len(confident) / n) * llm_ms - local_ms
+
+    print(f"queries: {n}   threshold: {args.threshold}")
+    print(f"agreement with LLM router:        {agree / n:.1%}")
+    print(f"agreement on confident decisions: {agree_conf / max(1, len(confident)):.1%}  ({len(confident)} turns)")
+    print(f"escalation rate:                  {1 - len(confident) / n:.1%}")
+    print(f"latency  local: {local_ms:.1f}ms   llm: {llm_ms:.1f}ms   saved per turn: {saved:.1f}ms")
+    labeled = [r for r in rows if r.get("label")]
+    if labeled:
+        hybrid = [r["local"]["label"] if r["local"]["confidence"] >= args.threshold else r["llm"] for r in labeled]
+        print(f"accuracy vs labels  local: {sum(r['local']['label'] == r['label'] for r in labeled) / len(labeled):.1%}"
+              f"   llm: {sum(r['llm'] == r['label'] for r in labeled) / len(labeled):.1%}"
+              f"   hybrid: {sum(h == r['label'] for h, r in zip(hybrid, labeled)) / len(labeled):.1%}")
+    print("disagreements:", dict(Counter((r["local"]["label"], r["llm"]) for r in rows if r["local"]["label"] != r["llm"])))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries")
+    parser.add_argument("--threshold", type=float, default=ROUTER_CONFIDENCE_THRESHOLD)
+    asyncio.run(main(parser.parse_args()))
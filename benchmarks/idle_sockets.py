@@ -0,0 +1,81 @@
+"""
+Idle WebSocket test: opens hundreds of /ws/chat sockets that never send, then runs a
+few active chatters alongside them. With per-operation sessions the idle sockets
+must not hold pooled connections, so the pool stays far below its 10 + 20 limit
+and the active turns keep their latency.
+
+Needs a running server and a valid token + session id:
+
+    python benchmarks/idle_sockets.py --token $TOKEN --session-id 1 \
+        --url "https://www.youtube.com/watch?v=VIDEO" --idle 500 --active 5 --turns 3
+"""
+import time
+import json
+import asyncio
+import argparse
+import statistics
+import urllib.request
+
+import websockets
+
+def get_json(url):
+    with urllib.request.urlopen(url) as r: return json.load(r)
+
+async def idle_client(ws_url, opened, stop):
+    try:
+        async with websockets.connect(ws_url, max_size=None, open_timeout=30) as ws:
+            opened.append(ws)
+            await stop.wait()
+    except Exception:
+        pass
+
+async def active_client(ws_url, video_url, turns, latencies):
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        for _ in range(turns):
+            start = time.perf_counter()
+            await ws.send(json.dumps({"message": "What is the main idea of this video?", "url": video_url}))
+            while json.loads(await ws.recv()).get("type") != "result": pass
+            latencies.append((time.perf_counter() - start) * 1000)
+
+async def main(args):
+    ws_url = f"{args.server.replace('http', 'ws', 1)}/ws/chat?token={args.token}&session_id={args.session_id}"
+    stats_url = f"{args.server}/api/stats/db"
+    opened, stop = [], asyncio.Event()
+
+    idle = [asyncio.create_task(idle_client(ws_url, opened, stop)) for _ in range(args.idle)]
+    deadline = time.time() + 60
+    while len(opened) < args.idle and time.time() < deadline: await asyncio.sleep(0.5)
+    await asyncio.sleep(2)  # let every socket finish its connect-time queries
+    pool_idle = get_json(stats_url)["pool"]
+    print(f"idle sockets open: {len(opened)}/{args.idle}  pool with sockets idle: {pool_idle}")
+
+    latencies = []
+    active = [asyncio.create_task(active_client(ws_url, args.url, args.turns, latencies)) for _ in range(args.active)]
+    peak = pool_idle["checked_out"]
+    while not all(t.done() for t in active):
+        peak = max(peak, get_json(stats_url)["pool"]["checked_out"])
+        await asyncio.sleep(0.2)
+    errors = [t.exception() for t in active if t.exception()]
+
+    stats = get_json(stats_url)
+    print(f"active turns: {len(latencies)}  errors: {len(errors)}  peak checked-out connections: {peak}")
+    if latencies:
+        print(f"turn latency p50 {statistics.median(latencies):.0f}ms  max {max(latencies):.0f}ms")
+    print(f"chat writer: {stats['chat_writer']}")
+
+    stop.set()
+    await asyncio.gather(*idle)
+    if peak > 30 or len(opened) < args.idle or errors:
+        raise SystemExit("FAIL: idle sockets pinned connections or active chatters failed")
+    print("PASS")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", default="http://localhost:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--session-id", type=int, required=True)
+    parser.add_argument("--url", required=True, help="YouTube URL of an ingested video")
+    parser.add_argument("--idle", type=int, default=500)
+    parser.add_argument("--active", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,56 @@
+"""
+Chat WebSocket load test: N simulated clients each send a few turns to /ws/chat
+and the script reports p50/p99 turn latency per concurrency level.
+
+Needs a running server and a valid token + session id:
+
+    python benchmarks/load_ws_chat.py --token $TOKEN --session-id 1 \
+        --url "https://www.youtube.com/watch?v=VIDEO" --clients 1 5 10 25 --turns 3
+"""
+import time
+import json
+import asyncio
+import argparse
+import statistics
+
+import websockets
+
+QUESTIONS = ["Summarize this video", "What is the main idea?", "Explain the example at the start", "hi"]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+async def client(ws_url, video_url, turns, latencies):
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        for i in range(turns):
+            start = time.perf_counter()
+            await ws.send(json.dumps({"message": QUESTIONS[i % len(QUESTIONS)], "url": video_url}))
+            while True:
+                event = json.loads(await ws.recv())
+                if event.get("type") == "result": break
+            latencies.append(time.perf_counter() - start)
+
+async def run_level(args, n):
+    ws_url = f"{args.host}/ws/chat?token={args.token}&session_id={args.session_id}"
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(ws_url, args.url, args.turns, latencies) for _ in range(n)])
+    wall = time.perf_counter() - start
+    print(f"{n:>7} | {percentile(latencies, 50):7.2f}s | {percentile(latencies, 99):7.2f}s | "
+          f"{statistics.mean(latencies):7.2f}s | {len(latencies) / wall:6.2f} turns/s")
+
+async def main(args):
+    print("clients |     p50  |     p99  |    mean  | throughput")
+    for n in args.clients: await run_level(args, n)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="ws://localhost:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--session-id", type=int, required=True)
+    parser.add_argument("--url", default="")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 5, 10, 25])
+    parser.add_argument("--turns", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""
+Mock Groq chat-completions endpoint for exercising the LLM scheduler without
+spending quota. Adds configurable latency, a random 429 rate and the
+x-ratelimit-* headers the real API sends.
+
+    uvicorn benchmarks.mock_groq:app --port 9000
+    GROQ_BASE_URL=http://localhost:9000 GROQ_API_KEY=mock uvicorn main:app
+
+Tune with MOCK_LATENCY_MS, MOCK_429_RATE, MOCK_RPM and MOCK_TPM.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MOCK_LATENCY_MS = float(os.getenv("MOCK_LATENCY_MS", "400"))
+MOCK_429_RATE = float(os.getenv("MOCK_429_RATE", "0.05"))
+MOCK_RPM = int(os.getenv("MOCK_RPM", "30"))
+MOCK_TPM = int(os.getenv("MOCK_TPM", "12000"))
+
+app = FastAPI()
+window = []  # (timestamp, tokens) over the last minute
+
+def usage_headers(tokens):
+    now = time.time()
+    window[:] = [(t, n) for t, n in window if now - t < 60]
+    window.append((now, tokens))
+    used = sum(n for _, n in window)
+    reset = 60 - (now - window[0][0])
+    return {
+        "x-ratelimit-limit-requests": str(MOCK_RPM),
+        "x-ratelimit-limit-tokens": str(MOCK_TPM),
+        "x-ratelimit-remaining-requests": str(max(0, MOCK_RPM - len(window))),
+        "x-ratelimit-remaining-tokens": str(max(0, MOCK_TPM - used)),
+        "x-ratelimit-reset-requests": f"{reset:.2f}s",
+        "x-ratelimit-reset-tokens": f"{reset:.2f}s",
+    }, len(window) > MOCK_RPM or used > MOCK_TPM
+
+def reply_for(body):
+    if body.get("response_format", {}).get("type") == "json_object":
+        return json.dumps({"decision": "RAG", "thought": "mock", "score": 80, "reasoning": "mock", "suggestions": ["a?", "b?", "c?"]})
+    return "Mock answer at 01:23 covering the requested topic."
+
+@app.post("/openai/v1/chat/completions")
+async def completions(request: Request):
+    body = await request.json()
+    prompt_tokens = sum(len(m.get("content") or "") for m in body["messages"]) // 4
+    text = reply_for(body)
+    completion_tokens = len(text) // 4
+    headers, over_limit = usage_headers(prompt_tokens + completion_tokens)
+
+    if over_limit or random.random() < MOCK_429_RATE:
+        headers["retry-after"] = "1"
+        return JSONResponse({"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                            status_code=429, headers=headers)
+
+    await asyncio.sleep(MOCK_LATENCY_MS / 1000 * random.uniform(0.5, 1.5))
+    base = {"id": "mock", "created": int(time.time()), "model": body["model"]}
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    if not body.get("stream"):
+        return JSONResponse({**base, "object": "chat.completion", "usage": usage, "choices": [
+            {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}]}, headers=headers)
+
+    async def events():
+        for word in text.split(" "):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": word + " "}}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(0.01)
+        done = {**base, "object": "chat.completion.chunk", "x_groq": {"usage": usage},
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(done)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
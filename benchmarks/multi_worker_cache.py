@@ -0,0 +1,163 @@
+"""
+Multi-process test of the shared-state layer: separate processes stand in for
+uvicorn workers and talk only through SHARED_STATE_URL.
+
+  1. caches   - worker 0 answers a search and a chat turn; workers 1..N-1 ask the
+                same things and must hit the shared search and response caches
+                without calling the provider themselves.
+  2. jobs     - worker 0 runs an ingestion job; another worker submits the same
+                video, gets the same job back (deduplicated) and follows its
+                progress over pub/sub until the result arrives.
+
+Points at a real Redis-compatible server, or starts a local stand-in
+(`pip install fakeredis`) when --redis-url is omitted. The app's .env is needed
+for imports only; no database or model calls are made.
+
+    python benchmarks/multi_worker_cache.py [--workers 4] [--redis-url redis://localhost:6379/15]
+"""
+import os
+import sys
+import socket
+import asyncio
+import argparse
+import threading
+import multiprocessing as mp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERY = "python decorators tutorial guide"
+VIDEO_ID = "mpTestVideo1"
+
+def start_stand_in():
+    from fakeredis import TcpFakeServer
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0"
+
+def boot(url):
+    # Must run before the app modules are imported: they read the URL at import time
+    os.environ["SHARED_STATE_URL"] = url
+    os.environ["SHARED_STATE_PREFIX"] = f"mptest:{os.getppid()}:"
+    sys.path.insert(0, ROOT)
+
+def query_vector(seed):
+    import numpy as np
+    vec = np.random.default_rng(7).standard_normal(384)
+    return vec + np.random.default_rng(seed).standard_normal(384) * 0.01  # a paraphrase, ~0.99 cosine
+
+def cache_worker(url, rank, out):
+    boot(url)
+    from search_gateway import search_gateway
+    from response_cache import response_cache
+
+    provider_calls = []
+    def provider(query, max_results):
+        provider_calls.append(query)
+        return [{"title": "Primer on Python Decorators", "href": "https://realpython.com/primer-on-python-decorators/", "body": "..."}]
+    search_gateway.register_provider("web", provider)
+
+    async def main():
+        results = await search_gateway.search("web", QUERY, 3)
+        payload, similarity = await response_cache.lookup(None, VIDEO_ID, query_vector(rank))
+        if rank == 0 and payload is None:
+            await response_cache.store(None, VIDEO_ID, query_vector(rank), QUERY, "Decorators wrap functions.", [], {})
+        out.put({"rank": rank, "pid": os.getpid(), "provider_calls": len(provider_calls), "results": len(results),
+                 "search_shared_hits": search_gateway.stats()["providers"]["web"]["shared_hits"],
+                 "answer": (payload or {}).get("final_answer"), "similarity": round(similarity, 4),
+                 "response_shared_hits": response_cache.stats()["shared_hits"]})
+    asyncio.run(main())
+
+def job_owner(url, submitted, following, out):
+    boot(url)
+    from jobs import JobManager
+
+    async def runner(video_url, video_id, report):
+        await asyncio.to_thread(following.wait, 60)  # keep the job in flight until the other process is listening
+        for stage in ("fetch", "chunk", "embed", "store"):
+            await report(stage, "running")
+            await asyncio.sleep(0.5)
+            await report(stage, "done")
+        return {"video_id": video_id, "ran_on": os.getpid()}
+
+    async def main():
+        manager = JobManager(runner=runner, workers=1)
+        await manager.start()
+        job, created = await manager.submit(f"https://www.youtube.com/watch?v={VIDEO_ID}", VIDEO_ID)
+        submitted.set()
+        final = await manager.wait(job["job_id"])
+        await manager.stop()
+        out.put({"role": "owner", "pid": os.getpid(), "job_id": job["job_id"], "created": created, "status": final["status"]})
+    asyncio.run(main())
+
+def job_follower(url, following, out):
+    boot(url)
+    from jobs import JobManager, TERMINAL
+
+    async def main():
+        manager = JobManager()  # never started: this process runs nothing itself
+        job, created = await manager.submit(f"https://www.youtube.com/watch?v={VIDEO_ID}", VIDEO_ID)
+        events = await manager.subscribe(job["job_id"])
+        following.set()
+        seen = []
+        try:
+            snapshot = await manager.get(job["job_id"])
+            while snapshot["status"] not in TERMINAL:
+                event = await asyncio.wait_for(events.get(), 30)
+                seen.append(event["type"])
+                if event["type"] in ("result", "error"): break
+        finally: await events.close()
+        final = await manager.get(job["job_id"])
+        out.put({"role": "follower", "pid": os.getpid(), "job_id": job["job_id"], "created": created,
+                 "events": len(seen), "status": final["status"], "result": final["result"]})
+    asyncio.run(main())
+
+def run(ctx, target, *args):
+    p = ctx.Process(target=target, args=args)
+    p.start()
+    return p
+
+def main(args):
+    url = args.redis_url or start_stand_in()
+    print(f"shared state: {url}  workers: {args.workers}")
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    failures = []
+
+    # 1. Caches: the first worker fills them, every other worker must hit
+    run(ctx, cache_worker, url, 0, out).join()
+    first = out.get()
+    readers = [run(ctx, cache_worker, url, rank, out) for rank in range(1, args.workers)]
+    for p in readers: p.join()
+    others = [out.get() for _ in readers]
+    for r in [first] + sorted(others, key=lambda r: r["rank"]):
+        print(f"  worker {r['rank']} (pid {r['pid']}): provider calls {r['provider_calls']}, search shared hits {r['search_shared_hits']}, "
+              f"answer {'hit' if r['answer'] else 'miss'} (similarity {r['similarity']})")
+    if first["provider_calls"] != 1: failures.append("worker 0 should have called the provider once")
+    for r in others:
+        if r["provider_calls"] or r["search_shared_hits"] != 1: failures.append(f"worker {r['rank']} missed the shared search cache")
+        if not r["answer"] or r["response_shared_hits"] != 1: failures.append(f"worker {r['rank']} missed the shared response cache")
+
+    # 2. Jobs: dedupe across processes and progress over pub/sub
+    submitted, following = ctx.Event(), ctx.Event()
+    owner = run(ctx, job_owner, url, submitted, following, out)
+    if not submitted.wait(60): raise SystemExit("FAIL: owner never submitted its job")
+    follower = run(ctx, job_follower, url, following, out)
+    owner.join(); follower.join()
+    reports = {r["role"]: r for r in (out.get(), out.get())}
+    o, f = reports["owner"], reports["follower"]
+    print(f"  job {o['job_id'][:8]} owner pid {o['pid']} created={o['created']} -> {o['status']}")
+    print(f"  follower pid {f['pid']}: same job={f['job_id'] == o['job_id']} created={f['created']}, "
+          f"{f['events']} progress events, result ran_on={(f['result'] or {}).get('ran_on')}")
+    if f["job_id"] != o["job_id"] or f["created"]: failures.append("second submit was not deduplicated across processes")
+    if f["status"] != "done" or not f["events"]: failures.append("follower did not stream the job to completion")
+
+    if failures: raise SystemExit("FAIL: " + "; ".join(failures))
+    print("PASS")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--redis-url", help="Redis-compatible server; a local stand-in is started when omitted")
+    main(parser.parse_args())
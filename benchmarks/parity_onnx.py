@@ -0,0 +1,77 @@
+"""
+Accuracy parity of the ONNX engines against the PyTorch reference.
+
+Embeddings: cosine similarity between torch and candidate vectors for the same text.
+Reranking: per query, the candidate's top-3 chunks must match the reference's top-3
+and the full ordering must agree (Spearman rho). Exits non-zero below the thresholds,
+so it can gate a change of INFERENCE_BACKEND.
+
+    python benchmarks/parity_onnx.py [--engines onnx onnx-int8] [--min-cosine 0.99] [--min-rho 0.95]
+"""
+import os
+import sys
+import random
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import LocalModels
+
+QUERIES = [
+    "what is gradient descent", "how does the learning rate affect training", "explain python decorators",
+    "what is a closure", "how do generators save memory", "difference between a list and a tuple",
+    "what is backpropagation", "why normalize the input features", "how does recursion terminate",
+    "what is overfitting and how to avoid it",
+]
+FACTS = [
+    "Gradient descent updates the weights in the direction that lowers the loss.",
+    "A learning rate that is too large makes the loss diverge instead of converging.",
+    "A decorator wraps a function and returns a new function with extra behaviour.",
+    "A closure keeps references to variables from the scope where it was defined.",
+    "Generators yield one value at a time instead of building the whole list in memory.",
+    "Lists are mutable while tuples cannot be changed after they are created.",
+    "Backpropagation applies the chain rule to compute gradients layer by layer.",
+    "Normalizing features puts them on a similar scale so optimization is better conditioned.",
+    "Every recursive function needs a base case that stops the recursion.",
+    "Overfitting is when the model memorizes training data; regularization and dropout help.",
+    "The speaker then switches to a demo in the terminal.",
+    "Thanks for watching, remember to like and subscribe.",
+]
+
+def spearman(a, b):
+    ra, rb = np.argsort(np.argsort(a)), np.argsort(np.argsort(b))
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+def check(reference, candidate, min_cosine, min_rho):
+    texts = QUERIES + FACTS
+    ref_vecs = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    cand_vecs = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    cosines = np.sum(ref_vecs * cand_vecs, axis=1) / (np.linalg.norm(ref_vecs, axis=1) * np.linalg.norm(cand_vecs, axis=1))
+
+    rhos, top3_matches = [], 0
+    rng = random.Random(7)
+    for query in QUERIES:
+        chunks = rng.sample(FACTS, len(FACTS))
+        pairs = [[query, c] for c in chunks]
+        ref_scores, cand_scores = np.asarray(reference.predict(pairs)), np.asarray(candidate.predict(pairs))
+        rhos.append(spearman(ref_scores, cand_scores))
+        top3_matches += list(np.argsort(-ref_scores)[:3]) == list(np.argsort(-cand_scores)[:3])
+
+    ok = cosines.min() >= min_cosine and min(rhos) >= min_rho and top3_matches == len(QUERIES)
+    print(f"{candidate.engine:<10} embed cosine min {cosines.min():.4f} mean {cosines.mean():.4f} | "
+          f"rerank rho min {min(rhos):.4f} mean {np.mean(rhos):.4f} | top-3 identical {top3_matches}/{len(QUERIES)} "
+          f"-> {'PASS' if ok else 'FAIL'}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", nargs="+", default=["onnx", "onnx-int8"])
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--min-rho", type=float, default=0.95)
+    args = parser.parse_args()
+
+    reference = LocalModels(engine="torch")
+    results = [check(reference, LocalModels(engine=engine), args.min_cosine, args.min_rho) for engine in args.engines]
+    sys.exit(0 if all(results) else 1)
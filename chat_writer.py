@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+from database import AsyncSessionLocal, ChatMessage
+
+# --- CONFIG ---
+# sync:  one INSERT + COMMIT per message on its own short session (old behaviour, no batching)
+# ack:   batched, but the turn waits until its rows are committed before replying
+# async: batched write-behind; the reply does not wait, a crash can lose the last interval
+CHAT_WRITE_MODE = os.getenv("CHAT_WRITE_MODE", "ack").lower()
+CHAT_WRITE_INTERVAL_MS = float(os.getenv("CHAT_WRITE_INTERVAL_MS", "20"))  # max time a row waits for batch-mates
+CHAT_WRITE_BATCH = int(os.getenv("CHAT_WRITE_BATCH", "200"))
+CHAT_WRITE_QUEUE = int(os.getenv("CHAT_WRITE_QUEUE", "10000"))             # submitters wait (backpressure) beyond this
+CHAT_WRITE_RETRIES = int(os.getenv("CHAT_WRITE_RETRIES", "3"))
+
+class ChatWriter:
+    """
+    Write-behind queue for ChatMessage rows shared by every socket: one bulk INSERT
+    per batch across all sessions instead of a commit per message. created_at is
+    stamped at submit time, so a user message and its reply keep their order even
+    when they land in the same batch.
+    """
+    def __init__(self, mode=CHAT_WRITE_MODE, interval_ms=CHAT_WRITE_INTERVAL_MS, batch_size=CHAT_WRITE_BATCH,
+                 max_queue=CHAT_WRITE_QUEUE, retries=CHAT_WRITE_RETRIES):
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.retries = retries
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self.counters = {"submitted": 0, "written": 0, "batches": 0, "retries": 0, "failed": 0, "flush_ms": 0.0}
+
+    async def start(self):
+        if self.mode != "sync" and self._task is None: self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flushes everything still queued, then stops the flusher."""
+        if self._task is None: return
+        await self.queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def submit(self, session_id, role, content, metadata=None):
+        """Queues one message; returns a future that resolves once the row is committed."""
+        row = {"session_id": session_id, "role": role, "content": content, "metadata": metadata,
+               "created_at": datetime.now(timezone.utc)}
+        self.counters["submitted"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        if self.mode == "sync" or self._task is None:
+            try:
+                await self._insert([row])
+                fut.set_result(None)
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        if self.mode == "async": fut.add_done_callback(_log_failure)
+        await self.queue.put((row, fut))
+        return fut
+
+    async def confirm(self, *futures):
+        """Waits for durability unless the mode is write-behind ("async")."""
+        if self.mode != "async": await asyncio.gather(*futures)
+
+    async def _insert(self, rows):
+        # "metadata" is reserved on declarative classes, hence the metadata_ attribute
+        values = [{**{k: v for k, v in r.items() if k != "metadata"}, "metadata_": r["metadata"]} for r in rows]
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(ChatMessage), values)
+            await db.commit()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0: break
+                try: batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError: break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch: self.queue.task_done()
+
+    async def _flush(self, batch):
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                await self._insert([row for row, _ in batch])
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    self.counters["failed"] += len(batch)
+                    for _, fut in batch:
+                        if not fut.done(): fut.set_exception(e)
+                    return
+                self.counters["retries"] += 1
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        self.counters["written"] += len(batch)
+        self.counters["batches"] += 1
+        self.counters["flush_ms"] += (time.perf_counter() - start) * 1000
+        for _, fut in batch:
+            if not fut.done(): fut.set_result(None)
+
+    def stats(self):
+        c = self.counters
+        return {**c, "mode": self.mode, "queued": self.queue.qsize(),
+                "mean_batch": round(c["written"] / c["batches"], 2) if c["batches"] else 0.0,
+                "mean_flush_ms": round(c["flush_ms"] / c["batches"], 2) if c["batches"] else 0.0}
+
+def _log_failure(fut):
+    if not fut.cancelled() and fut.exception() is not None:
+        print(f"⚠️ Chat message lost after retries: {fut.exception()}")
+
+chat_writer = ChatWriter()
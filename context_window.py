@@ -0,0 +1,134 @@
+import os
+import asyncio
+from collections import deque
+
+from sqlalchemy.future import select
+from sqlalchemy import desc
+
+from database import ChatMessage
+from llm_client import llm, PRIORITY_BACKGROUND
+
+# --- CONFIG ---
+HISTORY_WINDOW_MESSAGES = int(os.getenv("HISTORY_WINDOW_MESSAGES", "10"))  # verbatim messages kept per socket
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "600"))   # evicted text folded into the summary past this
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "250"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))       # history + chunks + web results per prompt
+CONTEXT_CHUNK_SHARE = float(os.getenv("CONTEXT_CHUNK_SHARE", "0.6"))        # share reserved for retrieved chunks
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama-3.1-8b-instant")
+
+def count_tokens(text):
+    # ~4 characters per token for English with the Llama tokenizer; close enough for budgeting
+    return (len(text) + 3) // 4 if text else 0
+
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens: return text
+    return text[:max_tokens * 4].rsplit(" ", 1)[0] + " …"
+
+class ConversationWindow:
+    """
+    Last `max_messages` messages verbatim plus a rolling summary of everything older.
+    Evicted messages are buffered and folded into the summary once they pass
+    SUMMARY_TRIGGER_TOKENS, so memory stays bounded for long-lived sockets.
+    """
+    def __init__(self, max_messages=HISTORY_WINDOW_MESSAGES, summary=""):
+        self.messages = deque()
+        self.max_messages = max_messages
+        self.summary = summary
+        self.evicted = []
+        self._compaction = None  # in-flight background compact(), at most one per window
+
+    @classmethod
+    async def load(cls, db, session_id, max_messages=HISTORY_WINDOW_MESSAGES):
+        """Reads only the newest 2x window; the older half seeds the summary buffer."""
+        stmt = select(ChatMessage.role, ChatMessage.content).where(ChatMessage.session_id == session_id)\
+               .order_by(desc(ChatMessage.created_at)).limit(2 * max_messages)
+        rows = list(reversed((await db.execute(stmt)).all()))
+        window = cls(max_messages)
+        for role, content in rows: window.append(role, content)
+        return window
+
+    def append(self, role, content):
+        self.messages.append({"role": role, "content": content or ""})
+        while len(self.messages) > self.max_messages:
+            self.evicted.append(self.messages.popleft())
+
+    def history(self):
+        return list(self.messages)
+
+    def is_empty(self):
+        """True before the first turn: nothing the answer could depend on but the question."""
+        return not self.messages and not self.evicted and not self.summary
+
+    async def compact(self, force=False):
+        """Folds evicted messages into the summary (small model, truncation fallback)."""
+        if not self.evicted: return
+        pending = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in self.evicted)
+        if not force and count_tokens(pending) < SUMMARY_TRIGGER_TOKENS: return
+        self.evicted = []
+        try:
+            summary = await llm.chat(
+                [{"role": "user", "content": (
+                    f"Update the running summary of a tutoring conversation in at most {SUMMARY_MAX_TOKENS} tokens. "
+                    f"Keep facts, open questions and video timestamps.\n\nSUMMARY SO FAR:\n{self.summary}\n\nNEW MESSAGES:\n{pending}"
+                )}],
+                model=SUMMARY_MODEL, max_tokens=SUMMARY_MAX_TOKENS, priority=PRIORITY_BACKGROUND, purpose="history_summary"
+            )
+            self.summary = summary.strip()
+        except Exception:
+            self.summary = truncate_to_tokens(f"{self.summary}\n{pending}".strip(), SUMMARY_MAX_TOKENS)
+
+    def compact_soon(self):
+        """Runs compact() as a background task; a no-op while one is still in flight."""
+        if self._compaction is None or self._compaction.done():
+            self._compaction = asyncio.create_task(self.compact())
+
+def assemble_context(context="", history=(), summary="", budget=CONTEXT_TOKEN_BUDGET, chunk_share=CONTEXT_CHUNK_SHARE):
+    """
+    Packs retrieved chunks, recent history and the summary into `budget` tokens.
+    Priority: chunks in rank order (up to `chunk_share` of the budget, more if history
+    leaves room), then history newest-first, then the summary, which is truncated to fit.
+    Returns the packed pieces and their token counts.
+    """
+    chunk_lines = [line for line in context.split("\n") if line.strip()] if context else []
+    chunk_cap = int(budget * chunk_share)
+
+    kept_chunks, chunk_tokens = [], 0
+    for line in chunk_lines:
+        cost = count_tokens(line)
+        if chunk_tokens + cost > chunk_cap: break
+        kept_chunks.append(line)
+        chunk_tokens += cost
+
+    kept_history, history_tokens = [], 0
+    for msg in reversed(list(history)):
+        cost = count_tokens(msg["content"]) + 2
+        if chunk_tokens + history_tokens + cost > budget: break
+        kept_history.append(msg)
+        history_tokens += cost
+    kept_history.reverse()
+
+    # Unused history room goes back to chunks that did not fit the first pass
+    for line in chunk_lines[len(kept_chunks):]:
+        cost = count_tokens(line)
+        if chunk_tokens + history_tokens + cost > budget: break
+        kept_chunks.append(line)
+        chunk_tokens += cost
+
+    remaining = budget - chunk_tokens - history_tokens
+    packed_summary = truncate_to_tokens(summary, remaining) if summary and remaining > 20 else ""
+    summary_tokens = count_tokens(packed_summary)
+
+    return {
+        "context": "\n".join(kept_chunks), "history": kept_history, "summary": packed_summary,
+        "tokens": {
+            "budget": budget, "chunks": chunk_tokens, "history": history_tokens, "summary": summary_tokens,
+            "total": chunk_tokens + history_tokens + summary_tokens,
+            "chunks_dropped": len(chunk_lines) - len(kept_chunks),
+            "history_dropped": len(history) - len(kept_history),
+        },
+    }
+
+def history_text(history, summary="", upper=False):
+    lines = [f"{m['role'].upper() if upper else m['role']}: {m['content']}" for m in history]
+    if summary: lines.insert(0, f"(Earlier conversation, summarized) {summary}")
+    return "\n".join(lines)
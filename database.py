@@ -1,8 +1,15 @@
 import os
+import re
+import time
+import asyncio
+import hashlib
+import contextlib
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
-from sqlalchemy import text 
+from sqlalchemy.orm import sessionmaker, declarative_base, relationship, deferred
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, Float, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy import text, literal
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
 from dotenv import load_dotenv
@@ -10,6 +17,33 @@ load_dotenv()
 # Update with your credentials if needed
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# --- ANN INDEX CONFIG (video_embeddings.embedding) ---
+ANN_INDEX = os.getenv("ANN_INDEX", "hnsw").lower()          # hnsw | ivfflat | none
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+# Iterative scan stops after visiting this many tuples even if fewer than k rows passed the
+# video_id filter. Higher returns full top-k for videos that are a tiny share of the table
+# at the cost of slower worst-case queries; pgvector's default is 20000
+HNSW_MAX_SCAN_TUPLES = int(os.getenv("HNSW_MAX_SCAN_TUPLES", "20000"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+# pgvector >= 0.8 keeps scanning the index until enough rows pass the video_id filter
+ANN_ITERATIVE_SCAN = os.getenv("ANN_ITERATIVE_SCAN", "relaxed_order")  # relaxed_order | strict_order | off
+# Videos with at least this many chunks (~1 KB each, 2000 is roughly 30-40 hours of speech:
+# livestream archives, course playlists) get their own partial HNSW index
+ANN_PARTIAL_MIN_CHUNKS = int(os.getenv("ANN_PARTIAL_MIN_CHUNKS", "2000"))
+
+# --- FULL-TEXT CONFIG (video_embeddings.content_tsv) ---
+# Baked into the stored vectors; changing it means dropping content_tsv so ensure_fts_index rebuilds it
+FTS_CONFIG = os.getenv("FTS_CONFIG", "english")
+if not re.fullmatch(r"[a-z_]+", FTS_CONFIG): raise ValueError(f"invalid FTS_CONFIG: {FTS_CONFIG}")
+FTS_BACKFILL_BATCH = int(os.getenv("FTS_BACKFILL_BATCH", "5000"))  # rows per UPDATE when filling content_tsv on an existing table
+FTS_RECHECK_S = float(os.getenv("FTS_RECHECK_S", "60"))            # how often searches re-check whether the index is built
+
+def fts_expression(content="content"):
+    return f"to_tsvector('{FTS_CONFIG}'::regconfig, coalesce({content}, ''))"
+
 Base = declarative_base()
 
 # --- 1. AUTH MODELS ---
@@ -32,6 +66,8 @@ class Session(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="sessions")
+    # Keyset pages of a user's sessions, newest first (see pagination.py)
+    __table_args__ = (Index("ix_sessions_user_created", "user_id", "created_at", "id"),)
     messages = relationship("ChatMessage", back_populates="session", cascade="all, delete")
 
 class ChatMessage(Base):
@@ -44,6 +80,8 @@ class ChatMessage(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     session = relationship("Session", back_populates="messages")
+    # Keyset pages / ordered export of one session's messages
+    __table_args__ = (Index("ix_chat_messages_session_created", "session_id", "created_at", "id"),)
 
 # --- 3. RAG MODEL ---
 class VideoEmbedding(Base):
@@ -52,7 +90,42 @@ class VideoEmbedding(Base):
     video_id = Column(String, index=True)
     content = Column(Text)
     embedding = Column(Vector(384))
-    start_time = Column(Integer)
+    start_time = Column(Integer)  # seconds, offset of the first caption segment in the chunk
+    end_time = Column(Integer)    # seconds, end of the last caption segment
+    content_hash = Column(String(64), index=True)  # sha256 of the chunk text, lets identical chunks share an embedding
+    # Lexical side of hybrid retrieval (GIN); filled by a trigger, see ensure_fts_index
+    content_tsv = deferred(Column(TSVECTOR))
+
+# --- 4. RESPONSE CACHE (optional persistent layer for response_cache.py) ---
+class ResponseCacheEntry(Base):
+    __tablename__ = "response_cache"
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(String, index=True)
+    query = Column(Text)
+    embedding = Column(Vector(384))
+    payload = Column(JSON)
+    expires_at = Column(Float, index=True)  # unix time
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# --- 5. INGESTION CACHE (raw transcript + derived payloads, so known videos skip the network) ---
+class IngestionCache(Base):
+    __tablename__ = "ingestion_cache"
+    video_id = Column(String, primary_key=True)
+    content_hash = Column(String(64), index=True)  # sha256 of the normalized transcript text
+    segments = Column(JSON)                        # caption segments as fetched
+    chunk_hashes = Column(JSON, nullable=True)     # content_hash of every stored chunk, in order
+    recommendations = Column(JSON, nullable=True)  # generate_resources_on_load payload
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# --- 6. TELEMETRY (written in batches by telemetry.py, read by monitor.py) ---
+class TelemetryEvent(Base):
+    __tablename__ = "telemetry_events"
+    id = Column(Integer, primary_key=True)
+    ts = Column(Float, index=True)          # unix time the stage finished
+    stage = Column(String, index=True)      # e.g. turn, retrieval.rerank, node.rag_agent, llm.judge, ingest.embed
+    duration_ms = Column(Float)
+    status = Column(String)                 # ok | error | <job stage status>
+    attrs = Column(JSON, nullable=True)     # tokens, cache hit, router label, video/session ids
 
 # --- ENGINE CONFIGURATION (THE FIX) ---
 engine = create_async_engine(
@@ -66,10 +139,199 @@ engine = create_async_engine(
 
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Filled in by init_db from pg_extension
+PGVECTOR_VERSION = (0, 0, 0)
+# Set by init_db when filtered ANN searches would post-filter (see apply_ann_settings)
+ANN_EXACT_FALLBACK = False
+# True once content_tsv is filled and its GIN index is valid; until then hybrid search is vector-only
+FTS_READY = False
+_fts_checked_at = 0.0
+_migration_tasks = []
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         await conn.run_sync(Base.metadata.create_all)
+        # Columns added after the table first shipped (create_all does not alter existing tables)
+        await conn.execute(text("ALTER TABLE video_embeddings ADD COLUMN IF NOT EXISTS end_time INTEGER"))
+        await conn.execute(text("ALTER TABLE video_embeddings ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_video_embeddings_content_hash ON video_embeddings (content_hash)"))
+        await load_pgvector_version(conn)
+        await check_fts_ready(conn)
+    # Index builds and backfills can take minutes on a large table: never inside the startup transaction
+    _migration_tasks[:] = [asyncio.create_task(ensure_ann_index()), asyncio.create_task(ensure_fts_index()),
+                           asyncio.create_task(ensure_keyset_indexes())]
+
+# --- BACKGROUND MIGRATIONS ---
+@contextlib.asynccontextmanager
+async def migration_connection(lock):
+    """
+    AUTOCOMMIT connection (CREATE / DROP INDEX CONCURRENTLY cannot run inside a transaction
+    block) holding the advisory lock `lock`, or None when another worker holds it.
+    """
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not (await conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:lock))"), {"lock": lock})).scalar():
+            yield None
+            return
+        try: yield conn
+        finally: await conn.execute(text("SELECT pg_advisory_unlock(hashtext(:lock))"), {"lock": lock})
+
+async def create_index_concurrently(conn, name, ddl):
+    """Runs `CREATE INDEX CONCURRENTLY IF NOT EXISTS <name> <ddl>`; writes keep flowing during the build."""
+    # A build that died half way leaves an INVALID index that IF NOT EXISTS would keep
+    invalid = (await conn.execute(text(
+        "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+    ), {"name": name})).scalar()
+    if invalid: await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {ddl}"))
+
+# Keyset pagination indexes (see pagination.py). New tables get them from create_all;
+# tables that predate them are indexed here without blocking chat writes
+KEYSET_INDEXES = {
+    "ix_chat_messages_session_created": "ON chat_messages (session_id, created_at, id)",
+    "ix_sessions_user_created": "ON sessions (user_id, created_at, id)",
+}
+
+async def ensure_keyset_indexes():
+    try:
+        async with migration_connection("ensure_keyset_indexes") as conn:
+            if conn is None: return
+            for name, ddl in KEYSET_INDEXES.items(): await create_index_concurrently(conn, name, ddl)
+    except Exception as e:
+        print(f"⚠️ Keyset index build failed: {e}")
+
+# --- FULL-TEXT INDEX MANAGEMENT ---
+FTS_INDEX = "ix_video_embeddings_content_tsv"
+
+async def check_fts_ready(conn):
+    global FTS_READY, _fts_checked_at
+    _fts_checked_at = time.monotonic()
+    FTS_READY = bool((await conn.execute(text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+    ), {"name": FTS_INDEX})).scalar())
+    return FTS_READY
+
+async def fts_ready(db):
+    """Whether lexical search may run; rechecked every FTS_RECHECK_S while another worker builds the index."""
+    if FTS_READY or time.monotonic() - _fts_checked_at < FTS_RECHECK_S: return FTS_READY
+    return await check_fts_ready(await db.connection())
+
+async def ensure_fts_index():
+    """
+    Adds content_tsv without rewriting the table: a plain column (a catalog-only change)
+    kept current by a trigger, existing rows backfilled in id-range batches, then the GIN
+    index built CONCURRENTLY. A generated column would rewrite every row under an ACCESS
+    EXCLUSIVE lock. Databases that already have the generated column skip straight to the index.
+    """
+    try:
+        async with migration_connection("ensure_fts_index") as conn:
+            if conn is None: return
+            await conn.execute(text("ALTER TABLE video_embeddings ADD COLUMN IF NOT EXISTS content_tsv tsvector"))
+            generated = (await conn.execute(text(
+                "SELECT attgenerated <> '' FROM pg_attribute WHERE attrelid = 'video_embeddings'::regclass AND attname = 'content_tsv'"
+            ))).scalar()
+            if not generated:
+                await conn.execute(text(
+                    "CREATE OR REPLACE FUNCTION video_embeddings_content_tsv() RETURNS trigger LANGUAGE plpgsql AS "
+                    f"$$ BEGIN NEW.content_tsv := {fts_expression('NEW.content')}; RETURN NEW; END $$"
+                ))
+                await conn.execute(text(
+                    "CREATE OR REPLACE TRIGGER video_embeddings_content_tsv BEFORE INSERT OR UPDATE OF content ON video_embeddings "
+                    "FOR EACH ROW EXECUTE FUNCTION video_embeddings_content_tsv()"
+                ))
+                # Short transactions over id ranges: each one locks only the rows it fills
+                last, top = 0, (await conn.execute(text("SELECT coalesce(max(id), 0) FROM video_embeddings"))).scalar()
+                while last < top:
+                    await conn.execute(text(
+                        f"UPDATE video_embeddings SET content_tsv = {fts_expression()} WHERE id > :lo AND id <= :hi AND content_tsv IS NULL"
+                    ), {"lo": last, "hi": last + FTS_BACKFILL_BATCH})
+                    last += FTS_BACKFILL_BATCH
+            await create_index_concurrently(conn, FTS_INDEX, "ON video_embeddings USING gin (content_tsv)")
+            await check_fts_ready(conn)
+    except Exception as e:
+        print(f"⚠️ Full-text index build failed: {e}")
+
+# --- ANN INDEX MANAGEMENT ---
+ANN_INDEX_PREFIX = "ix_video_embeddings_ann_"
+
+def ann_index_ddl():
+    """(index name, CREATE INDEX body after the name) for the configured ANN_INDEX, or (None, None)."""
+    if ANN_INDEX == "hnsw":
+        name = f"{ANN_INDEX_PREFIX}hnsw_m{HNSW_M}_ef{HNSW_EF_CONSTRUCTION}"
+        return name, (f"ON video_embeddings USING hnsw (embedding vector_cosine_ops) "
+                      f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})")
+    if ANN_INDEX == "ivfflat":
+        name = f"{ANN_INDEX_PREFIX}ivfflat_l{IVFFLAT_LISTS}"
+        return name, f"ON video_embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = {IVFFLAT_LISTS})"
+    return None, None
+
+async def load_pgvector_version(conn):
+    global PGVECTOR_VERSION, ANN_EXACT_FALLBACK
+    version = (await conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"))).scalar()
+    if version: PGVECTOR_VERSION = tuple(int(p) for p in re.findall(r"\d+", version)[:3])
+    ANN_EXACT_FALLBACK = ANN_INDEX != "none" and (ANN_ITERATIVE_SCAN == "off" or PGVECTOR_VERSION < (0, 8, 0))
+    if ANN_EXACT_FALLBACK:
+        print(f"⚠️ pgvector {'.'.join(map(str, PGVECTOR_VERSION))} without iterative scan: per-video searches on the "
+              f"{ANN_INDEX} index would post-filter and lose rows, using the exact video_id path instead")
+
+async def ensure_ann_index():
+    """
+    Builds the configured ANN index CONCURRENTLY (writes keep flowing), then drops managed
+    indexes built with other settings. One worker does it; the others skip while it holds
+    the advisory lock.
+    """
+    wanted, ddl = ann_index_ddl()
+    try:
+        async with migration_connection("ensure_ann_index") as conn:
+            if conn is None: return
+            if ddl: await create_index_concurrently(conn, wanted, ddl)
+            existing = (await conn.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'video_embeddings' AND indexname LIKE :prefix"
+            ), {"prefix": f"{ANN_INDEX_PREFIX}%"})).scalars().all()
+            for name in existing:
+                if name != wanted and not name.startswith(f"{ANN_INDEX_PREFIX}video_"):
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    except Exception as e:
+        print(f"⚠️ ANN index build failed: {e}")
+
+async def ensure_video_ann_index(video_id):
+    """
+    Partial HNSW index for one very long video (>= ANN_PARTIAL_MIN_CHUNKS chunks), so its
+    filtered searches never have to walk the global graph. Smaller videos are served by
+    the video_id b-tree (exact) or the global index. Built CONCURRENTLY on its own
+    connection; only useful where the planner may use ANN indexes (not in fallback mode).
+    """
+    if ANN_INDEX != "hnsw" or ANN_EXACT_FALLBACK: return False
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        count = (await conn.execute(text("SELECT count(*) FROM video_embeddings WHERE video_id = :v"), {"v": video_id})).scalar()
+        if count < ANN_PARTIAL_MIN_CHUNKS: return False
+        name = f"{ANN_INDEX_PREFIX}video_{hashlib.sha256(video_id.encode()).hexdigest()[:16]}"
+        # DDL takes no bind parameters: the dialect renders the value as an escaped literal
+        value = literal(video_id).compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+        await conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON video_embeddings USING hnsw (embedding vector_cosine_ops) "
+            f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}) WHERE video_id = {value}"
+        ))
+    return True
+
+async def apply_ann_settings(db):
+    """Per-transaction search parameters; call right before a vector ORDER BY."""
+    if ANN_EXACT_FALLBACK:
+        # HNSW / IVFFlat only serve plain index scans; with those off the planner takes the
+        # video_id b-tree (bitmap scan) and sorts exactly, so a filtered top-k is never short
+        await db.execute(text("SET LOCAL enable_indexscan = off"))
+        return
+    if ANN_INDEX == "hnsw":
+        await db.execute(text(f"SET LOCAL hnsw.ef_search = {HNSW_EF_SEARCH}"))
+        if ANN_ITERATIVE_SCAN != "off" and PGVECTOR_VERSION >= (0, 8, 0):
+            await db.execute(text(f"SET LOCAL hnsw.iterative_scan = {ANN_ITERATIVE_SCAN}"))
+            await db.execute(text(f"SET LOCAL hnsw.max_scan_tuples = {HNSW_MAX_SCAN_TUPLES}"))
+    elif ANN_INDEX == "ivfflat":
+        await db.execute(text(f"SET LOCAL ivfflat.probes = {IVFFLAT_PROBES}"))
+        if ANN_ITERATIVE_SCAN != "off" and PGVECTOR_VERSION >= (0, 8, 0):
+            await db.execute(text("SET LOCAL ivfflat.iterative_scan = relaxed_order"))
 
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -0,0 +1,35 @@
+import os
+import time
+import asyncio
+
+from starlette.websockets import WebSocketDisconnect
+
+# --- CONFIG ---
+# Per-branch deadlines (seconds). A branch that misses its deadline yields its
+# default instead of holding up the rest of the turn.
+WEB_BRANCH_TIMEOUT = float(os.getenv("WEB_BRANCH_TIMEOUT", "8"))
+LLM_BRANCH_TIMEOUT = float(os.getenv("LLM_BRANCH_TIMEOUT", "30"))
+
+async def run_branch(name, coro, timeout, timings, default=None):
+    """Awaits one branch under a deadline and records {"ms", "status"} into `timings`."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        result = await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        result, status = default, "timeout"
+    except WebSocketDisconnect:
+        raise  # a streaming branch's token sink found the client gone: end the turn, not just the branch
+    except Exception:
+        result, status = default, "error"
+    timings[name] = {"ms": round((time.perf_counter() - start) * 1000, 1), "status": status}
+    return result
+
+async def fan_out(branches, timings):
+    """
+    Runs independent branches concurrently.
+    `branches` maps name -> (coroutine, timeout, default); returns name -> result.
+    """
+    names = list(branches)
+    results = await asyncio.gather(*[run_branch(name, *branches[name], timings) for name in names])
+    return dict(zip(names, results))
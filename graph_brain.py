@@ -1,32 +1,52 @@
 import os
-import json
+import time
 from typing import TypedDict, List, Dict, Any
 from langgraph.graph import StateGraph, END
-from groq import Groq
-from ddgs import DDGS
-import wikipedia
+from langchain_core.runnables import RunnableConfig
+
+from intent_router import local_route, log_decision, ROUTER_MODE, ROUTER_CONFIDENCE_THRESHOLD
+from llm_client import llm, PRIORITY_DRAFT, PRIORITY_ROUTER, PRIORITY_JUDGE, PRIORITY_SUGGESTIONS
+from turn_policy import (decide_judge, heuristic_score, suggestion_mode, decide_suggestions,
+                         InlineFollowups, split_inline_followups, INLINE_SUGGESTION_INSTRUCTION)
+from context_window import count_tokens, truncate_to_tokens
+from fanout import fan_out, run_branch, WEB_BRANCH_TIMEOUT, LLM_BRANCH_TIMEOUT
+from search_gateway import search_gateway
+from telemetry import instrument_node
 
 # --- STATE DEFINITION ---
 class AgentState(TypedDict):
     query: str
     context: str        
     chat_history: List[Dict[str, str]]
+    history_text: str   # packed history (+ rolling summary) from context_window.assemble_context
+    query_vec: List[float]  # query embedding when the caller already computed it
+    router: Dict[str, Any]  # routing decision, confidence and source (local / llm / llm_escalation)
+    retrieval: Dict[str, Any]  # reranker signals from retrieval.rerank_and_format
     next_step: str      
     final_answer: str
     reasoning: str
     suggestions: List[str]
     metadata: Dict[str, Any] 
 
+# Web snippets fed to the search agent's prompt
+WEB_RESULTS_TOKEN_BUDGET = int(os.getenv("WEB_RESULTS_TOKEN_BUDGET", "800"))
+FALLBACK_ANSWER = "Sorry, I couldn't generate an answer in time. Please try again."
+
+# --- TOKEN STREAMING ---
+# The WebSocket handler passes an async `token_sink(text)` through the graph config.
+# Final answers are streamed through it as Groq produces them; without a sink
+# (e.g. offline scripts) the call falls back to a normal completion.
+def get_token_sink(config):
+    return ((config or {}).get("configurable") or {}).get("token_sink")
+
+async def complete_streaming(token_sink, messages, purpose, **kwargs):
+    if not token_sink: return await llm.chat(messages, priority=PRIORITY_DRAFT, purpose=purpose, **kwargs)
+    return await llm.chat_stream(messages, token_sink, priority=PRIORITY_DRAFT, purpose=purpose, **kwargs)
+
 # --- NODES ---
 
-def orchestrator_node(state: AgentState):
-    """
-    ROUTER: Bias towards RAG for Compound Queries.
-    """
-    client = Groq()
-    
-    history = state.get('chat_history', [])
-    history_text = "\n".join([f"{m['role']}: {m['content']}" for m in history[-3:]])
+async def llm_route(query, history_text=""):
+    """The 70B router; returns (decision, thought)."""
     
     # NEW LOGIC: If query is mixed ("Summarize video AND search web"), force RAG.
     # The RAG agent is now smart enough to handle the search part.
@@ -35,7 +55,7 @@ def orchestrator_node(state: AgentState):
     
     Context:
     - History: {history_text}
-    - Query: {state['query']}
+    - Query: {query}
     
     Routing Rules:
     1. 'RAG': (DEFAULT) IF the user mentions "this video", "summary", "transcript", OR asks a mixed question like "Summarize video and find links".
@@ -45,11 +65,7 @@ def orchestrator_node(state: AgentState):
     Return JSON: {{ "thought": "Reasoning...", "decision": "RAG/SEARCH/CHAT" }}
     """
     try:
-        resp = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama-3.3-70b-versatile", response_format={"type": "json_object"}
-        )
-        data = json.loads(resp.choices[0].message.content)
+        data = await llm.chat_json([{"role": "user", "content": prompt}], priority=PRIORITY_ROUTER, purpose="router")
         decision = data.get("decision", "RAG").strip().upper()
         thought = data.get("thought", "Analyzing intent...")
     except:
@@ -59,86 +75,133 @@ def orchestrator_node(state: AgentState):
     if "SEARCH" in decision: decision = "SEARCH"
     elif "CHAT" in decision: decision = "CHAT"
     else: decision = "RAG"
-    
-    return {"next_step": decision, "reasoning": f"Orchestrator: {thought}"}
+    return decision, thought
 
-def rag_agent_node(state: AgentState):
+async def orchestrator_node(state: AgentState):
     """
-    HYBRID RAG AGENT:
-    1. Generates Video Answer.
-    2. (Optional) Performs Web Search if requested in the same query.
-    3. Judges the final result.
+    ROUTER: local exemplar classifier first, 70B LLM only when it is not confident.
+    Bias towards RAG for Compound Queries.
     """
-    client = Groq()
+    query = state['query']
+    route = {"source": "llm"}
+    if ROUTER_MODE != "llm":
+        try: route = {**await local_route(query, state.get('query_vec')), "source": "local"}
+        except Exception: route = {"source": "llm"}
+
+    if route["source"] == "local" and (ROUTER_MODE == "local" or route["confidence"] >= ROUTER_CONFIDENCE_THRESHOLD):
+        decision = route["label"]
+        thought = f"Local router picked {decision} (confidence {route['confidence']:.2f})."
+    else:
+        start = time.perf_counter()
+        decision, thought = await llm_route(query, state.get('history_text', ''))
+        if route["source"] == "local": route = {**route, "local_label": route["label"], "source": "llm_escalation"}
+        route.update({"label": decision, "llm_ms": round((time.perf_counter() - start) * 1000, 1)})
+
+    log_decision(query, route)
+    return {"next_step": decision, "reasoning": f"Orchestrator: {thought}", "router": route}
+
+async def rag_agent_node(state: AgentState, config: RunnableConfig = None):
+    """
+    HYBRID RAG AGENT (concurrent branches):
+    - web:   topic extraction -> web search (only if requested in the query)
+    - draft: video answer (streamed) -> judge (only when the turn policy asks for it)
+    The turn waits for the slower branch, not the sum of both.
+    """
+    signals = state.get('retrieval') or {}
+    followup_mode = suggestion_mode("RAG")
+    inline = InlineFollowups(get_token_sink(config)) if followup_mode == "inline" else None
+    token_sink = inline or get_token_sink(config)
     query = state['query']
     context = state['context']
-    history = state.get('chat_history', [])
-    history_text = "\n".join([f"{m['role'].upper()}: {m['content']}" for m in history[-5:]])
+    history_text = state.get('history_text', '')
+    timings = {}
 
-    # --- STEP 1: CHECK FOR "EXTERNAL SOURCE" INTENT ---
+    # --- BRANCH A: "EXTERNAL SOURCE" INTENT ---
     # Does the user want outside info too?
-    search_results = ""
     keywords_to_trigger_search = ["other sources", "external links", "more info", "search web", "find articles"]
-    
-    if any(k in query.lower() for k in keywords_to_trigger_search):
-        try:
-            # Quick extraction of main topic to search
-            topic_prompt = f"Extract main topic from query for web search: {query}"
-            topic_resp = client.chat.completions.create(messages=[{"role": "user", "content": topic_prompt}], model="llama-3.3-70b-versatile")
-            search_topic = topic_resp.choices[0].message.content.strip()
-            
-            # Perform Search
-            with DDGS() as ddgs:
-                results = ddgs.text(f"{search_topic} tutorial guide", max_results=2)
-                for r in results:
-                    search_results += f"- [{r['title']}]({r['href']})\n"
-        except:
-            search_results = ""
-
-    # --- STEP 2: GENERATE HYBRID ANSWER ---
-    # We feed both Video Context AND Search Results (if any) to the Writer
+    wants_web = any(k in query.lower() for k in keywords_to_trigger_search)
+
+    async def extract_topic():
+        # Quick extraction of main topic to search
+        topic_prompt = f"Extract main topic from query for web search: {query}"
+        topic = await llm.chat([{"role": "user", "content": topic_prompt}], priority=PRIORITY_ROUTER, purpose="web_topic")
+        return topic.strip()
+
+    async def web_branch():
+        search_topic = await run_branch("topic", extract_topic(), LLM_BRANCH_TIMEOUT, timings, default=query)
+        results = await run_branch("web_search", search_gateway.search("web", f"{search_topic} tutorial guide", 2), WEB_BRANCH_TIMEOUT, timings, default=[])
+        return "".join(f"- [{r['title']}]({r['href']})\n" for r in results)
+
+    # --- BRANCH B: VIDEO ANSWER, THEN JUDGE ---
     system_prompt = f"""
     You are an expert tutor. Answer based on the Video Context.
     
     VIDEO CONTEXT:
     {context}
     
-    EXTERNAL WEB RESULTS (If requested):
-    {search_results}
+    CONVERSATION SO FAR:
+    {history_text}
     
     INSTRUCTIONS:
-    1. Primary: Summarize/Answer using the Video Context. Cite timestamps {{MM:SS}}.
-    2. Secondary: If 'EXTERNAL WEB RESULTS' are present, append them at the end under a "📚 External Resources" section.
-    3. If the answer is not in the video, say so.
+    1. Summarize/Answer using the Video Context. Cite timestamps {{MM:SS}}; when the context spans several videos, also name the video.
+    2. If the answer is not in the video, say so.
+    {INLINE_SUGGESTION_INSTRUCTION if inline else ""}
     """
-    
-    draft_resp = client.chat.completions.create(
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query}
-        ],
-        model="llama-3.3-70b-versatile"
-    )
-    draft = draft_resp.choices[0].message.content
-    
-    # --- STEP 3: JUDGE ---
-    judge_prompt = f"""
-    Quality Control.
-    Query: {query}
-    Answer: {draft}
-    
-    Return JSON: {{ "thought": "Evaluation...", "score": 85 }}
-    """
-    try:
-        j_resp = client.chat.completions.create(
-            messages=[{"role": "user", "content": judge_prompt}],
-            model="llama-3.3-70b-versatile", response_format={"type": "json_object"}
+
+    async def write_draft():
+        return await complete_streaming(
+            token_sink,
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": query}
+            ],
+            purpose="rag_draft"
         )
-        data = json.loads(j_resp.choices[0].message.content)
+
+    async def judge(draft):
+        judge_prompt = f"""
+        Quality Control.
+        Query: {query}
+        Answer: {draft}
+        
+        Return JSON: {{ "thought": "Evaluation...", "score": 85 }}
+        """
+        data = await llm.chat_json([{"role": "user", "content": judge_prompt}], priority=PRIORITY_JUDGE, purpose="judge")
         score = data.get("score", 0)
-        thought = data.get("thought", f"Quality check passed with score {score}.")
-    except:
-        score, thought = 0, "Evaluation error."
+        return score, data.get("thought", f"Quality check passed with score {score}.")
+
+    policy = {}
+    inline_suggestions = []
+
+    async def draft_branch():
+        nonlocal inline_suggestions
+        draft = await run_branch("draft", write_draft(), LLM_BRANCH_TIMEOUT, timings, default="")
+        if inline:
+            await inline.flush()
+            draft, inline_suggestions = split_inline_followups(draft)
+        if not draft: return FALLBACK_ANSWER, (0, "Draft unavailable.")
+        policy["judge"] = decide_judge(signals, draft)
+        if not policy["judge"]["run"]:
+            score = heuristic_score(signals, draft)
+            return draft, (score, f"Skipped ({policy['judge']['reason']}), heuristic score {score}.")
+        verdict = await run_branch("judge", judge(draft), LLM_BRANCH_TIMEOUT, timings, default=(0, "Evaluation error."))
+        return draft, verdict
+
+    branches = {"answer": (draft_branch(), 2 * LLM_BRANCH_TIMEOUT, None)}
+    if wants_web: branches["web"] = (web_branch(), LLM_BRANCH_TIMEOUT + WEB_BRANCH_TIMEOUT, "")
+    results = await fan_out(branches, timings)
+
+    draft, (score, thought) = results["answer"] or (FALLBACK_ANSWER, (0, "Evaluation error."))
+    search_results = results.get("web") or ""
+    # Only a complete, video-grounded answer may be reused for other users: no fallback
+    # text, no failed/timed-out judge, no live web results mixed in
+    cacheable = results["answer"] is not None and not search_results and draft != FALLBACK_ANSWER\
+                and all(timings.get(b, {}).get("status", "ok") == "ok" for b in ("answer", "draft", "judge"))
+    if search_results:
+        resources_section = f"\n\n📚 External Resources\n{search_results}"
+        if get_token_sink(config): await get_token_sink(config)(resources_section)
+        draft += resources_section
+    policy["suggestions"] = decide_suggestions(followup_mode, "RAG", draft, inline_suggestions)
 
     # If we did a search, mention it in the reasoning
     final_reasoning = f"Judge: {thought}"
@@ -148,78 +211,82 @@ def rag_agent_node(state: AgentState):
     return {
         "final_answer": draft, 
         "reasoning": final_reasoning,
-        "metadata": {"score": score, "reason": "Hybrid RAG Execution"} 
+        "suggestions": inline_suggestions,
+        "metadata": {"score": score, "reason": "Hybrid RAG Execution", "branches": timings, "policy": policy, "cacheable": cacheable} 
     }
 
-def search_agent_node(state: AgentState):
+async def search_agent_node(state: AgentState, config: RunnableConfig = None):
     """Fallback Search Agent (Only for purely non-video queries)"""
-    client = Groq()
     query = state['query']
+    timings = {}
     
-    # Deep Thought Plan
-    plan_prompt = f"User Query: {query}. Plan search keywords."
-    try:
-        plan_resp = client.chat.completions.create(messages=[{"role": "user", "content": plan_prompt}], model="llama-3.3-70b-versatile")
-        search_thought = plan_resp.choices[0].message.content
-    except: search_thought = "Planning search..."
-    
-    results_text = ""
-    try:
-        with DDGS() as ddgs:
-            for r in ddgs.text(query, max_results=3): results_text += f"{r['title']}: {r['body']}\n"
-    except: pass
-    
-    if not results_text:
-        try:
-            page = wikipedia.summary(query, sentences=3)
-            results_text += f"Source: Wikipedia\nSnippet: {page}"
-        except: results_text = "No sources found."
+    # Deep Thought Plan (runs alongside the lookups, it only feeds the reasoning)
+    async def plan():
+        plan_prompt = f"User Query: {query}. Plan search keywords."
+        return await llm.chat([{"role": "user", "content": plan_prompt}], priority=PRIORITY_ROUTER, purpose="search_plan")
+
+    async def lookup():
+        results = await run_branch("web_search", search_gateway.search("web", query, 3), WEB_BRANCH_TIMEOUT, timings, default=[])
+        results_text = "".join(f"{r['title']}: {r['body']}\n" for r in results)
+        if not results_text:
+            pages = await run_branch("wikipedia", search_gateway.search("wikipedia", query, 1), WEB_BRANCH_TIMEOUT, timings, default=[])
+            results_text = f"Source: Wikipedia\nSnippet: {pages[0]['body']}" if pages else "No sources found."
+        return results_text
+
+    results = await fan_out({
+        "plan": (plan(), LLM_BRANCH_TIMEOUT, "Planning search..."),
+        "lookup": (lookup(), 2 * WEB_BRANCH_TIMEOUT, "No sources found."),
+    }, timings)
+    search_thought, results_text = results["plan"], truncate_to_tokens(results["lookup"], WEB_RESULTS_TOKEN_BUDGET)
         
     prompt = f"Answer using results. Format links [Title](URL).\n\nQ: {query}\n\nInfo:\n{results_text}"
-    resp = client.chat.completions.create(messages=[{"role": "user", "content": prompt}], model="llama-3.3-70b-versatile")
+    answer = await complete_streaming(get_token_sink(config), [{"role": "user", "content": prompt}], purpose="search_answer")
     
     return {
-        "final_answer": resp.choices[0].message.content, 
+        "final_answer": answer, 
         "reasoning": f"Searcher: {search_thought}",
-        "metadata": {"score": 100, "reason": "External Web Source"}
+        "metadata": {"score": 100, "reason": "External Web Source", "branches": timings, "tokens": {"web": count_tokens(results_text)}}
     }
 
-def chat_agent_node(state: AgentState):
+async def chat_agent_node(state: AgentState, config: RunnableConfig = None):
     """CHIT CHAT"""
-    client = Groq()
-    resp = client.chat.completions.create(messages=[{"role": "user", "content": state['query']}], model="llama-3.3-70b-versatile")
+    answer = await complete_streaming(get_token_sink(config), [{"role": "user", "content": state['query']}], purpose="chat_answer")
     return {
-        "final_answer": resp.choices[0].message.content, 
+        "final_answer": answer, 
         "reasoning": "Conversational Agent: Generating friendly response...",
         "metadata": {"score": 100, "reason": "General Conversation"}
     }
 
-def suggestion_node(state: AgentState):
-    client = Groq()
+async def suggestion_node(state: AgentState):
+    # Agents record their decision in metadata['policy']; others are decided here
+    metadata = state.get('metadata') or {}
+    policy = metadata.get('policy', {}).get('suggestions')
+    if policy is None:
+        route = state.get('next_step', '')
+        policy = decide_suggestions(suggestion_mode(route), route, state.get('final_answer', ''))
+        metadata = {**metadata, "policy": {**metadata.get('policy', {}), "suggestions": policy}}
+    if not policy["run"]: return {"metadata": metadata}
+
     prompt = f"""
     Based on this answer, suggest 3 short follow-up questions.
     Return JSON: {{ "questions": ["Q1", "Q2", "Q3"] }}
     Answer: {state['final_answer'][:1000]}
     """
     try:
-        resp = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}], 
-            model="llama-3.3-70b-versatile", response_format={"type": "json_object"}
-        )
-        data = json.loads(resp.choices[0].message.content)
+        data = await llm.chat_json([{"role": "user", "content": prompt}], priority=PRIORITY_SUGGESTIONS, purpose="suggestions")
         suggestions = data.get("questions", [])
     except:
         suggestions = []
         
-    return {"suggestions": suggestions}
+    return {"suggestions": suggestions, "metadata": metadata}
 
 # --- GRAPH CONSTRUCTION ---
 workflow = StateGraph(AgentState)
-workflow.add_node("orchestrator", orchestrator_node)
-workflow.add_node("rag_agent", rag_agent_node)
-workflow.add_node("search_agent", search_agent_node)
-workflow.add_node("chat_agent", chat_agent_node)
-workflow.add_node("suggestion_engine", suggestion_node)
+workflow.add_node("orchestrator", instrument_node("orchestrator", orchestrator_node))
+workflow.add_node("rag_agent", instrument_node("rag_agent", rag_agent_node))
+workflow.add_node("search_agent", instrument_node("search_agent", search_agent_node))
+workflow.add_node("chat_agent", instrument_node("chat_agent", chat_agent_node))
+workflow.add_node("suggestion_engine", instrument_node("suggestion_engine", suggestion_node))
 
 workflow.set_entry_point("orchestrator")
 
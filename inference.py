@@ -0,0 +1,281 @@
+import os
+import math
+import time
+import asyncio
+import resource
+import functools
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from memo import memo, query_key
+from batching import MicroBatcher
+
+# --- CONFIG ---
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", "2"))  # concurrent query-time forward passes
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "local").lower()        # local | remote (shared model_server.py)
+MODEL_SERVER_URL = os.getenv("MODEL_SERVER_URL", "http://localhost:8100")
+MODEL_SERVER_TIMEOUT = float(os.getenv("MODEL_SERVER_TIMEOUT", "30"))
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "background").lower()     # background | blocking | lazy
+MODEL_WARMUP_RETRY_MAX = float(os.getenv("MODEL_WARMUP_RETRY_MAX", "60"))  # backoff cap (s) between failed warm-up attempts
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()  # torch | onnx | onnx-int8
+# int8 dynamic-quantized exports published next to both models on the HF hub
+ONNX_INT8_FILE = os.getenv("ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))        # intra-op threads per forward pass; 0 = from CPU quota
+# Concurrent chat turns share forward passes: a batch closes after the window or at the size cap
+INFERENCE_BATCHING = os.getenv("INFERENCE_BATCHING", "on").lower() == "on"
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "3"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))     # query texts per forward pass
+RERANK_MAX_BATCH = int(os.getenv("RERANK_MAX_BATCH", "64"))   # (query, chunk) pairs per forward pass
+
+# Model forward passes are CPU-heavy, so they run in their own pool instead of
+# the default executor shared with everything else.
+ingest_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+# Query-time inference (chat turns) gets a separate pool so a long ingestion
+# cannot starve interactive requests. Its size is the concurrency limit.
+inference_pool = ThreadPoolExecutor(max_workers=INFERENCE_CONCURRENCY, thread_name_prefix="inference")
+
+PROCESS_STARTED = time.time()
+
+def rss_mb():
+    """Current resident set size; peak RSS where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def cpu_quota():
+    """CPUs this container may use: cgroup v2 cpu.max, then cgroup v1 CFS quota, then affinity."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max": return int(quota) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f: quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f: period = int(f.read())
+            if quota > 0: return quota / period
+        except (OSError, ValueError):
+            pass
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+def inference_threads():
+    """
+    Threads per forward pass. Up to INFERENCE_CONCURRENCY passes run at once, so the
+    quota is split between them; more threads than the quota only adds throttling.
+    """
+    if INFERENCE_THREADS > 0: return INFERENCE_THREADS
+    return max(1, math.floor(cpu_quota()) // INFERENCE_CONCURRENCY)
+
+def engine_kwargs(engine, threads):
+    """sentence-transformers constructor kwargs for the torch / ONNX Runtime engines."""
+    if engine == "torch":
+        import torch
+        torch.set_num_threads(threads)
+        return {}
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return {"backend": "onnx", "model_kwargs": {
+        "file_name": ONNX_INT8_FILE if engine == "onnx-int8" else "onnx/model.onnx",
+        "provider": "CPUExecutionProvider", "session_options": options,
+    }}
+
+# --- MODEL RUNTIMES ---
+# Both runtimes expose the same blocking API (embed_documents, embed_query, predict)
+# and are called from the ingest / inference pools.
+class LocalModels:
+    """Loads MiniLM and the cross-encoder into this process on first use."""
+    backend = "local"
+
+    def __init__(self, embed_model=EMBED_MODEL, rerank_model=RERANK_MODEL, engine=INFERENCE_BACKEND, threads=None):
+        self.embed_model, self.rerank_model = embed_model, rerank_model
+        self.engine = engine
+        self.threads = threads or inference_threads()
+        self._embedder = None
+        self._reranker = None
+        self._lock = threading.Lock()
+        self.load_ms = {}
+
+    def _load(self, name, factory):
+        start = time.perf_counter()
+        model = factory()
+        self.load_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+        print(f"✅ Loaded {name} ({self.engine}, {self.threads} threads) in {self.load_ms[name] / 1000:.1f}s")
+        return model
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            with self._lock:
+                if self._embedder is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    self._embedder = self._load("embedder", lambda: HuggingFaceEmbeddings(
+                        model_name=self.embed_model, model_kwargs=engine_kwargs(self.engine, self.threads)))
+        return self._embedder
+
+    @property
+    def reranker(self):
+        if self._reranker is None:
+            with self._lock:
+                if self._reranker is None:
+                    from sentence_transformers import CrossEncoder
+                    self._reranker = self._load("reranker", lambda: CrossEncoder(self.rerank_model, **engine_kwargs(self.engine, self.threads)))
+        return self._reranker
+
+    @property
+    def loaded(self):
+        return self._embedder is not None and self._reranker is not None
+
+    def load(self):
+        _ = self.embedder
+        _ = self.reranker
+
+    def embed_documents(self, texts):
+        return self.embedder.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embedder.embed_query(text)
+
+    def predict(self, pairs):
+        return [float(s) for s in self.reranker.predict(pairs)]
+
+class RemoteModels:
+    """Client for model_server.py, so every worker shares one copy of the weights."""
+    backend = "remote"
+
+    def __init__(self, url=MODEL_SERVER_URL, timeout=MODEL_SERVER_TIMEOUT):
+        import httpx
+        self.url = url.rstrip("/")
+        self.http = httpx.Client(timeout=timeout, limits=httpx.Limits(max_connections=INGEST_WORKERS + INFERENCE_CONCURRENCY))
+        self.load_ms = {}
+        self.loaded = False  # set once the server has answered
+
+    def _post(self, path, payload):
+        resp = self.http.post(f"{self.url}{path}", json=payload)
+        resp.raise_for_status()
+        self.loaded = True
+        return resp.json()
+
+    def load(self, wait=MODEL_SERVER_TIMEOUT):
+        """Waits for the server to report ready (it may still be loading)."""
+        start = time.perf_counter()
+        while True:
+            try:
+                if self.http.get(f"{self.url}/ready").status_code == 200: break
+            except Exception:
+                pass
+            if time.perf_counter() - start > wait: raise RuntimeError(f"model server at {self.url} not ready after {wait}s")
+            time.sleep(0.5)
+        self.loaded = True
+        self.load_ms["server_wait"] = round((time.perf_counter() - start) * 1000, 1)
+
+    def embed_documents(self, texts):
+        return self._post("/embed", {"texts": texts})["vectors"]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def predict(self, pairs):
+        return self._post("/rerank", {"pairs": [list(p) for p in pairs]})["scores"]
+
+models = RemoteModels() if MODEL_BACKEND == "remote" else LocalModels()
+
+# --- WARM-UP / READINESS ---
+runtime = {"backend": models.backend, "warm": False, "warmup_ms": None, "ready_after_s": None, "error": None}
+
+def _warm_up_sync():
+    models.load()
+    # One tiny forward pass each so the first user request does not pay for allocation
+    models.embed_documents(["warm up"])
+    models.predict([["warm up", "warm up"]])
+
+def _mark_warm(warmup_ms=None):
+    runtime.update({"warm": True, "error": None, "warmup_ms": warmup_ms, "ready_after_s": round(time.time() - PROCESS_STARTED, 2)})
+
+async def warm_up(retry=False):
+    """
+    Loads (or connects to) both models and runs one forward pass; safe to call twice.
+    With `retry`, a failed attempt (e.g. the model server still starting) is retried
+    with exponential backoff until one succeeds.
+    """
+    delay = 1.0
+    while not runtime["warm"]:
+        start = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(inference_pool, _warm_up_sync)
+        except Exception as e:
+            runtime["error"] = str(e)
+            print(f"⚠️ Model warm-up failed: {e}")
+            if not retry: return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MODEL_WARMUP_RETRY_MAX)
+            continue
+        _mark_warm(round((time.perf_counter() - start) * 1000, 1))
+
+def is_ready():
+    # Models that finished loading on first use (MODEL_WARMUP=lazy) count as warm too
+    if not runtime["warm"] and models.loaded: _mark_warm()
+    return runtime["warm"]
+
+def runtime_stats():
+    return {**runtime, "pid": os.getpid(), "rss_mb": rss_mb(), "load_ms": dict(models.load_ms),
+            "engine": getattr(models, "engine", None), "threads": getattr(models, "threads", None), "cpu_quota": cpu_quota(),
+            "batching": INFERENCE_BATCHING, "batchers": {"embed": embed_batcher.stats(), "rerank": rerank_batcher.stats()}}
+
+def make_batches(items, size=EMBED_BATCH_SIZE):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+async def embed_in_batches(embedder, texts, batch_size=EMBED_BATCH_SIZE):
+    """
+    Encodes texts through `embed_documents` in fixed-size batches on the ingest pool.
+    Order of the returned vectors matches the order of `texts`.
+    """
+    if not texts: return []
+    loop = asyncio.get_running_loop()
+    jobs = [loop.run_in_executor(ingest_pool, embedder.embed_documents, batch) for batch in make_batches(texts, batch_size)]
+    results = await asyncio.gather(*jobs)
+    return [vec for batch in results for vec in batch]
+
+# --- QUERY-TIME HELPERS ---
+async def run_inference(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_pool, functools.partial(fn, *args, **kwargs))
+
+embed_batcher = MicroBatcher(models.embed_documents, EMBED_MAX_BATCH, BATCH_WINDOW_MS,
+                             executor=inference_pool, concurrency=INFERENCE_CONCURRENCY, name="embed")
+rerank_batcher = MicroBatcher(models.predict, RERANK_MAX_BATCH, BATCH_WINDOW_MS,
+                              executor=inference_pool, concurrency=INFERENCE_CONCURRENCY, name="rerank")
+
+async def embed_query(text):
+    key = query_key(text)
+    cached = memo.get("qvec", key)
+    if cached is not None: return cached.tolist()
+    if INFERENCE_BATCHING: vector = (await embed_batcher.submit([text]))[0]
+    else: vector = await run_inference(models.embed_query, text)
+    memo.put("qvec", key, value=np.asarray(vector, dtype=np.float32))
+    return vector
+
+async def rerank(query, chunks):
+    """
+    Cross-encoder scores for (query, chunk) pairs; `chunks` is a list of (chunk_id, text).
+    Pairs scored recently are served from the memo, only the rest hit the model
+    (batched with other turns' pairs when INFERENCE_BATCHING is on).
+    """
+    key = query_key(query)
+    scores = [memo.get("rerank", key, chunk_id) for chunk_id, _ in chunks]
+    missing = [i for i, score in enumerate(scores) if score is None]
+    if missing:
+        pairs = [[query, chunks[i][1]] for i in missing]
+        fresh = await (rerank_batcher.submit(pairs) if INFERENCE_BATCHING else run_inference(models.predict, pairs))
+        for i, score in zip(missing, fresh):
+            scores[i] = float(score)
+            memo.put("rerank", key, chunks[i][0], value=scores[i])
+    return scores
@@ -0,0 +1,215 @@
+import os
+import asyncio
+import hashlib
+from collections import deque
+from sqlalchemy.future import select
+from sqlalchemy import insert
+
+# --- MODULES ---
+from database import AsyncSessionLocal, VideoEmbedding, IngestionCache, ensure_video_ann_index
+from inference import models, embed_in_batches
+from retrieval import vector_store
+from search_gateway import search_gateway
+from shared_state import shared_state
+from llm_client import llm, PRIORITY_BACKGROUND
+from fanout import fan_out, run_branch, WEB_BRANCH_TIMEOUT, LLM_BRANCH_TIMEOUT
+
+# --- LIBRARIES ---
+from youtube_transcript_api import YouTubeTranscriptApi
+
+# --- CONFIG ---
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))        # characters per chunk
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))   # characters of trailing segments repeated in the next chunk
+
+# Order in which a job reports progress
+STAGES = ["fetch", "chunk", "embed", "store", "resources"]
+
+class IngestionError(Exception):
+    pass
+
+async def _noop_report(stage, status, **info): pass
+
+# --- PIPELINE STAGES ---
+def _fetch_segments_sync(video_id):
+    # youtube-transcript-api < 1.0 exposes a static get_transcript, >= 1.0 an instance fetch()
+    if hasattr(YouTubeTranscriptApi, "get_transcript"):
+        return YouTubeTranscriptApi.get_transcript(video_id)
+    return YouTubeTranscriptApi().fetch(video_id).to_raw_data()
+
+async def fetch_segments(video_id):
+    """Caption segments as [{"text", "start", "duration"}, ...] with the real offsets."""
+    try: return await asyncio.to_thread(_fetch_segments_sync, video_id)
+    except Exception as e: raise IngestionError(f"Error: {str(e)}")
+
+def chunk_segments(segments, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Streaming chunker: builds each chunk from whole caption segments and yields
+    {"content", "start_time", "end_time"} taken from the first/last segment.
+    Trailing segments (up to `chunk_overlap` chars) are carried into the next chunk.
+    Every segment is appended and popped at most once, so the pass is linear.
+    """
+    window = deque()  # (text, start, end)
+    size = 0
+    for seg in segments:
+        text = " ".join(seg["text"].split())
+        if not text: continue
+        start = float(seg["start"])
+        end = start + float(seg.get("duration") or 0)
+
+        if window and size + len(text) > chunk_size:
+            yield {"content": " ".join(t for t, _, _ in window), "start_time": int(window[0][1]), "end_time": int(window[-1][2])}
+            while window and size > chunk_overlap:
+                size -= len(window.popleft()[0]) + 1
+        window.append((text, start, end))
+        size += len(text) + 1
+
+    if window:
+        yield {"content": " ".join(t for t, _, _ in window), "start_time": int(window[0][1]), "end_time": int(window[-1][2])}
+
+def transcript_sample(segments, max_chars=1000):
+    """Opening of the transcript without joining the whole thing."""
+    parts, size = [], 0
+    for seg in segments:
+        if size >= max_chars: break
+        parts.append(seg["text"])
+        size += len(seg["text"]) + 1
+    return " ".join(parts)[:max_chars]
+
+async def generate_resources_on_load(text_sample):
+    """topic -> {YouTube lookup, blog lookup}; the two lookups run concurrently."""
+    timings = {}
+
+    async def extract_topic():
+        topic = await llm.chat([{"role": "user", "content": f"Extract TOPIC (3 words). Transcript: {text_sample[:1000]}."}], priority=PRIORITY_BACKGROUND, purpose="resource_topic")
+        return topic.strip().replace('"', '')
+
+    async def find_videos(topic):
+        yt_results = await search_gateway.search("youtube", f"{topic} tutorial", 3)
+        return [{"title": v['title'], "link": v['href']} for v in yt_results]
+
+    async def find_blogs(topic):
+        b_results = await search_gateway.search("web", f"{topic} tutorial (site:medium.com OR site:dev.to) -site:youtube.com", 4)
+        return [{"title": r['title'], "link": r['href']} for r in b_results if "youtube" not in r['href']]
+
+    topic = await run_branch("topic", extract_topic(), LLM_BRANCH_TIMEOUT, timings, default="General") or "General"
+    results = await fan_out({
+        "videos": (find_videos(topic), WEB_BRANCH_TIMEOUT, []),
+        "blogs": (find_blogs(topic), WEB_BRANCH_TIMEOUT, []),
+    }, timings)
+    return {"topic": topic, "videos": results["videos"], "blogs": results["blogs"], "timings": timings}
+
+# --- INGESTION CACHE (content-addressed) ---
+def sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def transcript_hash(segments):
+    h = hashlib.sha256()
+    for seg in segments: h.update(" ".join(seg["text"].split()).encode("utf-8") + b"\n")
+    return h.hexdigest()
+
+async def load_cache_entry(video_id):
+    async with AsyncSessionLocal() as db:
+        return await db.get(IngestionCache, video_id)
+
+async def save_cache_entry(video_id, **fields):
+    async with AsyncSessionLocal() as db:
+        entry = await db.get(IngestionCache, video_id)
+        if entry is None:
+            entry = IngestionCache(video_id=video_id)
+            db.add(entry)
+        for key, value in fields.items(): setattr(entry, key, value)
+        await db.commit()
+
+async def cached_recommendations(entry):
+    """Recommendations for this video, or for any other video with the identical transcript."""
+    if entry.recommendations: return entry.recommendations
+    async with AsyncSessionLocal() as db:
+        stmt = select(IngestionCache.recommendations)\
+               .where(IngestionCache.content_hash == entry.content_hash, IngestionCache.recommendations.is_not(None))\
+               .limit(1)
+        return (await db.execute(stmt)).scalars().first()
+
+async def reusable_embeddings(db, hashes):
+    """content_hash -> embedding for chunks already embedded under any video."""
+    if not hashes: return {}
+    stmt = select(VideoEmbedding.content_hash, VideoEmbedding.embedding)\
+           .where(VideoEmbedding.content_hash.in_(hashes)).distinct(VideoEmbedding.content_hash)
+    return {h: vec for h, vec in (await db.execute(stmt)).all()}
+
+async def index_transcript(segments, video_id, report):
+    # Three short sessions: no pooled connection sits idle in a transaction while the
+    # CPU-bound embedding runs
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(VideoEmbedding.id).where(VideoEmbedding.video_id == video_id).limit(1))
+        if result.scalars().first() is not None:
+            for stage in ("chunk", "embed", "store"): await report(stage, "skipped")
+            return
+
+    await report("chunk", "running")
+    chunks = list(chunk_segments(segments))
+    for chunk in chunks: chunk["content_hash"] = sha256(chunk["content"])
+    await report("chunk", "done", chunks=len(chunks))
+
+    # Identical chunk text (reuploads, shared intros/outros) reuses the stored vector;
+    # the rest goes through batched forward passes off the event loop
+    await report("embed", "running", chunks=len(chunks))
+    async with AsyncSessionLocal() as db:
+        known = await reusable_embeddings(db, list({c["content_hash"] for c in chunks}))
+    pending = list({c["content_hash"]: c["content"] for c in chunks if c["content_hash"] not in known}.items())
+    fresh = await embed_in_batches(models, [content for _, content in pending])
+    known.update({h: vec for (h, _), vec in zip(pending, fresh)})
+    await report("embed", "done", chunks=len(chunks), embedded=len(pending), reused=len(chunks) - len(pending))
+
+    # Single bulk INSERT
+    await report("store", "running")
+    rows = [{"video_id": video_id, "embedding": known[c["content_hash"]], **c} for c in chunks]
+    async with AsyncSessionLocal() as db:
+        if rows: await db.execute(insert(VideoEmbedding), rows)
+        await db.commit()
+    partial_index = await ensure_video_ann_index(video_id)
+    vector_store.invalidate(video_id)
+    await shared_state.publish("videos:invalidate", video_id)  # other workers drop their copy too
+    await report("store", "done", rows=len(rows), partial_index=partial_index)
+    return [c["content_hash"] for c in chunks]
+
+async def run_pipeline(url, video_id, report=_noop_report):
+    """
+    Full ingestion for one video: fetch, then {chunk -> embed -> store} alongside resources.
+    The resource lookup only needs the transcript, so it overlaps the indexing work.
+    `report(stage, status, **info)` is awaited at every stage transition.
+    """
+    # A known video is served from the ingestion cache: no transcript fetch, no LLM/search calls
+    await report("fetch", "running")
+    entry = await load_cache_entry(video_id)
+    if entry is not None:
+        segments = entry.segments
+        await report("fetch", "cached", segments=len(segments))
+    else:
+        segments = await fetch_segments(video_id)
+        entry = IngestionCache(video_id=video_id, content_hash=transcript_hash(segments), segments=segments)
+        await save_cache_entry(video_id, content_hash=entry.content_hash, segments=segments)
+        await report("fetch", "done", segments=len(segments))
+
+    async def resources_stage():
+        await report("resources", "running")
+        resources = await cached_recommendations(entry)
+        if resources:
+            await report("resources", "cached")
+            return resources
+        resources = await generate_resources_on_load(transcript_sample(segments))
+        # Cached for good and shared by content hash, so a degraded result ("General" after an
+        # LLM failure, empty lists after a search failure) is served but never stored
+        if all(t["status"] == "ok" for t in resources["timings"].values()):
+            await save_cache_entry(video_id, recommendations=resources)
+        await report("resources", "done", **resources["timings"])
+        return resources
+
+    resources_task = asyncio.create_task(resources_stage())
+    try:
+        chunk_hashes = await index_transcript(segments, video_id, report)
+    except BaseException:
+        resources_task.cancel()
+        raise
+    resources = await resources_task
+    if chunk_hashes: await save_cache_entry(video_id, chunk_hashes=chunk_hashes)
+    return {"status": "success", "message": "Processed!", "recommendations": resources}
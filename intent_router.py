@@ -0,0 +1,76 @@
+import os
+import time
+
+import numpy as np
+
+from inference import models, embed_query, run_inference
+from telemetry import telemetry
+
+# --- CONFIG ---
+ROUTER_MODE = os.getenv("ROUTER_MODE", "hybrid").lower()                   # hybrid | local | llm
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.08"))
+ROUTER_TOP_K = 3  # exemplars averaged per label
+
+# Labeled exemplars, embedded once with the shared MiniLM model.
+# Phrasing matters more than topic: SEARCH is "outside the video", RAG is "about the video".
+EXEMPLARS = {
+    "RAG": [
+        "summarize this video", "give me a summary of the lecture", "what is this video about",
+        "explain the part about recursion", "what did he say at the start", "what are the key points",
+        "explain the example from the transcript", "what does the speaker mean by gradient descent",
+        "summarize the video and find related articles", "list the main steps shown in the tutorial",
+        "what was the conclusion", "explain that again in simpler words", "what timestamp talks about loops",
+        "can you give me notes for this lecture", "what tools does the video use",
+    ],
+    "SEARCH": [
+        "what is the latest news about openai", "current events in technology today",
+        "who won the match yesterday", "what is the stock price of nvidia right now",
+        "latest version of python released", "search the web for react 19 release date",
+        "what happened in the news this week", "weather in london today",
+        "recent developments in quantum computing 2025", "who is the current ceo of twitter",
+    ],
+    "CHAT": [
+        "hi", "hello there", "hey how are you", "thanks", "thank you so much", "good morning",
+        "who are you", "ok cool", "bye", "nice, that helps", "you are awesome", "lol",
+    ],
+}
+
+_exemplar_matrix = None
+_exemplar_labels = None
+
+async def _load_exemplars():
+    global _exemplar_matrix, _exemplar_labels
+    if _exemplar_matrix is None:
+        labels = [label for label, texts in EXEMPLARS.items() for _ in texts]
+        texts = [t for texts in EXEMPLARS.values() for t in texts]
+        matrix = np.asarray(await run_inference(models.embed_documents, texts), dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        _exemplar_matrix, _exemplar_labels = matrix, np.array(labels)
+    return _exemplar_matrix, _exemplar_labels
+
+async def local_route(query, query_vec=None):
+    """
+    Nearest-exemplar classifier: score per label = mean of its top-k cosine similarities.
+    Confidence is the margin between the best and second-best label.
+    """
+    start = time.perf_counter()
+    matrix, labels = await _load_exemplars()
+    if query_vec is None: query_vec = await embed_query(query)
+    q = np.asarray(query_vec, dtype=np.float32)
+    q /= (np.linalg.norm(q) or 1.0)
+    sims = matrix @ q
+
+    scores = {}
+    for label in EXEMPLARS:
+        label_sims = np.sort(sims[labels == label])[::-1][:ROUTER_TOP_K]
+        scores[label] = float(label_sims.mean())
+    ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    return {
+        "label": ranked[0][0], "confidence": round(ranked[0][1] - ranked[1][1], 4),
+        "scores": {k: round(v, 4) for k, v in scores.items()},
+        "ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+def log_decision(query, route):
+    # Counted only: the full decision already travels with the turn (metadata["router"] -> telemetry)
+    telemetry.count("router", f"{route['source']}:{route['label']}")
@@ -0,0 +1,151 @@
+import os
+import time
+import uuid
+import asyncio
+
+from ingestion import STAGES, run_pipeline
+from shared_state import shared_state, SubscriptionLost
+from telemetry import telemetry
+
+# --- CONFIG ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_ACTIVE_TTL = int(os.getenv("JOB_ACTIVE_TTL", "900"))         # an in-flight job not heard from in this long is presumed lost
+JOB_RETENTION_TTL = int(os.getenv("JOB_RETENTION_TTL", "3600"))  # seconds finished jobs stay available for polling
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "15"))   # followers re-read the snapshot when pub/sub is quiet or lost
+
+TERMINAL = ("done", "failed")
+
+class Job:
+    def __init__(self, url, video_id):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.video_id = video_id
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stages = {stage: "pending" for stage in STAGES}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.queued_at = time.perf_counter()
+        self.updated_at = self.created_at
+
+    def snapshot(self):
+        return {
+            "job_id": self.id, "video_id": self.video_id, "status": self.status,
+            "stages": dict(self.stages), "result": self.result, "error": self.error,
+            "created_at": self.created_at, "updated_at": self.updated_at,
+        }
+
+class JobManager:
+    """
+    Bounded pool of ingestion workers fed by a queue.
+    Job status lives in shared state (`jobs:<id>`) and progress is published on the
+    `jobs:<id>` channel, so any worker can answer a poll or stream a job another
+    worker is running. Submitting a video that already has a job in flight anywhere
+    returns that job instead (`jobs:active:<video_id>` is claimed with set-if-absent).
+    """
+    def __init__(self, runner=run_pipeline, workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE,
+                 active_ttl=JOB_ACTIVE_TTL, retention_ttl=JOB_RETENTION_TTL):
+        self.runner = runner
+        self.workers = workers
+        self.active_ttl = active_ttl
+        self.retention_ttl = retention_ttl
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks = []
+
+    async def start(self):
+        if self._tasks: return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for t in self._tasks: t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, url, video_id):
+        """Returns (snapshot, created). Raises asyncio.QueueFull when this worker's backlog is full."""
+        active_key = f"jobs:active:{video_id}"
+        job = Job(url, video_id)
+        # The snapshot is written before the claim, so a claim always points at a readable job
+        await self._save(job)
+        while not await shared_state.set_if_absent(active_key, job.id, ttl=self.active_ttl):
+            holder = await shared_state.get(active_key)
+            existing = await self.get(holder) if holder else None
+            if existing and existing["status"] not in TERMINAL:
+                await shared_state.delete(f"jobs:{job.id}")
+                return existing, False
+            # Stale claim (its job finished or expired): removed only if it is still that one,
+            # so a claim another worker just took is left alone
+            if holder: await shared_state.delete_if_value(active_key, holder)
+
+        try: self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            await shared_state.delete_if_value(active_key, job.id)
+            await shared_state.delete(f"jobs:{job.id}")
+            raise
+        return job.snapshot(), True
+
+    async def get(self, job_id):
+        return await shared_state.get(f"jobs:{job_id}")
+
+    async def subscribe(self, job_id):
+        """Progress events for a job, wherever it runs; subscribe before reading the snapshot."""
+        return await shared_state.subscribe(f"jobs:{job_id}")
+
+    async def wait(self, job_id, poll=JOB_POLL_INTERVAL):
+        """Final snapshot of a job, or None if it is unknown or its worker went away."""
+        events = await self.subscribe(job_id)
+        try:
+            snapshot = await self.get(job_id)
+            while snapshot and snapshot["status"] not in TERMINAL:
+                try: await asyncio.wait_for(events.get(), poll)
+                except asyncio.TimeoutError: pass
+                except SubscriptionLost: await asyncio.sleep(poll)  # no more events: poll the snapshot
+                snapshot = await self.get(job_id)
+            return snapshot
+        finally: await events.close()
+
+    async def _save(self, job):
+        ttl = self.retention_ttl if job.status in TERMINAL else self.active_ttl
+        await shared_state.set(f"jobs:{job.id}", job.snapshot(), ttl=ttl)
+
+    async def _publish(self, job, event):
+        # Snapshot first: a subscriber that sees the event and re-reads gets the new state
+        job.updated_at = time.time()
+        await self._save(job)
+        if job.status not in TERMINAL: await shared_state.renew_if_value(f"jobs:active:{job.video_id}", job.id, self.active_ttl)
+        await shared_state.publish(f"jobs:{job.id}", event)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try: await self._run(job)
+            finally: self.queue.task_done()
+
+    async def _run(self, job):
+        started = {}
+        async def report(stage, status, **info):
+            if status == "running": started[stage] = time.perf_counter()
+            elif stage in started:
+                telemetry.record(f"ingest.{stage}", (time.perf_counter() - started.pop(stage)) * 1000, status, video_id=job.video_id)
+            elif status in ("cached", "skipped"): telemetry.count(f"ingest.{stage}", status)
+            job.stages[stage] = status
+            await self._publish(job, {"type": "progress", "stage": stage, "status": status, **info})
+
+        job.status = "running"
+        await self._publish(job, {"type": "status", "status": "running"})
+        job_started = time.perf_counter()
+        try:
+            job.result = await self.runner(job.url, job.video_id, report)
+            job.status = "done"
+            await self._publish(job, {"type": "result", "data": job.result})
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            await self._publish(job, {"type": "error", "data": job.error})
+        finally:
+            telemetry.record("ingest.job", (time.perf_counter() - job_started) * 1000, "ok" if job.status == "done" else "error",
+                             video_id=job.video_id, queued_ms=round((job_started - job.queued_at) * 1000, 1))
+            await shared_state.delete_if_value(f"jobs:active:{job.video_id}", job.id)
+
+job_manager = JobManager()
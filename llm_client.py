@@ -0,0 +1,268 @@
+import os
+import re
+import json
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from collections import deque
+
+import httpx
+import groq
+from groq import AsyncGroq
+
+from telemetry import telemetry
+
+# --- CONFIG ---
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")  # e.g. http://localhost:9000 for the mock server
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+# Limits of the whole API key, which every worker and replica shares. Each process budgets
+# 1/LLM_PROCESSES of them; the x-ratelimit-remaining-* headers then clamp the buckets to what
+# the key really has left, and x-ratelimit-limit-tokens replaces LLM_TPM once seen.
+LLM_RPM = int(os.getenv("LLM_RPM", "30"))              # requests per minute (Groq free tier)
+LLM_TPM = int(os.getenv("LLM_TPM", "12000"))           # tokens per minute
+LLM_PROCESSES = int(os.getenv("LLM_PROCESSES", os.getenv("WEB_CONCURRENCY", "1")))  # processes sharing the key
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "10"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+DEFAULT_COMPLETION_TOKENS = 512  # reserved per call when max_tokens is not given
+
+# Lower value = served first when the bucket is short
+PRIORITY_DRAFT = 0       # user-facing answers
+PRIORITY_ROUTER = 1
+PRIORITY_JUDGE = 2
+PRIORITY_SUGGESTIONS = 3
+PRIORITY_BACKGROUND = 4  # resource topics, summaries
+
+RETRYABLE = (groq.RateLimitError, groq.APIConnectionError, groq.APITimeoutError, groq.InternalServerError)
+
+def parse_duration(value):
+    """Groq reset headers look like '2m59.56s', '7.66s' or '120ms'."""
+    if not value: return None
+    total = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        total += float(amount) * {"h": 3600, "m": 60, "s": 1, "ms": 0.001}[unit]
+    return total
+
+def estimate_tokens(messages, max_tokens=None):
+    prompt = sum(len(m.get("content") or "") for m in messages) // 4
+    return prompt + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+class TokenBucketScheduler:
+    """
+    Two token buckets (requests and tokens per minute) shared by every caller.
+    Waiters are granted strictly by priority, then arrival order. The buckets are
+    clamped to the provider's x-ratelimit-* headers and paused on 429s.
+    """
+    def __init__(self, rpm=LLM_RPM / LLM_PROCESSES, tpm=LLM_TPM / LLM_PROCESSES, processes=LLM_PROCESSES):
+        self.rpm, self.tpm = rpm, tpm
+        self.processes = processes
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters = []  # heap of (priority, seq, tokens, future)
+        self._seq = itertools.count()
+        self._dispatcher = None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def _wait_time(self, tokens):
+        now = time.monotonic()
+        if now < self.paused_until: return self.paused_until - now
+        tokens = min(tokens, self.tpm)  # a call larger than the whole bucket waits for a full one
+        need_req = max(0.0, 1 - self.requests) * 60 / self.rpm
+        need_tok = max(0.0, tokens - self.tokens) * 60 / self.tpm
+        return max(need_req, need_tok)
+
+    async def acquire(self, tokens, priority=PRIORITY_DRAFT):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._seq), tokens, fut))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        start = time.monotonic()
+        await fut
+        return time.monotonic() - start
+
+    async def _dispatch(self):
+        while self.waiters:
+            priority, _, tokens, fut = self.waiters[0]
+            if fut.cancelled():
+                heapq.heappop(self.waiters)
+                continue
+            self._refill()
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                await asyncio.sleep(min(wait, 1.0))
+                continue
+            heapq.heappop(self.waiters)
+            self.requests -= 1
+            self.tokens -= min(tokens, self.tpm)
+            fut.set_result(None)
+
+    def settle(self, estimated, actual):
+        """Corrects the token bucket once the real usage is known."""
+        if actual is not None: self.tokens -= (actual - min(estimated, self.tpm))
+
+    def observe_headers(self, headers):
+        remaining_req = headers.get("x-ratelimit-remaining-requests")
+        remaining_tok = headers.get("x-ratelimit-remaining-tokens")
+        # limit-tokens is per minute; limit-requests is per day on Groq, so LLM_RPM stays configured
+        limit_tok = headers.get("x-ratelimit-limit-tokens")
+        self._refill()
+        if limit_tok is not None: self.tpm = float(limit_tok) / self.processes
+        if remaining_req is not None: self.requests = min(self.requests, float(remaining_req))
+        if remaining_tok is not None: self.tokens = min(self.tokens, float(remaining_tok))
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class LLMClient:
+    """
+    Process-wide Groq access: one pooled AsyncGroq client (persistent keep-alive
+    connections), the rate-limit scheduler, jittered retries and per-call metrics.
+    """
+    def __init__(self, base_url=GROQ_BASE_URL, api_key=None, scheduler=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.scheduler = scheduler or TokenBucketScheduler()
+        self._client = None
+        self.calls = deque(maxlen=1000)  # recent per-call records
+        self.totals = {"calls": 0, "errors": 0, "retries": 0, "rate_limited": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                timeout=LLM_TIMEOUT,
+            )
+            kwargs = {"max_retries": 0, "http_client": http_client}  # retries are ours
+            if self.base_url: kwargs["base_url"] = self.base_url
+            if self.api_key: kwargs["api_key"] = self.api_key
+            self._client = AsyncGroq(**kwargs)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def _call(self, purpose, priority, messages, model, stream, kwargs):
+        estimated = estimate_tokens(messages, kwargs.get("max_tokens"))
+        record = {"purpose": purpose, "model": model, "priority": priority, "retries": 0, "status": "ok"}
+        queued = await self.scheduler.acquire(estimated, priority)
+        record["queued_ms"] = round(queued * 1000, 1)
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    raw = await self.client.chat.completions.with_raw_response.create(
+                        messages=messages, model=model, stream=stream, **kwargs)
+                    self.scheduler.observe_headers(raw.headers)
+                    return raw.parse(), estimated, record, start
+                except RETRYABLE as e:
+                    if attempt >= LLM_MAX_RETRIES: raise
+                    retry_after = None
+                    if isinstance(e, groq.RateLimitError):
+                        self.totals["rate_limited"] += 1
+                        headers = e.response.headers
+                        retry_after = float(headers.get("retry-after") or 0) or parse_duration(headers.get("x-ratelimit-reset-tokens"))
+                        if retry_after: self.scheduler.pause(retry_after)
+                    delay = retry_after or random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+                    attempt += 1
+                    record["retries"] = attempt
+                    self.totals["retries"] += 1
+                    await asyncio.sleep(delay)
+                    await self.scheduler.acquire(estimated, priority)
+        except asyncio.CancelledError:
+            record["status"] = "cancelled"
+            self._finish(record, start, None, None)
+            raise
+        except Exception as e:
+            record["status"] = type(e).__name__
+            self._finish(record, start, None, None)
+            raise
+
+    def _finish(self, record, start, prompt_tokens, completion_tokens):
+        record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        record["prompt_tokens"], record["completion_tokens"] = prompt_tokens, completion_tokens
+        self.calls.append(record)
+        self.totals["calls"] += 1
+        if record["status"] not in ("ok", "cancelled"):
+            self.totals["errors"] += 1
+            print(f"⚠️ LLM {record['purpose']} failed after {record['retries']} retries: {record['status']}")
+        self.totals["prompt_tokens"] += prompt_tokens or 0
+        self.totals["completion_tokens"] += completion_tokens or 0
+        telemetry.record(f"llm.{record['purpose']}", record["latency_ms"], record["status"] if record["status"] in ("ok", "cancelled") else "error",
+                         model=record["model"], queued_ms=record["queued_ms"], retries=record["retries"] or None,
+                         ttft_ms=record.get("ttft_ms"), prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        telemetry.tokens(record["purpose"], prompt_tokens, completion_tokens)
+
+    # --- PUBLIC API ---
+    async def chat(self, messages, model=DEFAULT_MODEL, priority=PRIORITY_DRAFT, purpose="chat", **kwargs):
+        resp, estimated, record, start = await self._call(purpose, priority, messages, model, False, kwargs)
+        usage = getattr(resp, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        self.scheduler.settle(estimated, getattr(usage, "total_tokens", None))
+        self._finish(record, start, prompt_tokens, completion_tokens)
+        return resp.choices[0].message.content
+
+    async def chat_json(self, messages, model=DEFAULT_MODEL, priority=PRIORITY_DRAFT, purpose="chat_json", **kwargs):
+        content = await self.chat(messages, model, priority, purpose, response_format={"type": "json_object"}, **kwargs)
+        return json.loads(content)
+
+    async def chat_stream(self, messages, token_sink, model=DEFAULT_MODEL, priority=PRIORITY_DRAFT, purpose="stream", **kwargs):
+        """Streams deltas into `token_sink`; returns the full text."""
+        stream, estimated, record, start = await self._call(purpose, priority, messages, model, True, kwargs)
+        parts = []
+        usage = None
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not parts: record["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                    parts.append(delta)
+                    await token_sink(delta)
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None) is not None: usage = x_groq.usage
+        except asyncio.CancelledError:
+            # Branch deadline or client gone: recorded, and the connection goes back to the pool below
+            record["status"] = "cancelled"
+            self._finish(record, start, None, None)
+            raise
+        except Exception as e:
+            record["status"] = type(e).__name__
+            self._finish(record, start, None, None)
+            raise
+        finally:
+            await stream.close()
+        self.scheduler.settle(estimated, getattr(usage, "total_tokens", None))
+        self._finish(record, start, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+        return "".join(parts)
+
+    def stats(self):
+        by_purpose = {}
+        for c in self.calls:
+            p = by_purpose.setdefault(c["purpose"], {"calls": 0, "latencies": [], "tokens": 0, "errors": 0})
+            p["calls"] += 1
+            p["latencies"].append(c["latency_ms"])
+            p["tokens"] += (c["prompt_tokens"] or 0) + (c["completion_tokens"] or 0)
+            p["errors"] += c["status"] not in ("ok", "cancelled")
+        for p in by_purpose.values():
+            lat = sorted(p.pop("latencies"))
+            p["p50_ms"] = lat[len(lat) // 2]
+            p["p95_ms"] = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+        return {**self.totals, "queued": len(self.scheduler.waiters), "by_purpose": by_purpose}
+
+llm = LLMClient()
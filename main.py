@@ -1,32 +1,38 @@
 import os
 import json
 import jwt
+import time
 import asyncio
 from datetime import datetime, timedelta
 from typing import List, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query, status
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query, Response, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import desc
 import bcrypt
+from prometheus_fastapi_instrumentator import Instrumentator
 
 # --- MODULES ---
-from database import init_db, get_db, VideoEmbedding, User, Session, ChatMessage
-from graph_brain import app_graph
+from database import init_db, get_db, engine, AsyncSessionLocal, User, Session, ChatMessage
+from graph_brain import app_graph, FALLBACK_ANSWER
+from inference import embed_query, warm_up, is_ready, runtime_stats, MODEL_WARMUP
+from retrieval import retrieve, library_retrieval, vector_store
+from jobs import job_manager, TERMINAL, JOB_POLL_INTERVAL
+from response_cache import response_cache
+from memo import memo
+from llm_client import llm
+from search_gateway import search_gateway
+from telemetry import telemetry
+from chat_writer import chat_writer
+from shared_state import shared_state, SubscriptionLost
+from context_window import ConversationWindow, assemble_context, history_text
+from pagination import keyset_page, split_page, HISTORY_PAGE_SIZE, SESSIONS_PAGE_SIZE, MAX_PAGE_SIZE
 
 # --- LIBRARIES ---
-from langchain_community.document_loaders import YoutubeLoader 
-from langchain_huggingface import HuggingFaceEmbeddings
-from sentence_transformers import CrossEncoder
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from groq import Groq
-from ddgs import DDGS
-from youtube_search import YoutubeSearch
 from dotenv import load_dotenv
 load_dotenv()
 # --- CONFIG ---
@@ -44,16 +50,12 @@ app = FastAPI(
     }
 )
 
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Next-Cursor"])
+# HTTP metrics plus the pipeline histograms/counters from telemetry.py on /metrics
+Instrumentator(excluded_handlers=["/metrics", "/health", "/ready"]).instrument(app).expose(app, include_in_schema=False)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token") # Point to the token endpoint
 
-# --- MODELS ---
-print("⏳ Loading AI Models...")
-embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-print("✅ Models Ready!")
-
 # --- AUTH HELPERS ---
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -71,6 +73,45 @@ def get_current_user_from_token(token: str):
 @app.on_event("startup")
 async def on_startup():
     await init_db()
+    await telemetry.start()
+    await chat_writer.start()
+    await job_manager.start()
+    app.state.invalidation_task = asyncio.create_task(listen_for_invalidations())
+    # Models load lazily; "background" lets /health answer while they warm up.
+    # A failed warm-up keeps retrying in the background so /ready can still turn green.
+    if MODEL_WARMUP == "blocking": await warm_up()
+    if MODEL_WARMUP == "background" or (MODEL_WARMUP == "blocking" and not is_ready()):
+        app.state.warmup_task = asyncio.create_task(warm_up(retry=True))
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await job_manager.stop()
+    app.state.invalidation_task.cancel()
+    if getattr(app.state, "warmup_task", None): app.state.warmup_task.cancel()
+    await chat_writer.stop()
+    await llm.aclose()
+    await telemetry.stop()
+    await shared_state.close()
+
+async def listen_for_invalidations():
+    """Re-ingesting a video on any worker drops the copy of its vectors held by this one."""
+    delay, missed = 1.0, False
+    while True:
+        try: events = await shared_state.subscribe("videos:invalidate")
+        except Exception as e:
+            print(f"⚠️ Invalidation channel unavailable ({e}), retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay, missed = min(delay * 2, 60), True
+            continue
+        # Anything published while we were not listening is unknown: start from an empty store
+        if missed: vector_store.clear()
+        delay, missed = 1.0, False
+        try:
+            while True: vector_store.invalidate(await events.get())
+        except SubscriptionLost as e:
+            print(f"⚠️ Invalidation channel lost ({e}), resubscribing")
+            missed = True
+        finally: await events.close()
 
 # --- REQUEST SCHEMAS ---
 class AuthRequest(BaseModel):
@@ -133,75 +174,88 @@ async def create_session(req: SessionRequest, db: AsyncSession = Depends(get_db)
     return {"session_id": new_session.id}
 
 @app.get("/api/sessions/{username}")
-async def get_sessions(username: str, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(User).where(User.username == username))
-    user = res.scalars().first()
-    if not user: return []
-    stmt = select(Session).where(Session.user_id == user.id).order_by(desc(Session.created_at))
-    res = await db.execute(stmt)
-    return res.scalars().all()
+async def get_sessions(username: str, response: Response, cursor: Optional[str] = None,
+                       limit: int = Query(SESSIONS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    # Newest first, one page per call; the next page's cursor comes back in X-Next-Cursor
+    stmt = select(Session.id, Session.user_id, Session.video_id, Session.title, Session.created_at)\
+           .join(User, User.id == Session.user_id).where(User.username == username)
+    rows = (await db.execute(keyset_page(stmt, Session.created_at, Session.id, cursor, limit))).all()
+    rows, next_cursor = split_page(rows, limit)
+    if next_cursor: response.headers["X-Next-Cursor"] = next_cursor
+    return [dict(r._mapping) for r in rows]
+
+@app.get("/api/stats/cache")
+async def cache_stats():
+    return {"response_cache": response_cache.stats(), "memo": memo.stats(), "vector_store": vector_store.stats(),
+            "search": search_gateway.stats(), "telemetry": telemetry.stats()}
+
+@app.get("/api/stats/db")
+async def db_stats():
+    pool = engine.pool
+    return {"pool": {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": pool.overflow(), "idle": pool.checkedin()},
+            "chat_writer": chat_writer.stats()}
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    ready = is_ready()
+    return JSONResponse(runtime_stats(), status_code=200 if ready else 503)
+
+@app.get("/api/stats/runtime")
+async def model_runtime_stats():
+    return runtime_stats()
+
+@app.get("/api/stats/llm")
+async def llm_stats():
+    return llm.stats()
+
+def history_columns(meta):
+    columns = [ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at]
+    return columns + [ChatMessage.metadata_] if meta else columns
+
+def history_item(m, meta):
+    # 'meta' contains thinking steps if saved previously; meta=false leaves the column out of the query
+    return {"role": m.role, "text": m.content, "meta": m.metadata_} if meta else {"role": m.role, "text": m.content}
 
 @app.get("/api/history/{session_id}")
-async def get_history(session_id: int, db: AsyncSession = Depends(get_db)):
-    stmt = select(ChatMessage).where(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at)
-    res = await db.execute(stmt)
-    msgs = res.scalars().all()
-    # Return simple dicts. 'meta' contains thinking steps if saved previously.
-    return [{"role": m.role, "text": m.content, "meta": m.metadata_} for m in msgs]
+async def get_history(session_id: int, response: Response, cursor: Optional[str] = None, meta: bool = True,
+                      limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    # The most recent `limit` messages in chat order; X-Next-Cursor fetches the page before them
+    stmt = select(*history_columns(meta)).where(ChatMessage.session_id == session_id)
+    rows = (await db.execute(keyset_page(stmt, ChatMessage.created_at, ChatMessage.id, cursor, limit))).all()
+    rows, next_cursor = split_page(rows, limit)
+    if next_cursor: response.headers["X-Next-Cursor"] = next_cursor
+    return [history_item(m, meta) for m in reversed(rows)]
+
+@app.get("/api/history/{session_id}/export")
+async def export_history(session_id: int, meta: bool = True):
+    """Whole session as NDJSON, oldest first, streamed from a server-side cursor."""
+    stmt = select(*history_columns(meta)).where(ChatMessage.session_id == session_id)\
+           .order_by(ChatMessage.created_at, ChatMessage.id).execution_options(yield_per=500)
+
+    async def lines():
+        # Own session: a Depends(get_db) one is closed before the body is streamed
+        async with AsyncSessionLocal() as db:
+            async for m in await db.stream(stmt):
+                yield json.dumps({**history_item(m, meta), "created_at": m.created_at.isoformat() if m.created_at else None}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="session-{session_id}.ndjson"'})
 
 # --- RAG UTILS ---
 def get_video_id(url):
     if "v=" in url: return url.split("v=")[1].split("&")[0]
     return None
 
-def format_timestamp(seconds):
-    minutes = int(seconds // 60)
-    remaining_sec = int(seconds % 60)
-    return f"{minutes:02d}:{remaining_sec:02d}"
-
-async def postgres_retrieval(db: AsyncSession, query: str, video_id: str):
-    query_vec = embeddings.embed_query(query)
-    stmt = select(VideoEmbedding).where(VideoEmbedding.video_id == video_id)\
-           .order_by(VideoEmbedding.embedding.cosine_distance(query_vec)).limit(10)
-    result = await db.execute(stmt)
-    initial_docs = result.scalars().all()
-    if not initial_docs: return ""
-
-    pairs = [[query, doc.content] for doc in initial_docs]
-    scores = reranker.predict(pairs)
-    scored_docs = sorted(zip(initial_docs, scores), key=lambda x: x[1], reverse=True)
-    top_docs = [doc for doc, score in scored_docs[:3]]
-    return "\n".join([f"[Time: {format_timestamp(d.start_time)}] {d.content}" for d in top_docs])
-
-async def generate_resources_on_load(text_sample):
-    client = Groq()
-    try:
-        resp = client.chat.completions.create(messages=[{"role": "user", "content": f"Extract TOPIC (3 words). Transcript: {text_sample[:1000]}."}], model="llama-3.3-70b-versatile")
-        topic = resp.choices[0].message.content.strip().replace('"', '')
-    except: topic = "General"
-
-    videos = []
-    blogs = []
-    try:
-        yt_results = YoutubeSearch(f"{topic} tutorial", max_results=3).to_dict()
-        videos = [{"title": v['title'], "link": f"https://www.youtube.com{v['url_suffix']}"} for v in yt_results]
-    except: pass
-    try:
-        with DDGS() as ddgs:
-            b_results = ddgs.text(f"{topic} tutorial (site:medium.com OR site:dev.to) -site:youtube.com", max_results=4)
-            if b_results:
-                for r in b_results:
-                    if "youtube" not in r['href']: blogs.append({"title": r['title'], "link": r['href']})
-    except: pass
-    return {"topic": topic, "videos": videos, "blogs": blogs}
-
 # --- WEBSOCKET WITH AUTH & HISTORY ---
 @app.websocket("/ws/chat")
 async def websocket_endpoint(
     websocket: WebSocket, 
     token: str = Query(...), 
-    session_id: int = Query(...), 
-    db: AsyncSession = Depends(get_db)
+    session_id: int = Query(...)
 ):
     await websocket.accept()
     
@@ -210,105 +264,201 @@ async def websocket_endpoint(
         await websocket.close(code=4001)
         return
 
-    async for session in get_db(): db_session = session; break
-
+    # Connections are taken per operation (short sessions below), never for the life of the
+    # socket, so idle chatters do not pin the pool
     try:
-        hist_stmt = select(ChatMessage).where(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at)
-        res = await db_session.execute(hist_stmt)
-        history_objs = res.scalars().all()
-        chat_history = [{"role": m.role, "content": m.content} for m in history_objs]
+        # Bounded window + rolling summary instead of the full history
+        async with AsyncSessionLocal() as db:
+            window = await ConversationWindow.load(db, session_id)
+            current_user_id = (await db.execute(select(User.id).where(User.username == username))).scalar()
 
         while True:
             data = await websocket.receive_text()
-            req = json.loads(data)
-            user_msg = req.get("message")
-            current_video_id = get_video_id(req.get("url", "")) 
-
-            # Save User Message
-            user_db_msg = ChatMessage(session_id=session_id, role="user", content=user_msg)
-            db_session.add(user_db_msg)
-            await db_session.commit()
+            received_at = time.perf_counter()
+            turn_status, turn_attrs = "error", {"session_id": session_id}
+            try:
+                req = json.loads(data)
+                user_msg = req.get("message")
+                current_video_id = get_video_id(req.get("url", "")) 
+                # "library" searches every video in the user's session history instead of the current one
+                library_scope = req.get("scope") == "library" and current_user_id is not None
+                turn_attrs.update(video_id=current_video_id, scope="library" if library_scope else "video")
+
+                # Save User Message (batched write-behind; confirmed with the reply below)
+                user_saved = await chat_writer.submit(session_id, "user", user_msg)
             
-            # Retrieval
-            context = ""
-            if current_video_id:
-                # 2. EVENT: Retrieval Start
-                await websocket.send_json({"type": "thought", "data": "🔎 Searching Knowledge Base..."})
-                context = await postgres_retrieval(db_session, user_msg, current_video_id)
-
-            # Graph State
-            initial_state = {
-                "query": user_msg, 
-                "context": context, 
-                "chat_history": chat_history,
-                "next_step": "",
-                "final_answer": "", 
-                "reasoning": "", 
-                "suggestions": [], 
-                "metadata": {}
-            }
-
-            final_answer = ""
-            suggestions = []
-            final_meta = {}
-            thoughts = [] # Accumulate thoughts here for DB
-
-            if context: thoughts.append(f"🔎 Found relevant video context.")
-
-            async for event in app_graph.astream(initial_state):
-                for node_name, node_state in event.items():
-                    if "reasoning" in node_state:
-                         thought_text = f"⚙️ {node_name.upper()}: {node_state['reasoning']}"
-                         thoughts.append(thought_text)
-                         # 3. EVENT: Send individual thought to UI
-                         await websocket.send_json({"type": "thought", "data": thought_text})
+                # Semantic cache: near-identical questions about the same video reuse the stored answer
+                query_vec, cached = None, None
+                if current_video_id or library_scope:
+                    with telemetry.span("turn.embed_query"):
+                        query_vec = await embed_query(user_msg)
+                # Shared across users and sessions, so only turns whose answer depends on nothing but
+                # the question and the video: no library scope, no conversation history yet
+                use_cache = bool(current_video_id) and not library_scope and window.is_empty()
+                if use_cache:
+                    with telemetry.span("turn.cache_lookup"):
+                        async with AsyncSessionLocal() as db:
+                            cached, similarity = await response_cache.lookup(db, current_video_id, query_vec)
+                    telemetry.count("response_cache", "hit" if cached else "miss")
+
+                if cached:
+                    thoughts = ["⚡ Answered from cache (similar question asked before)."]
+                    await websocket.send_json({"type": "thought", "data": thoughts[0]})
+                    final_answer, suggestions = cached["final_answer"], cached["suggestions"]
+                    final_meta = {**cached["metadata"], "thoughts": thoughts, "cache": {"hit": True, "similarity": round(similarity, 4)},
+                                  "policy": {"judge": {"run": False, "reason": "cache hit"}, "suggestions": {"run": False, "mode": "cache", "reason": "cache hit"}}}
+                else:
+                    # Retrieval
+                    context, retrieval_signals = "", {}
+                    if library_scope:
+                        # 2. EVENT: Retrieval Start
+                        await websocket.send_json({"type": "thought", "data": "🔎 Searching your video library..."})
+                        context, retrieval_signals = await library_retrieval(user_msg, current_user_id, query_vec)
+                    elif current_video_id:
+                        # 2. EVENT: Retrieval Start
+                        await websocket.send_json({"type": "thought", "data": "🔎 Searching Knowledge Base..."})
+                        context, retrieval_signals = await retrieve(user_msg, current_video_id, query_vec)
+
+                    # Pack chunks + history + summary to the prompt token budget
+                    packed = assemble_context(context, window.history(), window.summary)
+                    context = packed["context"]
+
+                    # Graph State
+                    initial_state = {
+                        "query": user_msg, 
+                        "context": context, 
+                        "chat_history": packed["history"],
+                        "history_text": history_text(packed["history"], packed["summary"]),
+                        "query_vec": query_vec,
+                        "retrieval": retrieval_signals,
+                        "next_step": "",
+                        "final_answer": "", 
+                        "reasoning": "", 
+                        "suggestions": [], 
+                        "metadata": {}
+                    }
+
+                    final_answer = ""
+                    suggestions = []
+                    final_meta = {}
+                    router_info = None
+                    thoughts = [] # Accumulate thoughts here for DB
+
+                    if context: thoughts.append(f"🔎 Found relevant video context.")
+
+                    # 4. EVENT: Answer tokens as the model produces them
+                    turn_started = time.perf_counter()
+                    first_token_at = None
+                    async def send_token(delta):
+                        nonlocal first_token_at
+                        if first_token_at is None: first_token_at = time.perf_counter()
+                        await websocket.send_json({"type": "token", "data": delta})
+
+                    graph_config = {"configurable": {"token_sink": send_token}}
+                    async for event in app_graph.astream(initial_state, config=graph_config):
+                        for node_name, node_state in event.items():
+                            if "reasoning" in node_state:
+                                 thought_text = f"⚙️ {node_name.upper()}: {node_state['reasoning']}"
+                                 thoughts.append(thought_text)
+                                 # 3. EVENT: Send individual thought to UI
+                                 await websocket.send_json({"type": "thought", "data": thought_text})
                     
-                    if "final_answer" in node_state: final_answer = node_state["final_answer"]
-                    if "suggestions" in node_state: suggestions = node_state["suggestions"]
-                    if "metadata" in node_state: final_meta = node_state["metadata"]
-
-            # Attach collected thoughts to metadata for persistence
-            final_meta["thoughts"] = thoughts
-
-            # Save AI Response
-            ai_db_msg = ChatMessage(session_id=session_id, role="ai", content=final_answer, metadata_=final_meta)
-            db_session.add(ai_db_msg)
-            await db_session.commit()
+                            if "final_answer" in node_state: final_answer = node_state["final_answer"]
+                            if "suggestions" in node_state: suggestions = node_state["suggestions"]
+                            if "metadata" in node_state: final_meta = node_state["metadata"]
+                            if "router" in node_state: router_info = node_state["router"]
+
+                    # Attach collected thoughts to metadata for persistence
+                    final_meta["thoughts"] = thoughts
+                    if first_token_at is not None: final_meta["ttft_ms"] = round((first_token_at - turn_started) * 1000, 1)
+                    final_meta["tokens"] = {**packed["tokens"], **final_meta.get("tokens", {})}
+                    if router_info: final_meta["router"] = router_info
+                    if use_cache:
+                        # RAG route only (SEARCH/CHAT answers carry live web results or small talk),
+                        # and never a fallback or a partially failed turn
+                        if (router_info or {}).get("label") == "RAG" and final_meta.get("cacheable"):
+                            async with AsyncSessionLocal() as db:
+                                await response_cache.store(db, current_video_id, query_vec, user_msg, final_answer, suggestions, final_meta)
+                        final_meta["cache"] = {"hit": False}
+
+                # Save AI Response; CHAT_WRITE_MODE decides whether the reply waits for the commit
+                ai_saved = await chat_writer.submit(session_id, "ai", final_answer, final_meta)
+                await chat_writer.confirm(user_saved, ai_saved)
             
-            chat_history.append({"role": "user", "content": user_msg})
-            chat_history.append({"role": "ai", "content": final_answer})
-
-            await websocket.send_json({
-                "type": "result", "data": final_answer, "suggestions": suggestions, "meta": final_meta
-            })
+                window.append("user", user_msg)
+                window.append("ai", final_answer)
+
+                turn_attrs.update(cache_hit=bool(cached), route=(final_meta.get("router") or {}).get("label"),
+                                  ttft_ms=final_meta.get("ttft_ms"), prompt_tokens=(final_meta.get("tokens") or {}).get("total"))
+                await websocket.send_json({
+                    "type": "result", "data": final_answer, "suggestions": suggestions, "meta": final_meta
+                })
+                turn_status = "error" if final_answer == FALLBACK_ANSWER else "ok"
+            except WebSocketDisconnect:
+                turn_status = "disconnected"
+                raise
+            finally:
+                # Every turn is recorded, failed ones included, so the monitor's error rate is real
+                telemetry.record("turn", (time.perf_counter() - received_at) * 1000, turn_status, **turn_attrs)
+            # Summarize evicted turns in the background, so it never delays the user's next message
+            window.compact_soon()
 
     except WebSocketDisconnect: print("Client disconnected")
 
-@app.post("/api/process")
-async def process_video(request: VideoRequest, db: AsyncSession = Depends(get_db)):
-    video_id = get_video_id(request.url)
+# --- INGESTION JOBS ---
+async def submit_job(url):
+    video_id = get_video_id(url)
     if not video_id: raise HTTPException(400, "Invalid URL")
-    
+    try: return await job_manager.submit(url, video_id)
+    except asyncio.QueueFull: raise HTTPException(503, "Ingestion queue is full, try again shortly")
+
+@app.post("/api/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(request: VideoRequest):
+    job, created = await submit_job(request.url)
+    return {"job_id": job["job_id"], "video_id": job["video_id"], "status": job["status"], "deduplicated": not created}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_manager.get(job_id)
+    if not job: raise HTTPException(404, "Job not found")
+    return job
+
+@app.websocket("/ws/jobs/{job_id}")
+async def job_progress_ws(websocket: WebSocket, job_id: str):
+    await websocket.accept()
+    # Subscribed before the snapshot is read, so no event falls between the two
+    events = await job_manager.subscribe(job_id)
     try:
-        loader = YoutubeLoader.from_youtube_url(request.url, add_video_info=False)
-        raw_docs = loader.load()
-        full_text = " ".join([d.page_content for d in raw_docs])
-    except Exception as e: raise HTTPException(400, f"Error: {str(e)}")
-
-    result = await db.execute(select(VideoEmbedding).where(VideoEmbedding.video_id == video_id).limit(1))
-    if not result.scalars().first():
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        chunks = text_splitter.split_text(full_text)
-        curr_words = 0
-        for chunk in chunks:
-            vector = embeddings.embed_query(chunk)
-            est_time = int(curr_words / 2.5)
-            db.add(VideoEmbedding(video_id=video_id, content=chunk, embedding=vector, start_time=est_time))
-            curr_words += len(chunk.split())
-        await db.commit()
-    
-    resources = await generate_resources_on_load(full_text)
-    return {"status": "success", "message": "Processed!", "recommendations": resources}
+        job = await job_manager.get(job_id)
+        if not job:
+            await websocket.close(code=4004)
+            return
+        await websocket.send_json({"type": "snapshot", "data": job})
+        if job["status"] not in TERMINAL:
+            while True:
+                try: event = await asyncio.wait_for(events.get(), JOB_POLL_INTERVAL)
+                except (asyncio.TimeoutError, SubscriptionLost) as e:
+                    # Quiet or lost channel: the snapshot tells whether the job is still going
+                    if isinstance(e, SubscriptionLost): await asyncio.sleep(JOB_POLL_INTERVAL)
+                    job = await job_manager.get(job_id)
+                    if job and job["status"] not in TERMINAL: continue
+                    if not job: event = {"type": "error", "data": "Ingestion job was lost"}
+                    elif job["status"] == "done": event = {"type": "result", "data": job["result"]}
+                    else: event = {"type": "error", "data": job["error"]}
+                await websocket.send_json(event)
+                if event["type"] in ("result", "error"): break
+        await websocket.close()
+    except WebSocketDisconnect: pass
+    finally: await events.close()
+
+@app.post("/api/process")
+async def process_video(request: VideoRequest):
+    # Synchronous wrapper kept for existing clients: waits on the (possibly shared) job
+    job, _ = await submit_job(request.url)
+    job = await job_manager.wait(job["job_id"])
+    if not job: raise HTTPException(503, "Ingestion job was lost, try again")
+    if job["error"]: raise HTTPException(400, job["error"])
+    return job["result"]
 
 if os.path.exists("ui/dist"):
     app.mount("/assets", StaticFiles(directory="ui/dist/assets"), name="assets")
@@ -0,0 +1,69 @@
+import os
+import sys
+import hashlib
+from collections import OrderedDict
+
+# --- CONFIG ---
+MEMO_MAX_BYTES = int(os.getenv("MEMO_MAX_BYTES", str(64 * 1024 * 1024)))  # process-wide cap
+
+ENTRY_OVERHEAD = 200  # rough per-entry cost of the key tuple + OrderedDict slot
+
+def query_key(text):
+    """Stable hash of a query (whitespace-normalized), shared by every memo namespace."""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+def approx_size(value):
+    nbytes = getattr(value, "nbytes", None)
+    return (nbytes if nbytes is not None else sys.getsizeof(value)) + ENTRY_OVERHEAD
+
+class MemoStore:
+    """
+    One LRU shared by every namespace ("qvec", "rerank", ...), bounded by an
+    approximate byte budget so all memoized values together stay under the cap.
+    """
+    def __init__(self, max_bytes=MEMO_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.data = OrderedDict()  # (namespace, *key) -> (value, size)
+        self.bytes = 0
+        self.counters = {}         # namespace -> {"hits", "misses", "entries", "bytes"}
+
+    def _ns(self, namespace):
+        return self.counters.setdefault(namespace, {"hits": 0, "misses": 0, "entries": 0, "bytes": 0})
+
+    def get(self, namespace, *key):
+        item = self.data.get((namespace, *key))
+        ns = self._ns(namespace)
+        if item is None:
+            ns["misses"] += 1
+            return None
+        ns["hits"] += 1
+        self.data.move_to_end((namespace, *key))
+        return item[0]
+
+    def put(self, namespace, *key, value):
+        full_key = (namespace, *key)
+        size = approx_size(value)
+        if size > self.max_bytes: return
+        if full_key in self.data: self._evict(full_key)
+        self.data[full_key] = (value, size)
+        self.bytes += size
+        ns = self._ns(namespace)
+        ns["entries"] += 1
+        ns["bytes"] += size
+        while self.bytes > self.max_bytes: self._evict(next(iter(self.data)))
+
+    def _evict(self, full_key):
+        _, size = self.data.pop(full_key)
+        self.bytes -= size
+        ns = self._ns(full_key[0])
+        ns["entries"] -= 1
+        ns["bytes"] -= size
+
+    def stats(self):
+        namespaces = {}
+        for name, c in self.counters.items():
+            lookups = c["hits"] + c["misses"]
+            namespaces[name] = {**c, "hit_rate": round(c["hits"] / lookups, 4) if lookups else 0.0}
+        return {"bytes": self.bytes, "max_bytes": self.max_bytes, "entries": len(self.data), "namespaces": namespaces}
+
+memo = MemoStore()
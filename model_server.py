@@ -0,0 +1,66 @@
+"""
+Shared model server: one process holds MiniLM and the cross-encoder and serves every
+API worker (MODEL_BACKEND=remote). Concurrent requests are micro-batched into single
+forward passes.
+
+    uvicorn model_server:app --port 8100
+    MODEL_BACKEND=remote MODEL_SERVER_URL=http://localhost:8100 uvicorn main:app --workers 4
+"""
+import os
+import time
+import asyncio
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from batching import MicroBatcher
+from inference import LocalModels, inference_pool, rss_mb, PROCESS_STARTED, INFERENCE_CONCURRENCY
+
+# --- CONFIG ---
+MODEL_SERVER_MAX_BATCH = int(os.getenv("MODEL_SERVER_MAX_BATCH", "64"))
+MODEL_SERVER_WINDOW_MS = float(os.getenv("MODEL_SERVER_WINDOW_MS", "5"))
+
+models = LocalModels()
+embed_batcher = MicroBatcher(models.embed_documents, MODEL_SERVER_MAX_BATCH, MODEL_SERVER_WINDOW_MS,
+                             executor=inference_pool, concurrency=INFERENCE_CONCURRENCY, name="embed")
+rerank_batcher = MicroBatcher(models.predict, MODEL_SERVER_MAX_BATCH, MODEL_SERVER_WINDOW_MS,
+                              executor=inference_pool, concurrency=INFERENCE_CONCURRENCY, name="rerank")
+state = {"ready": False, "ready_after_s": None}
+
+app = FastAPI(title="TubeMind model server")
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+class RerankRequest(BaseModel):
+    pairs: List[List[str]]
+
+@app.on_event("startup")
+async def on_startup():
+    async def load():
+        await asyncio.get_running_loop().run_in_executor(inference_pool, models.load)
+        state.update({"ready": True, "ready_after_s": round(time.time() - PROCESS_STARTED, 2)})
+    app.state.load_task = asyncio.create_task(load())
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@app.post("/embed")
+async def embed(request: EmbedRequest):
+    return {"vectors": await embed_batcher.submit(request.texts)}
+
+@app.post("/rerank")
+async def rerank(request: RerankRequest):
+    return {"scores": await rerank_batcher.submit(request.pairs)}
+
+@app.get("/stats")
+async def stats():
+    return {**state, "pid": os.getpid(), "rss_mb": rss_mb(), "load_ms": dict(models.load_ms),
+            "batchers": {"embed": embed_batcher.stats(), "rerank": rerank_batcher.stats()}}
@@ -1,8 +1,22 @@
+import os
+import re
+import json
+import urllib.request
+
 import streamlit as st
-import sqlite3
 import pandas as pd
 import altair as alt
-import time
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIG ---
+# Same database the API writes telemetry_events to (telemetry.py); read through a sync driver
+DATABASE_URL = re.sub(r"^postgresql\+asyncpg", "postgresql+psycopg", os.getenv("DATABASE_URL", ""))
+API_URL = os.getenv("API_URL", "http://localhost:8000")             # for the /ready probe
+TURN_P95_SLO_MS = float(os.getenv("TURN_P95_SLO_MS", "8000"))
+ERROR_RATE_SLO = float(os.getenv("ERROR_RATE_SLO", "0.02"))
 
 # 1. Page Config (Dark Mode & Wide Layout)
 st.set_page_config(
@@ -15,9 +29,6 @@ st.set_page_config(
 # Custom CSS to make it look like Grafana (Dark, Cards)
 st.markdown("""
 <style>
-    .stApp {
-        # background-color: #101010;
-    }
     .metric-card {
         background-color: #1e1e1e;
         border: 1px solid #333;
@@ -32,93 +43,165 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 st.title("📈 System Observability Dashboard")
-st.markdown("Real-time telemetry from **TubeMind AI Pipeline**")
+st.markdown("Telemetry from the **TubeMind AI Pipeline** (`telemetry_events`)")
 
-# Auto-refresh mechanism
+hours = st.sidebar.slider("Window (hours)", 1, 168, 24)
 if st.button('🔄 Refresh Metrics'):
     st.rerun()
 
-# --- DATA ENGINEERING: ETL FROM SQLITE ---
-def load_data():
+@st.cache_resource
+def get_engine():
+    return create_engine(DATABASE_URL, pool_pre_ping=True)
+
+def query(sql, **params):
+    with get_engine().connect() as conn:
+        return pd.read_sql_query(text(sql), conn, params=params)
+
+# --- DATA: percentiles are computed in Postgres, only aggregates come back ---
+def stage_percentiles(hours):
+    return query("""
+        SELECT stage, count(*) AS events,
+               percentile_cont(0.50) WITHIN GROUP (ORDER BY duration_ms) AS p50_ms,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+               percentile_cont(0.99) WITHIN GROUP (ORDER BY duration_ms) AS p99_ms,
+               avg((status NOT IN ('ok', 'done', 'cached', 'skipped', 'disconnected'))::int) AS error_rate
+        FROM telemetry_events WHERE ts > extract(epoch FROM now()) - :secs
+        GROUP BY stage ORDER BY stage
+    """, secs=hours * 3600)
+
+def stage_timeseries(stages, hours):
+    bucket = 60 if hours <= 6 else 600 if hours <= 48 else 3600
+    df = query("""
+        SELECT to_timestamp(floor(ts / :bucket) * :bucket) AS time, stage,
+               percentile_cont(0.50) WITHIN GROUP (ORDER BY duration_ms) AS p50_ms,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+               percentile_cont(0.99) WITHIN GROUP (ORDER BY duration_ms) AS p99_ms
+        FROM telemetry_events WHERE ts > extract(epoch FROM now()) - :secs AND stage = ANY(:stages)
+        GROUP BY 1, 2 ORDER BY 1
+    """, secs=hours * 3600, bucket=bucket, stages=list(stages))
+    return df.melt(id_vars=["time", "stage"], var_name="percentile", value_name="ms")
+
+def turn_breakdown(hours):
+    return query("""
+        SELECT coalesce(attrs->>'route', CASE WHEN (attrs->>'cache_hit')::boolean THEN 'cache' ELSE 'failed' END) AS route, (attrs->>'cache_hit')::boolean AS cache_hit,
+               attrs->>'scope' AS scope, count(*) AS turns,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+               percentile_cont(0.50) WITHIN GROUP (ORDER BY (attrs->>'ttft_ms')::float) AS ttft_p50_ms
+        FROM telemetry_events WHERE stage = 'turn' AND ts > extract(epoch FROM now()) - :secs
+        GROUP BY 1, 2, 3 ORDER BY turns DESC
+    """, secs=hours * 3600)
+
+def llm_usage(hours):
+    return query("""
+        SELECT substr(stage, 5) AS purpose, count(*) AS calls,
+               sum((attrs->>'prompt_tokens')::int) AS prompt_tokens,
+               sum((attrs->>'completion_tokens')::int) AS completion_tokens,
+               sum(coalesce((attrs->>'retries')::int, 0)) AS retries,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY (attrs->>'queued_ms')::float) AS queued_p95_ms
+        FROM telemetry_events WHERE stage LIKE 'llm.%' AND ts > extract(epoch FROM now()) - :secs
+        GROUP BY 1 ORDER BY calls DESC
+    """, secs=hours * 3600)
+
+def recent_health():
+    """Status from the last 5 minutes of turns (errors and fallback answers included), not a hardcoded label."""
+    row = query("""
+        SELECT count(*) AS turns,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+               avg((status NOT IN ('ok', 'disconnected'))::int) AS error_rate
+        FROM telemetry_events WHERE stage = 'turn' AND ts > extract(epoch FROM now()) - 300
+    """).iloc[0]
     try:
-        conn = sqlite3.connect('analytics.db')
-        # We fetch the raw logs
-        df = pd.read_sql_query("SELECT * FROM queries", conn)
-        conn.close()
-        
-        # Convert timestamp to datetime objects
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        return df
-    except:
-        return pd.DataFrame()
-
-df = load_data()
-
-if df.empty:
-    st.warning("No data found. Go chat with the AI to generate logs!")
+        with urllib.request.urlopen(f"{API_URL}/ready", timeout=2) as r: ready = r.status == 200
+    except Exception:
+        ready = False
+    if not ready: return "DOWN 🔴", row
+    if row["turns"] and (row["p95_ms"] > TURN_P95_SLO_MS or row["error_rate"] > ERROR_RATE_SLO): return "DEGRADED 🟠", row
+    return "HEALTHY 🟢", row
+
+try:
+    stages = stage_percentiles(hours)
+except Exception as e:
+    st.error(f"Cannot read telemetry_events: {e}")
+    st.stop()
+
+if stages.empty:
+    st.warning("No telemetry in this window. Go chat with the AI to generate events!")
     st.stop()
 
 # --- ROW 1: "GOLDEN SIGNALS" (The Grafana Header) ---
+turn = stages[stages["stage"] == "turn"]
+status, recent = recent_health()
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    st.metric(label="Total Requests", value=len(df), delta=f"+{len(df)} today")
+    st.metric(label="Chat Turns", value=int(turn["events"].sum()) if not turn.empty else 0)
 
 with col2:
-    # Latency (P99 is a standard engineering metric)
-    avg_lat = df['processing_time'].mean()
-    st.metric(label="Avg Latency", value=f"{avg_lat:.2f}s", delta="-0.1s", delta_color="inverse")
+    if not turn.empty:
+        t = turn.iloc[0]
+        st.metric(label="Turn Latency p50 / p95 / p99", value=f"{t.p50_ms / 1000:.2f}s",
+                  delta=f"p95 {t.p95_ms / 1000:.2f}s · p99 {t.p99_ms / 1000:.2f}s", delta_color="off")
+    else:
+        st.metric(label="Turn Latency", value="–")
 
 with col3:
-    # Traffic (Unique Videos)
-    unique_vids = df['video_id'].nunique()
-    st.metric(label="Video Sources", value=unique_vids)
+    cache = query("""
+        SELECT avg((attrs->>'cache_hit')::boolean::int) AS hit_rate FROM telemetry_events
+        WHERE stage = 'turn' AND attrs->>'scope' = 'video' AND ts > extract(epoch FROM now()) - :secs
+    """, secs=hours * 3600).iloc[0]["hit_rate"]
+    st.metric(label="Response Cache Hit Rate", value=f"{cache:.1%}" if cache is not None else "–")
 
 with col4:
-    # "Fake" System Health (Just to look cool)
-    st.metric(label="System Status", value="HEALTHY 🟢")
+    st.metric(label="System Status", value=status,
+              delta=f"5 min: {int(recent['turns'])} turns, p95 {(recent['p95_ms'] or 0) / 1000:.2f}s", delta_color="off")
 
 st.markdown("---")
 
-# --- ROW 2: LATENCY HISTOGRAM (The Data Science Chart) ---
-c1, c2 = st.columns([2, 1])
+# --- ROW 2: PER-STAGE PERCENTILES ---
+st.subheader("⏱️ Latency per Stage (p50 / p95 / p99)")
+st.dataframe(stages.style.format({"p50_ms": "{:.1f}", "p95_ms": "{:.1f}", "p99_ms": "{:.1f}", "error_rate": "{:.2%}"}),
+             use_container_width=True)
+
+default_stages = [s for s in ("turn", "retrieval.candidates", "retrieval.rerank", "node.rag_agent") if s in set(stages["stage"])]
+chosen = st.multiselect("Stages over time", list(stages["stage"]), default=default_stages)
+if chosen:
+    series = stage_timeseries(chosen, hours)
+    chart = alt.Chart(series).mark_line(point=True).encode(
+        x=alt.X('time:T', title='Time'),
+        y=alt.Y('ms:Q', title='Latency (ms)'),
+        color='stage:N',
+        strokeDash='percentile:N',
+        tooltip=['time', 'stage', 'percentile', alt.Tooltip('ms:Q', format='.1f')]
+    ).properties(height=320)
+    st.altair_chart(chart, use_container_width=True)
+
+# --- ROW 3: ROUTER / CACHE MIX AND LLM USAGE ---
+c1, c2 = st.columns([1, 1])
 
 with c1:
-    st.subheader("⏱️ Latency Distribution (Performance)")
-    # Altair chart for detailed visualization
-    chart = alt.Chart(df).mark_area(
-        line={'color':'#4ade80'},
-        color=alt.Gradient(
-            gradient='linear',
-            stops=[alt.GradientStop(color='#4ade80', offset=0),
-                   alt.GradientStop(color='#101010', offset=1)],
-            x1=1, x2=1, y1=1, y2=0
-        )
-    ).encode(
-        x=alt.X('timestamp:T', title='Time'),
-        y=alt.Y('processing_time:Q', title='Latency (seconds)'),
-        tooltip=['timestamp', 'processing_time', 'question']
-    ).properties(height=300)
-    
-    st.altair_chart(chart, use_container_width=True)
+    st.subheader("🧭 Turns by Route")
+    routes = turn_breakdown(hours)
+    if not routes.empty:
+        pie = alt.Chart(routes).mark_arc(innerRadius=50).encode(
+            theta=alt.Theta(field="turns", type="quantitative", aggregate="sum"),
+            color=alt.Color(field="route", type="nominal"),
+            tooltip=['route', 'turns', 'p95_ms', 'ttft_p50_ms']
+        ).properties(height=300)
+        st.altair_chart(pie, use_container_width=True)
+        st.dataframe(routes, use_container_width=True)
 
 with c2:
-    st.subheader("📂 Content Distribution")
-    # Pie chart of Video IDs
-    video_counts = df['video_id'].value_counts().reset_index()
-    video_counts.columns = ['video_id', 'count']
-    
-    pie = alt.Chart(video_counts).mark_arc(innerRadius=50).encode(
-        theta=alt.Theta(field="count", type="quantitative"),
-        color=alt.Color(field="video_id", type="nominal"),
-        tooltip=['video_id', 'count']
-    ).properties(height=300)
-    
-    st.altair_chart(pie, use_container_width=True)
-
-# --- ROW 3: RAW LOGS (The "Log Explorer") ---
-st.subheader("📝 Live Query Logs (ETL Output)")
-st.dataframe(
-    df[['timestamp', 'processing_time', 'question', 'answer']].sort_values(by='timestamp', ascending=False),
-    use_container_width=True
-)
\ No newline at end of file
+    st.subheader("🧠 LLM Calls & Tokens")
+    usage = llm_usage(hours)
+    if not usage.empty:
+        bars = alt.Chart(usage.melt(id_vars=["purpose"], value_vars=["prompt_tokens", "completion_tokens"], var_name="kind", value_name="tokens"))\
+            .mark_bar().encode(x=alt.X('tokens:Q'), y=alt.Y('purpose:N', sort='-x'), color='kind:N', tooltip=['purpose', 'kind', 'tokens'])\
+            .properties(height=300)
+        st.altair_chart(bars, use_container_width=True)
+        st.dataframe(usage, use_container_width=True)
+
+# --- ROW 4: RAW EVENTS (The "Log Explorer") ---
+st.subheader("📝 Recent Events")
+events = query("SELECT to_timestamp(ts) AS time, stage, duration_ms, status, attrs FROM telemetry_events ORDER BY ts DESC LIMIT 200")
+events["attrs"] = events["attrs"].map(lambda a: json.dumps(a) if a else "")
+st.dataframe(events, use_container_width=True)
@@ -0,0 +1,38 @@
+import os
+import json
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+# --- CONFIG ---
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "200"))    # messages per /api/history page
+SESSIONS_PAGE_SIZE = int(os.getenv("SESSIONS_PAGE_SIZE", "50"))    # sessions per /api/sessions page
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Keyset (cursor) pagination over (created_at, id), newest first. The cursor is the
+# key of the last row served, so a page costs one index range scan at any depth,
+# unlike OFFSET, which re-reads every row it skips.
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+def keyset_page(stmt, created_col, id_col, cursor=None, limit=50):
+    """Rows of `stmt` older than `cursor`, newest first; one extra row tells whether another page exists."""
+    if cursor: stmt = stmt.where(tuple_(created_col, id_col) < tuple_(*decode_cursor(cursor)))
+    return stmt.order_by(created_col.desc(), id_col.desc()).limit(limit + 1)
+
+def split_page(rows, limit):
+    """Returns (rows, next_cursor); next_cursor is None on the last page. Rows need .created_at and .id."""
+    if len(rows) <= limit: return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,190 @@
+import os
+import time
+import uuid
+import base64
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy.future import select
+from sqlalchemy import delete
+
+from database import ResponseCacheEntry
+from shared_state import shared_state
+
+# --- CONFIG ---
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))              # seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_PERSIST = os.getenv("RESPONSE_CACHE_PERSIST", "false").lower() == "true"  # pgvector L2
+RESPONSE_CACHE_SHARED_PER_VIDEO = int(os.getenv("RESPONSE_CACHE_SHARED_PER_VIDEO", "200"))  # LRU cap per video in shared state
+
+def normalize(vec):
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    return arr / norm if norm else arr
+
+class SemanticResponseCache:
+    """
+    Answers keyed on (video_id, query embedding). A lookup hits when the closest
+    cached query for that video is at least `threshold` cosine-similar.
+    In-process LRU + TTL, then the shared backend when one is configured (so an
+    answer computed on one worker is a hit on every other), optionally backed
+    by the response_cache table.
+    """
+    def __init__(self, threshold=RESPONSE_CACHE_THRESHOLD, ttl=RESPONSE_CACHE_TTL,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES, persist=RESPONSE_CACHE_PERSIST,
+                 shared_per_video=RESPONSE_CACHE_SHARED_PER_VIDEO):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist = persist
+        self.shared_per_video = shared_per_video
+        self.lru = OrderedDict()  # (video_id, entry_id) -> (expires_at, vector, payload)
+        self.by_video = {}        # video_id -> set of entry_ids
+        self._ids = itertools.count()
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+        self.shared_hits = 0
+        self.evictions = 0
+
+    # --- IN-PROCESS LAYER ---
+    def _drop(self, key):
+        self.lru.pop(key, None)
+        ids = self.by_video.get(key[0])
+        if ids is not None:
+            ids.discard(key[1])
+            if not ids: del self.by_video[key[0]]
+
+    def _put(self, video_id, vector, payload):
+        entry_id = next(self._ids)
+        self.lru[(video_id, entry_id)] = (time.time() + self.ttl, vector, payload)
+        self.by_video.setdefault(video_id, set()).add(entry_id)
+        while len(self.lru) > self.max_entries:
+            self._drop(next(iter(self.lru)))
+            self.evictions += 1
+
+    def _match_local(self, video_id, vector):
+        now = time.time()
+        keys = []
+        for entry_id in list(self.by_video.get(video_id, ())):
+            key = (video_id, entry_id)
+            if self.lru[key][0] < now: self._drop(key)
+            else: keys.append(key)
+        if not keys: return None, 0.0
+
+        sims = np.stack([self.lru[k][1] for k in keys]) @ vector
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold: return None, float(sims[best])
+        self.lru.move_to_end(keys[best])
+        return self.lru[keys[best]][2], float(sims[best])
+
+    # --- SHARED LAYER ---
+    # Per video: hash rc:<video>:vec (entry id -> packed float32 vector, expiry), hash
+    # rc:<video> (entry id -> payload) and sorted set rc:<video>:lru (entry id -> last use).
+    # A lookup scores the small vectors and fetches only the matched payload; at most
+    # shared_per_video entries are kept, least recently used evicted first.
+    async def _drop_shared(self, video_id, entry_ids):
+        await shared_state.hdel(f"rc:{video_id}:vec", *entry_ids)
+        await shared_state.hdel(f"rc:{video_id}", *entry_ids)
+        await shared_state.zrem(f"rc:{video_id}:lru", *entry_ids)
+
+    async def _match_shared(self, video_id, vector):
+        try:
+            entries = await shared_state.hgetall(f"rc:{video_id}:vec")
+            now = time.time()
+            expired = [f for f, e in entries.items() if e["expires_at"] <= now]
+            if expired: await self._drop_shared(video_id, expired)
+            live = [(f, e["vector"]) for f, e in entries.items() if e["expires_at"] > now]
+            if not live: return None, 0.0
+
+            matrix = np.frombuffer(b"".join(base64.b64decode(v) for _, v in live), dtype=np.float32).reshape(len(live), -1)
+            sims = matrix @ vector
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold: return None, float(sims[best])
+            payload = await shared_state.hget(f"rc:{video_id}", live[best][0])
+            if payload is None: return None, float(sims[best])  # evicted since the vectors were read
+            await shared_state.zadd(f"rc:{video_id}:lru", live[best][0], now, ttl=self.ttl)
+            return payload, float(sims[best])
+        except Exception as e:
+            print(f"⚠️ Shared response cache unavailable: {e}")
+            return None, 0.0
+
+    async def _store_shared(self, video_id, vector, payload):
+        entry_id, now = uuid.uuid4().hex, time.time()
+        packed = base64.b64encode(vector.astype(np.float32).tobytes()).decode()
+        try:
+            # Payload first: a reader that sees the vector can always fetch its payload
+            await shared_state.hset(f"rc:{video_id}", entry_id, payload, ttl=self.ttl)
+            await shared_state.hset(f"rc:{video_id}:vec", entry_id, {"vector": packed, "expires_at": now + self.ttl}, ttl=self.ttl)
+            await shared_state.zadd(f"rc:{video_id}:lru", entry_id, now, ttl=self.ttl)
+            evicted = await shared_state.ztrim(f"rc:{video_id}:lru", self.shared_per_video)
+            if evicted:
+                await self._drop_shared(video_id, evicted)
+                self.evictions += len(evicted)
+        except Exception as e: print(f"⚠️ Shared response cache unavailable: {e}")
+
+    # --- PERSISTENT LAYER ---
+    async def _match_db(self, db, video_id, vector):
+        distance = ResponseCacheEntry.embedding.cosine_distance(vector.tolist())
+        stmt = select(ResponseCacheEntry, distance.label("distance"))\
+               .where(ResponseCacheEntry.video_id == video_id)\
+               .where(ResponseCacheEntry.expires_at > time.time())\
+               .order_by(distance).limit(1)
+        row = (await db.execute(stmt)).first()
+        if not row: return None, 0.0
+        similarity = 1.0 - float(row.distance)
+        if similarity < self.threshold: return None, similarity
+        return row.ResponseCacheEntry.payload, similarity
+
+    # --- PUBLIC API ---
+    async def lookup(self, db, video_id, query_vec):
+        """Returns (payload, similarity); payload is None on a miss."""
+        if not RESPONSE_CACHE_ENABLED: return None, 0.0
+        vector = normalize(query_vec)
+        payload, similarity = self._match_local(video_id, vector)
+        if payload is None and shared_state.shared:
+            payload, similarity = await self._match_shared(video_id, vector)
+            if payload is not None:
+                self.shared_hits += 1
+                self._put(video_id, vector, payload)
+        if payload is None and self.persist and db is not None:
+            payload, similarity = await self._match_db(db, video_id, vector)
+            if payload is not None:
+                self.persistent_hits += 1
+                self._put(video_id, vector, payload)
+        if payload is None: self.misses += 1
+        else: self.hits += 1
+        return payload, similarity
+
+    async def store(self, db, video_id, query_vec, query, final_answer, suggestions, metadata):
+        if not RESPONSE_CACHE_ENABLED or not final_answer: return
+        vector = normalize(query_vec)
+        # Per-turn fields (thoughts, timings of this run) are not part of the reusable answer
+        metadata = {k: v for k, v in metadata.items() if k not in ("thoughts", "ttft_ms", "cache", "tokens", "branches", "router", "policy", "cacheable")}
+        payload = {"final_answer": final_answer, "suggestions": suggestions, "metadata": metadata}
+        self._put(video_id, vector, payload)
+        if shared_state.shared: await self._store_shared(video_id, vector, payload)
+        if self.persist and db is not None:
+            db.add(ResponseCacheEntry(video_id=video_id, query=query, embedding=vector.tolist(),
+                                      payload=payload, expires_at=time.time() + self.ttl))
+            await db.execute(delete(ResponseCacheEntry).where(ResponseCacheEntry.expires_at <= time.time()))
+            await db.commit()
+
+    def invalidate(self, video_id):
+        """Local entries only; the shared hashes expire on their own TTL."""
+        for entry_id in list(self.by_video.get(video_id, ())): self._drop((video_id, entry_id))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.lru), "videos": len(self.by_video),
+            "hits": self.hits, "misses": self.misses, "persistent_hits": self.persistent_hits,
+            "shared_hits": self.shared_hits, "shared": shared_state.shared,
+            "evictions": self.evictions, "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "threshold": self.threshold, "ttl": self.ttl, "max_entries": self.max_entries,
+        }
+
+response_cache = SemanticResponseCache()
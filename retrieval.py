@@ -0,0 +1,246 @@
+import os
+import re
+import asyncio
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import func, true, desc
+
+from database import AsyncSessionLocal, apply_ann_settings, fts_ready, VideoEmbedding, Session, FTS_CONFIG
+from inference import embed_query, rerank
+from telemetry import telemetry
+
+# --- CONFIG ---
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "postgres").lower()  # postgres | memory
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()          # vector | hybrid (vector + full-text, RRF)
+LEXICAL_CANDIDATES = int(os.getenv("LEXICAL_CANDIDATES", "10"))         # full-text matches fed into the fusion
+RRF_K = int(os.getenv("RRF_K", "60"))                                   # reciprocal rank fusion damping constant
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "10"))      # sent to the reranker
+RETRIEVAL_TOP_N = int(os.getenv("RETRIEVAL_TOP_N", "3"))                 # kept in the context
+VECTOR_STORE_MAX_BYTES = int(os.getenv("VECTOR_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+LIBRARY_PER_VIDEO_K = int(os.getenv("LIBRARY_PER_VIDEO_K", "5"))    # best chunks taken from each video
+LIBRARY_CANDIDATES = int(os.getenv("LIBRARY_CANDIDATES", "20"))     # merged across videos, then reranked
+
+# video_id / title are only set for cross-video (library) results
+Candidate = namedtuple("Candidate", ["id", "content", "start_time", "end_time", "video_id", "title"], defaults=(None, None))
+
+def format_timestamp(seconds):
+    minutes = int(seconds // 60)
+    remaining_sec = int(seconds % 60)
+    return f"{minutes:02d}:{remaining_sec:02d}"
+
+async def rerank_and_format(query, candidates):
+    """
+    Returns (context, signals). `signals` summarizes the reranker scores
+    (top score, margin to the runner-up) for the turn policy.
+    """
+    if not candidates: return "", {"candidates": 0}
+    with telemetry.span("retrieval.rerank", candidates=len(candidates)):
+        scores = await rerank(query, [(doc.id, doc.content) for doc in candidates])
+    scored_docs = sorted(zip(candidates, scores), key=lambda x: x[1], reverse=True)
+    top_docs = [doc for doc, score in scored_docs[:RETRIEVAL_TOP_N]]
+    top_score = float(scored_docs[0][1])
+    runner_up = float(scored_docs[1][1]) if len(scored_docs) > 1 else top_score
+    signals = {"candidates": len(candidates), "top_score": round(top_score, 4), "margin": round(top_score - runner_up, 4)}
+    return "\n".join([f"{citation(d)} {d.content}" for d in top_docs]), signals
+
+def time_range(doc):
+    # Rows ingested before end_time existed only carry a start
+    if doc.end_time is None: return format_timestamp(doc.start_time)
+    return f"{format_timestamp(doc.start_time)}-{format_timestamp(doc.end_time)}"
+
+def citation(doc):
+    if doc.video_id is None: return f"[Time: {time_range(doc)}]"
+    return f"[Video: {doc.title or doc.video_id} ({doc.video_id}) | Time: {time_range(doc)}]"
+
+# --- BACKEND 1: POSTGRES (pgvector) ---
+async def postgres_candidates(db: AsyncSession, query_vec, video_id: str, k=RETRIEVAL_CANDIDATES):
+    await apply_ann_settings(db)
+    stmt = select(VideoEmbedding).where(VideoEmbedding.video_id == video_id)\
+           .order_by(VideoEmbedding.embedding.cosine_distance(query_vec)).limit(k)
+    result = await db.execute(stmt)
+    return [Candidate(d.id, d.content, d.start_time, d.end_time) for d in result.scalars().all()]
+
+async def library_candidates(db: AsyncSession, query_vec, user_id: int,
+                             per_video_k=LIBRARY_PER_VIDEO_K, k=LIBRARY_CANDIDATES):
+    """
+    One query over every video in the user's Session history: a LATERAL per-video
+    top-k (each served by the video_id / ANN indexes) merged by distance.
+    """
+    await apply_ann_settings(db)
+    library = select(Session.video_id, func.max(Session.title).label("title"))\
+              .where(Session.user_id == user_id, Session.video_id.is_not(None))\
+              .group_by(Session.video_id).subquery()
+    distance = VideoEmbedding.embedding.cosine_distance(query_vec)
+    per_video = select(VideoEmbedding.id, VideoEmbedding.content, VideoEmbedding.start_time, VideoEmbedding.end_time, distance.label("distance"))\
+                .where(VideoEmbedding.video_id == library.c.video_id)\
+                .order_by(distance).limit(per_video_k).lateral()
+    stmt = select(per_video.c.id, per_video.c.content, per_video.c.start_time, per_video.c.end_time, library.c.video_id, library.c.title)\
+           .select_from(library.join(per_video, true()))\
+           .order_by(per_video.c.distance).limit(k)
+    rows = (await db.execute(stmt)).all()
+    return [Candidate(r.id, r.content, r.start_time, r.end_time, r.video_id, r.title) for r in rows]
+
+# --- LEXICAL (Postgres full-text over content_tsv) ---
+def lexical_query(query):
+    """
+    OR of the query's words for to_tsquery: a chunk that contains only the rare
+    term (a function name, an acronym, a number) still matches, and ts_rank_cd
+    ranks chunks that contain more of the terms higher.
+    """
+    terms = re.findall(r"\w+", query.lower())
+    return " | ".join(dict.fromkeys(terms))
+
+async def lexical_candidates(db: AsyncSession, query: str, video_id: str, k=LEXICAL_CANDIDATES):
+    terms = lexical_query(query)
+    if not terms: return []
+    tsquery = func.to_tsquery(FTS_CONFIG, terms)
+    stmt = select(VideoEmbedding.id, VideoEmbedding.content, VideoEmbedding.start_time, VideoEmbedding.end_time)\
+           .where(VideoEmbedding.video_id == video_id, VideoEmbedding.content_tsv.op("@@")(tsquery))\
+           .order_by(desc(func.ts_rank_cd(VideoEmbedding.content_tsv, tsquery))).limit(k)
+    return [Candidate(r.id, r.content, r.start_time, r.end_time) for r in (await db.execute(stmt)).all()]
+
+def rrf_fuse(ranked_lists, k=RRF_K, limit=RETRIEVAL_CANDIDATES):
+    """Reciprocal rank fusion: score(doc) = sum over lists of 1 / (k + rank)."""
+    scores, docs = {}, {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked, start=1):
+            scores[doc.id] = scores.get(doc.id, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(doc.id, doc)
+    return [docs[i] for i in sorted(scores, key=scores.get, reverse=True)[:limit]]
+
+async def hybrid_candidates(db: AsyncSession, query: str, video_id: str, vector_source):
+    """Vector top-k and full-text top-k fused with RRF; the reranker then orders the union."""
+    vector = await vector_source()
+    lexical = await lexical_candidates(db, query, video_id)
+    return rrf_fuse([vector, lexical]), {"vector": len(vector), "lexical": len(lexical),
+                                         "overlap": len({d.id for d in vector} & {d.id for d in lexical})}
+
+# --- BACKEND 2: IN-MEMORY (NumPy) ---
+class VideoMatrix:
+    def __init__(self, ids, contents, start_times, end_times, matrix):
+        self.ids = ids
+        self.contents = contents
+        self.start_times = start_times
+        self.end_times = end_times
+        self.matrix = matrix  # (n_chunks, dim) float32, rows L2-normalized
+        self.nbytes = matrix.nbytes + ids.nbytes + sum(len(c) for c in contents)
+
+    def top_k(self, query_vec, k):
+        q = np.asarray(query_vec, dtype=np.float32)
+        q /= (np.linalg.norm(q) or 1.0)
+        sims = self.matrix @ q
+        if len(sims) > k:
+            idx = np.argpartition(-sims, k)[:k]
+            idx = idx[np.argsort(-sims[idx])]
+        else:
+            idx = np.argsort(-sims)
+        return [Candidate(int(self.ids[i]), self.contents[i], self.start_times[i], self.end_times[i]) for i in idx]
+
+class NumpyVectorStore:
+    """
+    Loads a video's embeddings into one contiguous float32 matrix the first time
+    it is queried; top-k is then a single mat-vec product + argpartition.
+    Videos are evicted LRU once the total exceeds `max_bytes`.
+    """
+    def __init__(self, max_bytes=VECTOR_STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.videos = OrderedDict()  # video_id -> VideoMatrix
+        self.bytes = 0
+        self._loading = {}           # video_id -> asyncio.Lock
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    async def _load(self, db, video_id):
+        stmt = select(VideoEmbedding.id, VideoEmbedding.content, VideoEmbedding.start_time, VideoEmbedding.end_time, VideoEmbedding.embedding)\
+               .where(VideoEmbedding.video_id == video_id).order_by(VideoEmbedding.id)
+        rows = (await db.execute(stmt)).all()
+        if not rows: return None
+        matrix = np.ascontiguousarray(np.stack([np.asarray(r.embedding, dtype=np.float32) for r in rows]))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return VideoMatrix(np.array([r.id for r in rows], dtype=np.int64), [r.content for r in rows],
+                           [r.start_time for r in rows], [r.end_time for r in rows], matrix)
+
+    async def get(self, db, video_id):
+        entry = self.videos.get(video_id)
+        if entry is not None:
+            self.hits += 1
+            self.videos.move_to_end(video_id)
+            return entry
+        lock = self._loading.setdefault(video_id, asyncio.Lock())
+        async with lock:
+            entry = self.videos.get(video_id)
+            if entry is None:
+                entry = await self._load(db, video_id)
+                # Empty results are not cached: the video may still be ingesting
+                if entry is not None: self._put(video_id, entry)
+        self._loading.pop(video_id, None)
+        return entry
+
+    def _put(self, video_id, entry):
+        self.loads += 1
+        self.videos[video_id] = entry
+        self.bytes += entry.nbytes
+        while self.bytes > self.max_bytes and len(self.videos) > 1:
+            _, evicted = self.videos.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def invalidate(self, video_id):
+        entry = self.videos.pop(video_id, None)
+        if entry is not None: self.bytes -= entry.nbytes
+
+    def clear(self):
+        self.videos.clear()
+        self.bytes = 0
+
+    async def candidates(self, db, query_vec, video_id, k=RETRIEVAL_CANDIDATES):
+        entry = await self.get(db, video_id)
+        return entry.top_k(query_vec, k) if entry else []
+
+    def stats(self):
+        return {"videos": len(self.videos), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "loads": self.loads, "hits": self.hits, "evictions": self.evictions}
+
+vector_store = NumpyVectorStore()
+
+# --- PUBLIC API: same signature for every backend ---
+# Candidates are fetched in a short-lived session that is closed before reranking, so no
+# pooled connection sits idle in a transaction while the cross-encoder runs.
+async def _fetch(query, video_id, vector_source, mode):
+    """Returns (candidates, sources); sources is None outside hybrid mode."""
+    async with AsyncSessionLocal() as db:
+        # content_tsv / its GIN index are built in the background on first deploy
+        if mode == "hybrid" and not await fts_ready(db): mode = "vector"
+        with telemetry.span("retrieval.candidates", mode=mode, backend=RETRIEVAL_BACKEND):
+            if mode == "hybrid": return await hybrid_candidates(db, query, video_id, lambda: vector_source(db))
+            return await vector_source(db), None
+
+async def _retrieve(query, video_id, vector_source, mode):
+    candidates, sources = await _fetch(query, video_id, vector_source, mode)
+    context, signals = await rerank_and_format(query, candidates)
+    if sources is None: return context, signals
+    return context, {**signals, "sources": sources}
+
+async def postgres_retrieval(query: str, video_id: str, query_vec=None, mode=RETRIEVAL_MODE):
+    if query_vec is None: query_vec = await embed_query(query)
+    return await _retrieve(query, video_id, lambda db: postgres_candidates(db, query_vec, video_id), mode)
+
+async def memory_retrieval(query: str, video_id: str, query_vec=None, mode=RETRIEVAL_MODE):
+    if query_vec is None: query_vec = await embed_query(query)
+    return await _retrieve(query, video_id, lambda db: vector_store.candidates(db, query_vec, video_id), mode)
+
+async def library_retrieval(query: str, user_id: int, query_vec=None):
+    """Cross-video mode: searches the union of the user's videos (always served by Postgres)."""
+    if query_vec is None: query_vec = await embed_query(query)
+    async with AsyncSessionLocal() as db:
+        with telemetry.span("retrieval.candidates", mode="library"):
+            candidates = await library_candidates(db, query_vec, user_id)
+    return await rerank_and_format(query, candidates)
+
+RETRIEVAL_BACKENDS = {"postgres": postgres_retrieval, "memory": memory_retrieval}
+retrieve = RETRIEVAL_BACKENDS.get(RETRIEVAL_BACKEND, postgres_retrieval)
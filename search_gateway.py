@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ddgs import DDGS
+import wikipedia
+from youtube_search import YoutubeSearch
+
+from shared_state import shared_state
+
+# --- CONFIG ---
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))    # seconds a result set stays fresh
+SEARCH_EMPTY_TTL = float(os.getenv("SEARCH_EMPTY_TTL", "300"))            # shorter for empty result sets
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+SEARCH_PROVIDER_CONCURRENCY = int(os.getenv("SEARCH_PROVIDER_CONCURRENCY", "4"))  # in-flight calls per provider
+SEARCH_PROVIDER_TIMEOUT = float(os.getenv("SEARCH_PROVIDER_TIMEOUT", "6"))
+SEARCH_THREADS = int(os.getenv("SEARCH_THREADS", "16"))  # worker threads shared by the blocking providers
+SEARCH_FIXTURES = os.getenv("SEARCH_FIXTURES")  # JSON file: {provider: {query: [results]}}
+
+# Blocking providers run here rather than in the default executor, so a hung search
+# library cannot take threads from everything else that uses asyncio.to_thread
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="search")
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+# --- PROVIDERS (blocking; the gateway runs them in worker threads) ---
+# Every provider returns a list of {"title", "href", "body"} dicts.
+def ddgs_search(query, max_results):
+    with DDGS() as ddgs:
+        return [{"title": r.get("title", ""), "href": r.get("href", ""), "body": r.get("body", "")}
+                for r in ddgs.text(query, max_results=max_results) or []]
+
+def wikipedia_search(query, max_results):
+    summary = wikipedia.summary(query, sentences=3)
+    return [{"title": query, "href": f"https://en.wikipedia.org/wiki/{query.strip().replace(' ', '_')}", "body": summary}] if summary else []
+
+def youtube_search(query, max_results):
+    return [{"title": v["title"], "href": f"https://www.youtube.com{v['url_suffix']}", "body": v.get("channel", "")}
+            for v in YoutubeSearch(query, max_results=max_results).to_dict()]
+
+class FixtureProvider:
+    """Serves canned results from a dict keyed on normalized query; unknown queries return []."""
+    def __init__(self, results):
+        self.results = {normalize_query(q): r for q, r in results.items()}
+
+    def __call__(self, query, max_results):
+        return self.results.get(normalize_query(query), [])[:max_results]
+
+class Provider:
+    def __init__(self, fn, concurrency, timeout):
+        self.fn = fn
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "shared_hits": 0, "errors": 0, "timeouts": 0}
+
+class SearchGateway:
+    """
+    Async front for the blocking search libraries, shared by every agent:
+    a TTL + LRU cache keyed on (provider, normalized query, max_results),
+    coalescing of identical in-flight lookups, and a concurrency cap and
+    timeout per provider. Failures are raised to the caller and never cached.
+    With a shared backend configured, a local miss checks the cache the other
+    workers fill before calling the provider.
+    """
+    def __init__(self, ttl=SEARCH_CACHE_TTL, empty_ttl=SEARCH_EMPTY_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self.max_entries = max_entries
+        self.providers = {}
+        self.cache = OrderedDict()  # key -> (expires_at, results)
+        self.inflight = {}          # key -> Task
+
+    def register_provider(self, name, fn, concurrency=SEARCH_PROVIDER_CONCURRENCY, timeout=SEARCH_PROVIDER_TIMEOUT):
+        """`fn(query, max_results)` may be blocking or a coroutine function."""
+        self.providers[name] = Provider(fn, concurrency, timeout)
+        self.invalidate(name)
+
+    def invalidate(self, provider=None):
+        for key in [k for k in self.cache if provider is None or k[0] == provider]: del self.cache[key]
+
+    async def search(self, provider, query, max_results=3):
+        p = self.providers[provider]
+        key = (provider, normalize_query(query), max_results)
+
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] > time.time():
+            p.counters["hits"] += 1
+            self.cache.move_to_end(key)
+            return list(cached[1])
+
+        task = self.inflight.get(key)
+        if task is not None:
+            p.counters["coalesced"] += 1
+        else:
+            p.counters["misses"] += 1
+            task = asyncio.create_task(self._fetch(p, key, query, max_results))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # A caller that gives up (e.g. its branch deadline) must not cancel the shared lookup
+        return list(await asyncio.shield(task))
+
+    async def _fetch(self, p, key, query, max_results):
+        shared_key = f"search:{key[0]}:{key[2]}:{key[1]}"
+        if shared_state.shared:
+            try: results = await shared_state.get(shared_key)
+            except Exception as e:
+                print(f"⚠️ Shared search cache unavailable: {e}")
+                results = None
+            if results is not None:
+                p.counters["shared_hits"] += 1
+                self._put(key, results)
+                return results
+
+        try: results = await self._call(p, query, max_results)
+        except asyncio.TimeoutError:
+            p.counters["timeouts"] += 1
+            raise
+        except Exception:
+            p.counters["errors"] += 1
+            raise
+        results = list(results or [])
+        self._put(key, results)
+        if shared_state.shared:
+            try: await shared_state.set(shared_key, results, ttl=self.ttl if results else self.empty_ttl)
+            except Exception as e: print(f"⚠️ Shared search cache unavailable: {e}")
+        return results
+
+    async def _call(self, p, query, max_results):
+        """One provider call under its concurrency cap and timeout."""
+        await p.semaphore.acquire()
+        if asyncio.iscoroutinefunction(p.fn):
+            try: return await asyncio.wait_for(p.fn(query, max_results), p.timeout)
+            finally: p.semaphore.release()
+        # A thread cannot be stopped on timeout, so its permit is returned when the thread
+        # actually finishes: calls stuck in a hung provider keep counting against the cap
+        loop = asyncio.get_running_loop()
+        try: future = search_pool.submit(p.fn, query, max_results)
+        except BaseException:
+            p.semaphore.release()
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(p.semaphore.release))
+        return await asyncio.wait_for(asyncio.wrap_future(future), p.timeout)
+
+    def _put(self, key, results):
+        self.cache[key] = (time.time() + (self.ttl if results else self.empty_ttl), results)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_entries: self.cache.popitem(last=False)
+
+    def stats(self):
+        providers = {}
+        for name, p in self.providers.items():
+            lookups = p.counters["hits"] + p.counters["misses"] + p.counters["coalesced"]
+            hits = p.counters["hits"] + p.counters["coalesced"] + p.counters["shared_hits"]
+            providers[name] = {**p.counters, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+        return {"entries": len(self.cache), "max_entries": self.max_entries, "inflight": len(self.inflight),
+                "shared": shared_state.shared, "providers": providers}
+
+search_gateway = SearchGateway()
+search_gateway.register_provider("web", ddgs_search)
+search_gateway.register_provider("wikipedia", wikipedia_search)
+search_gateway.register_provider("youtube", youtube_search)
+
+if SEARCH_FIXTURES:
+    with open(SEARCH_FIXTURES) as f:
+        for name, results in json.load(f).items():
+            search_gateway.register_provider(name, FixtureProvider(results))
+    print(f"🧪 Search providers served from fixtures: {SEARCH_FIXTURES}")
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import asyncio
+
+# --- CONFIG ---
+# Unset: state lives in this process (single worker, tests). redis://...: shared by every
+# worker and replica (any Redis-compatible server: Redis, Valkey, KeyDB, fakeredis).
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL") or os.getenv("REDIS_URL")
+SHARED_STATE_PREFIX = os.getenv("SHARED_STATE_PREFIX", "tubemind:")
+SHARED_STATE_SUBSCRIBE_TIMEOUT = float(os.getenv("SHARED_STATE_SUBSCRIBE_TIMEOUT", "5"))  # seconds to wait for SUBSCRIBE to be confirmed
+
+class SubscriptionLost(ConnectionError):
+    """The pub/sub connection dropped: messages may have been missed, resubscribe or re-read state."""
+
+class Subscription:
+    """Messages published on one channel, as decoded JSON values, until close()."""
+    def __init__(self, queue, close):
+        self.queue = queue
+        self._close = close
+
+    async def get(self):
+        """Next message; raises SubscriptionLost (then on every later call) once the connection is gone."""
+        item = await self.queue.get()
+        if isinstance(item, SubscriptionLost):
+            self.queue.put_nowait(item)
+            raise item
+        return item
+
+    async def close(self):
+        await self._close()
+
+class MemoryBackend:
+    """
+    In-process stand-in with the same semantics (TTL keys, hashes, pub/sub). Values
+    go through a JSON round trip like they would over the wire, so code that works
+    here does not break on Redis because it stored something unserializable.
+    """
+    name = "memory"
+
+    def __init__(self, sweep_every=1000):
+        self.data = {}      # key -> (expires_at | None, value)
+        self.channels = {}  # channel -> set of asyncio.Queue
+        self.sweep_every = sweep_every
+        self._writes = 0
+
+    def _sweep(self):
+        self._writes += 1
+        if self._writes % self.sweep_every: return
+        now = time.time()
+        for key in [k for k, (exp, _) in self.data.items() if exp is not None and exp <= now]: del self.data[key]
+
+    def _live(self, key):
+        item = self.data.get(key)
+        if item is not None and item[0] is not None and item[0] <= time.time():
+            del self.data[key]
+            return None
+        return item
+
+    async def get(self, key):
+        item = self._live(key)
+        return json.loads(item[1]) if item else None
+
+    async def set(self, key, value, ttl=None):
+        self._sweep()
+        self.data[key] = (time.time() + ttl if ttl else None, json.dumps(value))
+
+    async def set_if_absent(self, key, value, ttl=None):
+        if self._live(key): return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, *keys):
+        for key in keys: self.data.pop(key, None)
+
+    async def delete_if_value(self, key, value):
+        item = self._live(key)
+        if not item or item[1] != json.dumps(value): return False
+        del self.data[key]
+        return True
+
+    async def renew_if_value(self, key, value, ttl):
+        item = self._live(key)
+        if item and item[1] != json.dumps(value): return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def hset(self, key, field, value, ttl=None):
+        self._sweep()
+        item = self._live(key)
+        fields = item[1] if item else {}
+        fields[field] = json.dumps(value)
+        self.data[key] = (time.time() + ttl if ttl else (item[0] if item else None), fields)
+
+    async def hget(self, key, field):
+        item = self._live(key)
+        raw = item[1].get(field) if item else None
+        return json.loads(raw) if raw is not None else None
+
+    async def hgetall(self, key):
+        item = self._live(key)
+        return {f: json.loads(v) for f, v in item[1].items()} if item else {}
+
+    async def hdel(self, key, *fields):
+        item = self._live(key)
+        if item:
+            for field in fields: item[1].pop(field, None)
+
+    async def zadd(self, key, member, score, ttl=None):
+        self._sweep()
+        item = self._live(key)
+        members = item[1] if item else {}
+        members[member] = score
+        self.data[key] = (time.time() + ttl if ttl else (item[0] if item else None), members)
+
+    async def ztrim(self, key, keep):
+        item = self._live(key)
+        if not item or len(item[1]) <= keep: return []
+        evicted = sorted(item[1], key=item[1].get)[:len(item[1]) - keep]
+        for member in evicted: del item[1][member]
+        return evicted
+
+    async def zrem(self, key, *members):
+        item = self._live(key)
+        if item:
+            for member in members: item[1].pop(member, None)
+
+    async def publish(self, channel, message):
+        raw = json.dumps(message)
+        for q in list(self.channels.get(channel, ())): q.put_nowait(json.loads(raw))
+
+    async def subscribe(self, channel):
+        q = asyncio.Queue()
+        self.channels.setdefault(channel, set()).add(q)
+        async def close(): self.channels.get(channel, set()).discard(q)
+        return Subscription(q, close)
+
+    async def close(self): pass
+
+# Compare-and-* run as scripts so the read and the write are one atomic step on the server
+DELETE_IF_VALUE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+RENEW_IF_VALUE = """
+local current = redis.call('get', KEYS[1])
+if current and current ~= ARGV[1] then return 0 end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+ZTRIM = """
+local excess = redis.call('zcard', KEYS[1]) - tonumber(ARGV[1])
+if excess <= 0 then return {} end
+local evicted = redis.call('zrange', KEYS[1], 0, excess - 1)
+redis.call('zremrangebyrank', KEYS[1], 0, excess - 1)
+return evicted
+"""
+
+class RedisBackend:
+    """redis.asyncio client; values are stored as JSON."""
+    name = "redis"
+
+    def __init__(self, url):
+        import redis.asyncio as redis  # optional dependency, only needed when SHARED_STATE_URL is set
+        self.client = redis.from_url(url, decode_responses=True)
+        self._delete_if_value = self.client.register_script(DELETE_IF_VALUE)
+        self._renew_if_value = self.client.register_script(RENEW_IF_VALUE)
+        self._ztrim = self.client.register_script(ZTRIM)
+
+    async def get(self, key):
+        raw = await self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl=None):
+        await self.client.set(key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    async def set_if_absent(self, key, value, ttl=None):
+        return bool(await self.client.set(key, json.dumps(value), ex=int(ttl) if ttl else None, nx=True))
+
+    async def delete(self, *keys):
+        if keys: await self.client.delete(*keys)
+
+    async def delete_if_value(self, key, value):
+        return bool(await self._delete_if_value(keys=[key], args=[json.dumps(value)]))
+
+    async def renew_if_value(self, key, value, ttl):
+        return bool(await self._renew_if_value(keys=[key], args=[json.dumps(value), int(ttl)]))
+
+    async def hset(self, key, field, value, ttl=None):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, field, json.dumps(value))
+            if ttl: pipe.expire(key, int(ttl))
+            await pipe.execute()
+
+    async def hget(self, key, field):
+        raw = await self.client.hget(key, field)
+        return json.loads(raw) if raw is not None else None
+
+    async def hgetall(self, key):
+        return {f: json.loads(v) for f, v in (await self.client.hgetall(key)).items()}
+
+    async def hdel(self, key, *fields):
+        if fields: await self.client.hdel(key, *fields)
+
+    async def zadd(self, key, member, score, ttl=None):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(key, {member: score})
+            if ttl: pipe.expire(key, int(ttl))
+            await pipe.execute()
+
+    async def ztrim(self, key, keep):
+        return list(await self._ztrim(keys=[key], args=[keep]))
+
+    async def zrem(self, key, *members):
+        if members: await self.client.zrem(key, *members)
+
+    async def publish(self, channel, message):
+        await self.client.publish(channel, json.dumps(message))
+
+    async def subscribe(self, channel):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+        # Wait for the server's confirmation so nothing published after this returns is missed
+        deadline = time.monotonic() + SHARED_STATE_SUBSCRIBE_TIMEOUT
+        while (await pubsub.get_message(timeout=1.0) or {}).get("type") != "subscribe":
+            if time.monotonic() > deadline:
+                await pubsub.aclose()
+                raise TimeoutError(f"SUBSCRIBE {channel} not confirmed within {SHARED_STATE_SUBSCRIBE_TIMEOUT}s")
+        q = asyncio.Queue()
+
+        async def pump():
+            # A dropped connection is handed to the consumer instead of leaving it waiting forever
+            try:
+                async for msg in pubsub.listen():
+                    if msg["type"] == "message": q.put_nowait(json.loads(msg["data"]))
+                q.put_nowait(SubscriptionLost(f"{channel}: subscription closed"))
+            except Exception as e:
+                q.put_nowait(SubscriptionLost(f"{channel}: {e}"))
+        task = asyncio.create_task(pump())
+
+        async def close():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            try: await pubsub.unsubscribe(channel)
+            except Exception: pass  # the connection may already be gone
+            await pubsub.aclose()
+        return Subscription(q, close)
+
+    async def close(self):
+        await self.client.aclose()
+
+class SharedState:
+    """
+    Namespaced front for the configured backend. Everything that must agree across
+    uvicorn workers / replicas goes through here: the response and search caches,
+    ingestion job status and dedupe, and job progress + invalidation pub/sub.
+    """
+    def __init__(self, url=SHARED_STATE_URL, prefix=SHARED_STATE_PREFIX):
+        self.backend = RedisBackend(url) if url else MemoryBackend()
+        self.prefix = prefix
+
+    @property
+    def shared(self):
+        """True when other processes see the same state."""
+        return self.backend.name != "memory"
+
+    def _k(self, key):
+        return f"{self.prefix}{key}"
+
+    async def get(self, key): return await self.backend.get(self._k(key))
+    async def set(self, key, value, ttl=None): await self.backend.set(self._k(key), value, ttl)
+    async def set_if_absent(self, key, value, ttl=None): return await self.backend.set_if_absent(self._k(key), value, ttl)
+    async def delete(self, *keys): await self.backend.delete(*[self._k(k) for k in keys])
+    async def delete_if_value(self, key, value):
+        """Deletes `key` only while it still holds `value` (releasing a claim we own)."""
+        return await self.backend.delete_if_value(self._k(key), value)
+    async def renew_if_value(self, key, value, ttl):
+        """Sets `key` to `value` with a fresh TTL unless someone else's value is there (renewing our claim)."""
+        return await self.backend.renew_if_value(self._k(key), value, ttl)
+    async def hset(self, key, field, value, ttl=None): await self.backend.hset(self._k(key), field, value, ttl)
+    async def hget(self, key, field): return await self.backend.hget(self._k(key), field)
+    async def hgetall(self, key): return await self.backend.hgetall(self._k(key))
+    async def hdel(self, key, *fields): await self.backend.hdel(self._k(key), *fields)
+    async def zadd(self, key, member, score, ttl=None): await self.backend.zadd(self._k(key), member, score, ttl)
+    async def ztrim(self, key, keep):
+        """Keeps the `keep` highest-scored members of a sorted set; returns the ones removed."""
+        return await self.backend.ztrim(self._k(key), keep)
+    async def zrem(self, key, *members): await self.backend.zrem(self._k(key), *members)
+    async def publish(self, channel, message): await self.backend.publish(self._k(channel), message)
+    async def subscribe(self, channel): return await self.backend.subscribe(self._k(channel))
+    async def close(self): await self.backend.close()
+
+shared_state = SharedState()
@@ -0,0 +1,131 @@
+import os
+import time
+import asyncio
+import inspect
+import functools
+from collections import deque
+
+from sqlalchemy import insert, delete
+from prometheus_client import Histogram, Counter
+
+from database import AsyncSessionLocal, TelemetryEvent
+
+# --- CONFIG ---
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "on").lower() == "on"
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "2"))   # seconds between batched INSERTs
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "500"))           # flush early once this many are buffered
+TELEMETRY_BUFFER_MAX = int(os.getenv("TELEMETRY_BUFFER_MAX", "20000"))         # oldest events dropped beyond this
+TELEMETRY_RETENTION_DAYS = float(os.getenv("TELEMETRY_RETENTION_DAYS", "14"))
+
+# --- PROMETHEUS (exposed on /metrics next to the HTTP metrics) ---
+STAGE_SECONDS = Histogram("tubemind_stage_seconds", "Duration of pipeline stages", ["stage", "status"],
+                          buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+EVENTS = Counter("tubemind_events_total", "Discrete pipeline events (cache lookups, router decisions)", ["kind", "value"])
+TOKENS = Counter("tubemind_llm_tokens_total", "LLM tokens by call purpose", ["purpose", "kind"])
+
+class TelemetryWriter:
+    """
+    Hot paths call record() / span() / count(): an in-memory append plus a Prometheus
+    update, never a database round trip. A background task writes the buffer to
+    telemetry_events in one bulk INSERT per interval. If the database falls behind,
+    the oldest buffered events are dropped (and counted) rather than growing memory.
+    """
+    def __init__(self, flush_interval=TELEMETRY_FLUSH_INTERVAL, batch_size=TELEMETRY_BATCH_SIZE,
+                 buffer_max=TELEMETRY_BUFFER_MAX, enabled=TELEMETRY_ENABLED):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.enabled = enabled
+        self.buffer = deque(maxlen=buffer_max)
+        self.wakeup = asyncio.Event()
+        self._task = None
+        self._last_prune = 0.0
+        self.counters = {"recorded": 0, "written": 0, "dropped": 0, "flush_errors": 0}
+
+    def record(self, stage, duration_ms, status="ok", **attrs):
+        STAGE_SECONDS.labels(stage, status).observe(duration_ms / 1000)
+        if not self.enabled: return
+        if len(self.buffer) == self.buffer.maxlen: self.counters["dropped"] += 1
+        self.buffer.append({"ts": time.time(), "stage": stage, "duration_ms": round(duration_ms, 2), "status": status,
+                            "attrs": {k: v for k, v in attrs.items() if v is not None} or None})
+        self.counters["recorded"] += 1
+        if len(self.buffer) >= self.batch_size: self.wakeup.set()
+
+    def span(self, stage, **attrs):
+        """`with telemetry.span("retrieval.rerank"):` records the block's duration (status=error if it raises)."""
+        return Span(self, stage, attrs)
+
+    def count(self, kind, value):
+        EVENTS.labels(kind, str(value)).inc()
+
+    def tokens(self, purpose, prompt_tokens, completion_tokens):
+        if prompt_tokens: TOKENS.labels(purpose, "prompt").inc(prompt_tokens)
+        if completion_tokens: TOKENS.labels(purpose, "completion").inc(completion_tokens)
+
+    async def start(self):
+        if self.enabled and self._task is None: self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None: return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try: await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError: pass
+            self.wakeup.clear()
+            await self.flush()
+            if time.time() - self._last_prune > 3600: await self.prune()
+
+    async def flush(self):
+        while self.buffer:
+            batch = [self.buffer.popleft() for _ in range(min(len(self.buffer), self.batch_size))]
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(TelemetryEvent), batch)
+                    await db.commit()
+                self.counters["written"] += len(batch)
+            except Exception as e:
+                self.counters["flush_errors"] += 1
+                self.counters["dropped"] += len(batch)
+                print(f"⚠️ Telemetry flush failed ({len(batch)} events dropped): {e}")
+                return
+
+    async def prune(self):
+        self._last_prune = time.time()
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(TelemetryEvent).where(TelemetryEvent.ts < time.time() - TELEMETRY_RETENTION_DAYS * 86400))
+                await db.commit()
+        except Exception as e:
+            print(f"⚠️ Telemetry prune failed: {e}")
+
+    def stats(self):
+        return {**self.counters, "buffered": len(self.buffer), "enabled": self.enabled}
+
+class Span:
+    def __init__(self, writer, stage, attrs):
+        self.writer, self.stage, self.attrs = writer, stage, attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.attrs  # callers may add attributes before the block ends
+
+    def __exit__(self, exc_type, exc, tb):
+        status = "ok" if exc_type is None else ("cancelled" if exc_type is asyncio.CancelledError else "error")
+        self.writer.record(self.stage, (time.perf_counter() - self.start) * 1000, status, **self.attrs)
+        return False
+
+def instrument_node(name, fn):
+    """Wraps a LangGraph node so each run records a node.<name> span; `config` is passed through if the node takes it."""
+    takes_config = "config" in inspect.signature(fn).parameters
+
+    @functools.wraps(fn)
+    async def node(state, config=None):
+        with telemetry.span(f"node.{name}"):
+            return await (fn(state, config) if takes_config else fn(state))
+    return node
+
+telemetry = TelemetryWriter()
@@ -0,0 +1,91 @@
+import os
+import re
+import math
+
+# --- CONFIG ---
+JUDGE_POLICY = os.getenv("JUDGE_POLICY", "adaptive").lower()              # always | adaptive | never
+SUGGESTION_POLICY = os.getenv("SUGGESTION_POLICY", "adaptive").lower()    # always | adaptive | inline | never
+# ms-marco cross-encoder logits: > ~3 is a clearly relevant chunk
+JUDGE_SKIP_MIN_TOP_SCORE = float(os.getenv("JUDGE_SKIP_MIN_TOP_SCORE", "3.0"))
+JUDGE_SKIP_MIN_MARGIN = float(os.getenv("JUDGE_SKIP_MIN_MARGIN", "1.0"))
+SUGGESTION_MIN_ANSWER_CHARS = int(os.getenv("SUGGESTION_MIN_ANSWER_CHARS", "200"))
+
+TIMESTAMP_RE = re.compile(r"\b\d{1,2}:\d{2}\b")
+NOT_IN_VIDEO_RE = re.compile(r"not (mentioned|covered|discussed|in the video)", re.IGNORECASE)
+FOLLOWUP_MARKER = "FOLLOW-UPS:"
+INLINE_SUGGESTION_INSTRUCTION = (
+    f"3. After the answer, add one final line starting with '{FOLLOWUP_MARKER}' followed by "
+    "3 short follow-up questions separated by ' | '."
+)
+
+# --- JUDGE ---
+def decide_judge(signals, answer):
+    """
+    Skips the 70B judge when the turn is clearly grounded: a strongly relevant top
+    chunk that stands out from the runner-up, and an answer that cites timestamps.
+    """
+    if JUDGE_POLICY in ("always", "never"): return {"run": JUDGE_POLICY == "always", "reason": f"policy={JUDGE_POLICY}"}
+    if not signals or not signals.get("candidates"): return {"run": False, "reason": "no retrieval context"}
+    if NOT_IN_VIDEO_RE.search(answer): return {"run": False, "reason": "answer declines (not in video)"}
+    strong = signals["top_score"] >= JUDGE_SKIP_MIN_TOP_SCORE and signals["margin"] >= JUDGE_SKIP_MIN_MARGIN
+    if strong and TIMESTAMP_RE.search(answer): return {"run": False, "reason": "strong retrieval + cited answer"}
+    return {"run": True, "reason": "weak or ambiguous retrieval" if not strong else "answer has no citations"}
+
+def heuristic_score(signals, answer):
+    """0-100 stand-in for the judge score, from reranker relevance and answer shape."""
+    if not signals or not signals.get("candidates"): return 30
+    relevance = 1 / (1 + math.exp(-signals["top_score"]))
+    score = 40 + 50 * relevance
+    if TIMESTAMP_RE.search(answer): score += 10
+    if NOT_IN_VIDEO_RE.search(answer): score -= 30
+    return int(max(0, min(100, score)))
+
+# --- SUGGESTIONS ---
+def suggestion_mode(route):
+    """Decided before the answer is written: 'inline' folds the follow-ups into the draft call."""
+    if SUGGESTION_POLICY == "inline" and route == "RAG": return "inline"
+    return SUGGESTION_POLICY if SUGGESTION_POLICY != "inline" else "adaptive"
+
+def decide_suggestions(mode, route, answer, inline_suggestions=None):
+    if mode == "inline" and inline_suggestions: return {"run": False, "mode": "inline", "reason": "folded into draft"}
+    if mode in ("always", "never"): return {"run": mode == "always", "mode": mode, "reason": f"policy={mode}"}
+    if route == "CHAT": return {"run": False, "mode": "adaptive", "reason": "small talk"}
+    if len(answer) < SUGGESTION_MIN_ANSWER_CHARS: return {"run": False, "mode": "adaptive", "reason": "short answer"}
+    if NOT_IN_VIDEO_RE.search(answer): return {"run": False, "mode": "adaptive", "reason": "answer declines (not in video)"}
+    return {"run": True, "mode": mode, "reason": "substantive answer"}
+
+class InlineFollowups:
+    """
+    Wraps a token sink so the trailing 'FOLLOW-UPS:' line of an inline-suggestion
+    draft is held back from the stream and parsed into suggestions instead.
+    """
+    def __init__(self, token_sink):
+        self.token_sink = token_sink
+        self.pending = ""
+        self.hidden = False
+
+    async def __call__(self, delta):
+        if self.hidden or not self.token_sink: return
+        self.pending += delta
+        idx = self.pending.find(FOLLOWUP_MARKER)
+        if idx >= 0:
+            self.hidden = True
+            if self.pending[:idx]: await self.token_sink(self.pending[:idx])
+            self.pending = ""
+            return
+        # Keep back only a tail that could still turn into the marker
+        keep = next((n for n in range(min(len(FOLLOWUP_MARKER) - 1, len(self.pending)), 0, -1)
+                     if FOLLOWUP_MARKER.startswith(self.pending[-n:])), 0)
+        emit, self.pending = self.pending[:len(self.pending) - keep], self.pending[len(self.pending) - keep:]
+        if emit: await self.token_sink(emit)
+
+    async def flush(self):
+        if self.pending and not self.hidden and self.token_sink: await self.token_sink(self.pending)
+        self.pending = ""
+
+def split_inline_followups(text):
+    """Returns (answer without the follow-up line, [questions])."""
+    idx = text.rfind(FOLLOWUP_MARKER)
+    if idx < 0: return text, []
+    questions = [q.strip(" -*\t") for q in text[idx + len(FOLLOWUP_MARKER):].strip().split("|")]
+    return text[:idx].rstrip(), [q for q in questions if q][:3]
@@ -27,9 +27,11 @@ export default function App() {
   
   // --- APP STATE ---
   const [sessions, setSessions] = useState([])
+  const [sessionsCursor, setSessionsCursor] = useState(null) // X-Next-Cursor: older sessions exist
   const [currentSessionId, setCurrentSessionId] = useState(null)
   
   const [messages, setMessages] = useState([])
+  const [historyCursor, setHistoryCursor] = useState(null)   // X-Next-Cursor: earlier messages exist
   const [input, setInput] = useState('')
   const [url, setUrl] = useState('')
   const [videoId, setVideoId] = useState(null)
@@ -38,6 +40,7 @@ export default function App() {
   // Thoughts Streaming State
   const [streamingThoughts, setStreamingThoughts] = useState([])
   const [isThinking, setIsThinking] = useState(false)
+  const [streamingAnswer, setStreamingAnswer] = useState('')
 
   // Resources
   const [recs, setRecs] = useState({ topic: '', videos: [], blogs: [] })
@@ -49,10 +52,12 @@ export default function App() {
 
   const ws = useRef(null)
   const messagesEndRef = useRef(null)
+  const keepScrollRef = useRef(false) // set when older messages are prepended
 
   useEffect(() => {
+    if (keepScrollRef.current) { keepScrollRef.current = false; return }
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" })
-  }, [messages, streamingThoughts])
+  }, [messages, streamingThoughts, streamingAnswer])
 
   // 1. AUTH ACTIONS
   const handleAuth = async () => {
@@ -76,10 +81,22 @@ export default function App() {
   }
 
   // 2. SESSION ACTIONS
-  const loadSessions = async (username) => {
-    const res = await fetch(`${API_BASE}/api/sessions/${username}`)
+  // Both lists are paged newest-first; the server returns the next page's cursor in X-Next-Cursor
+  const loadSessions = async (username, cursor = null) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''
+    const res = await fetch(`${API_BASE}/api/sessions/${username}${query}`)
     const data = await res.json()
-    setSessions(data)
+    setSessions(prev => cursor ? [...prev, ...data] : data)
+    setSessionsCursor(res.headers.get('X-Next-Cursor'))
+  }
+
+  const loadHistory = async (sessionId, cursor = null) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''
+    const res = await fetch(`${API_BASE}/api/history/${sessionId}${query}`)
+    const data = await res.json()
+    if (cursor) keepScrollRef.current = true
+    setMessages(prev => cursor ? [...data, ...prev] : data)
+    setHistoryCursor(res.headers.get('X-Next-Cursor'))
   }
 
   const createSession = async () => {
@@ -106,6 +123,7 @@ export default function App() {
     setCurrentSessionId(sData.session_id)
     setSessions(prev => [{ id: sData.session_id, title: pData.recommendations.topic, video_id: id }, ...prev])
     setMessages([{ role: 'ai', text: `Session Ready! Topic: ${pData.recommendations.topic}` }])
+    setHistoryCursor(null)
     
     // On mobile, auto-close tools and show chat after creating
     setIsRightOpen(false) 
@@ -119,9 +137,7 @@ export default function App() {
     const videoUrl = `https://www.youtube.com/watch?v=${session.video_id}`
     setUrl(videoUrl)
     
-    const historyRes = await fetch(`${API_BASE}/api/history/${session.id}`)
-    const historyData = await historyRes.json()
-    setMessages(historyData)
+    await loadHistory(session.id)
     
     try {
       const res = await fetch('${API_BASE}/api/process', {
@@ -148,9 +164,12 @@ export default function App() {
       if (response.type === 'thought') {
         setIsThinking(true)
         setStreamingThoughts(prev => [...prev, response.data])
+      } else if (response.type === 'token') {
+        setStreamingAnswer(prev => prev + response.data)
       } else if (response.type === 'result') {
         setIsThinking(false)
         setStreamingThoughts([]) 
+        setStreamingAnswer('')
         setMessages(prev => [...prev, { 
           role: 'ai', 
           text: response.data, 
@@ -258,9 +277,14 @@ export default function App() {
               {sess.title || "Untitled Chat"}
             </div>
           ))}
+          {sessionsCursor && (
+            <button onClick={() => loadSessions(user.username, sessionsCursor)} className="w-full p-2 text-xs text-slate-500 hover:text-cyan-400">
+              Load older chats
+            </button>
+          )}
         </div>
         <div className="p-4 border-t border-slate-800">
-           <button onClick={() => {setUser(null); setMessages([]); setSessions([]);}} className="text-red-400 text-sm hover:underline">Logout</button>
+           <button onClick={() => {setUser(null); setMessages([]); setSessions([]); setSessionsCursor(null); setHistoryCursor(null);}} className="text-red-400 text-sm hover:underline">Logout</button>
         </div>
       </div>
       
@@ -273,6 +297,13 @@ export default function App() {
 
         <div className="flex-1 overflow-y-auto p-4 space-y-6 scroll-smooth">
           {messages.length === 0 && <div className="text-center text-slate-600 mt-20 px-4">Tap the Video Icon to load a YouTube URL!</div>}
+          {historyCursor && (
+            <div className="text-center">
+              <button onClick={() => loadHistory(currentSessionId, historyCursor)} className="text-xs text-slate-500 hover:text-cyan-400">
+                Load earlier messages
+              </button>
+            </div>
+          )}
           
           {messages.map((msg, idx) => (
             <div key={idx} className={`flex flex-col ${msg.role === 'user' ? 'items-end' : 'items-start'}`}>
@@ -310,6 +341,9 @@ export default function App() {
                       <div key={i} className="text-xs text-slate-500 font-mono truncate">{t}</div>
                    ))}
                 </div>
+                {streamingAnswer && (
+                   <div className="mt-2 max-w-[85%] bg-slate-800 p-3 rounded-lg text-sm text-slate-200 whitespace-pre-wrap">{streamingAnswer}</div>
+                )}
              </div>
           )}
           <div ref={messagesEndRef} />